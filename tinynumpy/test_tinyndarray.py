@@ -45,6 +45,31 @@ class TestNDArray(unittest.TestCase):
     def test_len(self):
         self.assertEqual(len(self.t0), len(self.n0))
 
+    def test_item(self):
+        for t, n in [(self.t0, self.n0), (self.t0.T, self.n0.T),
+                     (self.t0[::-2, 1:], self.n0[::-2, 1:])]:
+            self.assertEqual(t[1, 2], n[1, 2])
+            self.assertEqual(t[-1, -2], n[-1, -2])
+            self.assertEqual(t.item(1, 2), n.item(1, 2))
+            self.assertEqual(t.item(5), n.item(5))
+            self.assertEqual(t.item(-1), n.item(-1))
+        with self.assertRaises(IndexError):
+            self.t0[4, 0]
+        with self.assertRaises(IndexError):
+            self.t0[0, -5]
+        with self.assertRaises(IndexError):
+            self.t0.item(16)
+        with self.assertRaises(ValueError):
+            self.t0.item()
+        t = self.t0.copy()
+        t[1, -1] = 0.5
+        t.itemset(2, 0.25)
+        t.itemset(3, 3, 0.125)
+        self.assertEqual(t.tolist()[1][3], 0.5)
+        self.assertEqual(t.tolist()[0][2], 0.25)
+        self.assertEqual(t.item(15), 0.125)
+        self.assertEqual(tinynumpy.array([7]).item(), 7)
+
     def test_newaxis(self):
         self.assertEqual(self.t0[tinynumpy.newaxis,2:].shape, (1,2,4))
         self.assertEqual(self.n0[numpy.newaxis,2:].shape, (1,2,4))
@@ -163,6 +188,58 @@ class TestFunctions(unittest.TestCase):
         self.assertEqual(tinynumpy.array([1,1,1,1]).std(), 0)
         self.assertEqual(int(self.t1.std()*1000000), int(self.n1.std()*1000000))
 
+    def test_reduce_axis(self):
+        t = tinynumpy.array([[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(t.sum(axis=0).tolist(), [5, 7, 9])
+        self.assertEqual(t.sum(axis=1).tolist(), [6, 15])
+        self.assertEqual(t.sum(axis=(0, 1)), 21)
+        self.assertEqual(t.sum(axis=-1, keepdims=True).shape, (2, 1))
+        self.assertEqual(t.sum(keepdims=True).shape, (1, 1))
+        self.assertEqual(t.max(axis=0).tolist(), [4, 5, 6])
+        self.assertEqual(t.min(axis=1).tolist(), [1, 4])
+        self.assertEqual(t.prod(axis=0).tolist(), [4, 10, 18])
+        self.assertEqual(t.ptp(axis=1).tolist(), [2, 2])
+        self.assertEqual(t.mean(axis=0).tolist(), [2.5, 3.5, 4.5])
+        self.assertEqual(t.var(axis=0).tolist(), [2.25, 2.25, 2.25])
+        self.assertEqual(t.std(axis=1, ddof=1).tolist(), [1.0, 1.0])
+        self.assertEqual(t.argmax(axis=0).tolist(), [1, 1, 1])
+        self.assertEqual(t.argmin(axis=1).tolist(), [0, 0])
+        self.assertEqual((t > 1).all(axis=0).tolist(), [False, True, True])
+        self.assertEqual((t > 5).any(axis=1).tolist(), [False, True])
+        self.assertEqual(t.cumsum(axis=1).tolist(), [[1, 3, 6], [4, 9, 15]])
+        self.assertEqual(t.cumprod(axis=0).tolist(), [[1, 2, 3], [4, 10, 18]])
+        with self.assertRaises(ValueError):
+            t.sum(axis=2)
+        with self.assertRaises(ValueError):
+            t.sum(axis=(0, 0))
+
+    def test_reduce_axis_strided(self):
+        t = tinynumpy.array([[1, 2, 3], [4, 5, 6]])[::-1, ::2]
+        self.assertEqual(t.sum(axis=0).tolist(), [5, 9])
+        self.assertEqual(t.max(axis=1).tolist(), [6, 3])
+        self.assertEqual(t.argmax(), 1)
+
+    def test_reduce_out_where(self):
+        t = tinynumpy.array([[1., 2., 3.], [4., 5., 6.]])
+        m = tinynumpy.array([[True, False, True], [False, False, True]])
+        out = tinynumpy.zeros((3,))
+        self.assertIs(t.sum(axis=0, out=out), out)
+        self.assertEqual(out.tolist(), [5., 7., 9.])
+        self.assertIs(t.max(axis=0, out=out), out)
+        self.assertEqual(out.tolist(), [4., 5., 6.])
+        self.assertEqual(t.sum(where=m), 10.)
+        self.assertEqual(t.sum(axis=1, where=m).tolist(), [4., 6.])
+        self.assertEqual(t.min(axis=1, where=m).tolist(), [1., 6.])
+        mean = t.mean(axis=0, where=m).tolist()
+        self.assertEqual(mean[::2], [1., 4.5])
+        self.assertTrue(mean[1] != mean[1])
+        self.assertEqual(tinynumpy.mean(t, axis=1).tolist(), [2., 5.])
+        self.assertEqual(tinynumpy.amax(t, axis=1).tolist(), [3., 6.])
+        with self.assertRaises(ValueError):
+            t.sum(axis=0, out=tinynumpy.zeros((2,)))
+        with self.assertRaises(TypeError):
+            t.mean(axis=1, out=tinynumpy.zeros((2,), 'int64'))
+
 if __name__ == '__main__':
     unittest.main()
     #unittest.main(defaultTest='TestNDArray.test_newaxis')
\ No newline at end of file
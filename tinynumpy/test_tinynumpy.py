@@ -7,6 +7,7 @@
 
 import os
 import sys
+import math
 import ctypes
 
 import pytest
@@ -199,7 +200,6 @@ def test_from_ctypes():
 
 
 def test_from_bytes():
-    skip('Need ndarray.frombytes or something')
     # Create bytes
     buffer = b'x' * 100
     
@@ -230,6 +230,168 @@ def test_from_bytes():
         assert pa == pb
 
 
+def test_storage_backends():
+    """test that arrays work the same with each storage backend"""
+
+    previous = tnp.get_storage_backend()
+    try:
+        for backend in ['ctypes', 'array', 'memoryview']:
+            tnp.set_storage_backend(backend)
+            for dtype in ['bool', 'uint8', 'int16', 'int64', 'float32',
+                          'float64']:
+                b = tnp.array([[1, 0, 3], [4, 5, 0]], dtype)
+                assert b.dtype == dtype
+                assert b[1, 1] == (True if dtype == 'bool' else 5)
+                # Views share the storage of their base
+                v = b[:, ::2]
+                assert v.data is b.data
+                v[0, 1] = 0
+                assert b[0, 2] == 0
+                assert b.tolist()[0] == [1, 0, 0]
+                # Pointer export
+                p0 = b.__array_interface__['data'][0]
+                p1 = b[1].__array_interface__['data'][0]
+                assert p1 - p0 == 3 * b.itemsize
+            # Bulk operations
+            b = tnp.array([[1.0, 2.0], [3.0, 4.0]])
+            assert ((b.T * 2).tolist() == [[2.0, 6.0], [4.0, 8.0]])
+            assert b.sum(axis=0).tolist() == [4.0, 6.0]
+            assert b.ravel().view('int32').shape == (8, )
+    finally:
+        tnp.set_storage_backend(previous)
+
+    with raises(ValueError):
+        tnp.set_storage_backend('foo')
+
+
+def test_save_and_load(tmpdir):
+    """test .npy files, with and without memory mapping"""
+
+    filename = str(tmpdir.join('a.npy'))
+    a = tnp.array([[1, 2, 3], [4, 5, 6]], 'int16')
+
+    # Save a non-contiguous array
+    tnp.save(filename, a.T)
+    with open(filename, 'rb') as f:
+        raw = f.read()
+    assert raw.startswith(b'\x93NUMPY\x01\x00')
+    assert len(raw) == 128 + 6 * 2  # header is 64-byte aligned
+
+    b = tnp.load(filename)
+    assert b.shape == (3, 2)
+    assert b.dtype == 'int16'
+    assert b.tolist() == [[1, 4], [2, 5], [3, 6]]
+
+    # Read-only mapping
+    b = tnp.load(filename, mmap_mode='r')
+    assert b.tolist() == [[1, 4], [2, 5], [3, 6]]
+    assert not b.flags['WRITEABLE'] and not b[1:].flags['WRITEABLE']
+    with raises(TypeError):
+        b[0, 0] = 0
+    # It has no address, but can still be exported
+    interface = b[1:].__array_interface__
+    assert interface['offset'] == 2 * 2
+    if np is not tnp:
+        c = np.asarray(b)
+        assert c.tolist() == [[1, 4], [2, 5], [3, 6]]
+        assert not c.flags.writeable
+        assert np.asarray(b[::-1, 1]).tolist() == [6, 5, 4]
+
+    # Copy-on-write mapping does not change the file
+    b = tnp.load(filename, mmap_mode='c')
+    assert b.flags['WRITEABLE']
+    b[0, 0] = 10
+    assert b[0, 0] == 10
+    del b
+    assert tnp.load(filename)[0, 0] == 1
+
+    # Read-write mapping does
+    b = tnp.load(filename, mmap_mode='r+')
+    b[0, 0] = 10
+    del b
+    assert tnp.load(filename)[0, 0] == 10
+
+    # Fortran order is loaded as a view
+    header = b"{'descr': '<i2', 'fortran_order': True, 'shape': (3, 2), }"
+    with open(filename, 'wb') as f:
+        f.write(b'\x93NUMPY\x01\x00' + bytes(bytearray([len(header), 0])))
+        f.write(header + raw[-12:])
+    b = tnp.load(filename, mmap_mode='r')
+    assert b.shape == (3, 2)
+    assert b.tolist() == [[1, 5], [4, 3], [2, 6]]
+
+    # Extension is added
+    tnp.save(str(tmpdir.join('b')), [1.5, 2.5])
+    assert tnp.load(str(tmpdir.join('b.npy'))).tolist() == [1.5, 2.5]
+
+    # Path-like objects
+    if sys.version_info >= (3, 6):
+        import pathlib
+        tnp.save(pathlib.Path(str(tmpdir.join('c'))), [1, 2])
+        path = pathlib.Path(str(tmpdir.join('c.npy')))
+        assert tnp.load(path).tolist() == [1, 2]
+        assert tnp.load(path, mmap_mode='r').tolist() == [1, 2]
+
+    with raises(ValueError):
+        tnp.load(filename, mmap_mode='w')
+
+
+def test_lazy():
+    """test lazy expressions that are evaluated in a single pass"""
+
+    a = tnp.array([[1, 2, 3], [4, 5, 6]], 'float64')
+    b = a[0]
+    c = tnp.array([[10], [20]], 'float64')
+
+    expected = a * b + c * 2 - a / 2
+    e = tnp.lazy(a) * b + c * 2 - a / 2
+    assert isinstance(e, tnp.LazyArray)
+    assert e.shape == (2, 3)
+    assert e.dtype == 'float64'
+    r = e.evaluate()
+    assert isinstance(r, tnp.ndarray)
+    assert (r == expected).all()
+
+    # Evaluated implicitly, and into a given array
+    assert e.sum() == expected.sum()
+    assert e.tolist() == expected.tolist()
+    out = tnp.empty((2, 3))
+    assert e.evaluate(out=out) is out
+    assert (out == expected).all()
+
+    # Reflected and unary operators, comparisons
+    e = 1 - abs(-tnp.lazy(a))
+    assert e.tolist() == [[0, -1, -2], [-3, -4, -5]]
+    e = tnp.lazy(a) > 2
+    assert e.dtype == 'bool'
+    assert e.evaluate().tolist() == [[False, False, True], [True, True, True]]
+
+    # Like in numpy, ~ is the logical not for booleans
+    mask = tnp.array([True, False])
+    assert (~mask).dtype == 'bool'
+    assert (~mask).tolist() == [False, True]
+    assert (~tnp.lazy(mask)).evaluate().tolist() == [False, True]
+    e = ~(tnp.lazy(a) > 2)
+    assert e.dtype == 'bool'
+    assert e.evaluate().tolist() == [[True, True, False], [False, False, False]]
+    assert a[0][~(b > 2)].tolist() == [1, 2]
+    assert (~tnp.array([1, -2], 'int32')).tolist() == [-2, 1]
+
+    # Intermediate results follow the dtype rules, like eager ones
+    u = tnp.array([200, 100], 'uint8')
+    assert (tnp.lazy(u) + u > 250).evaluate().tolist() == [False, False]
+    assert (tnp.lazy(u) + u).evaluate().tolist() == [144, 200]
+    f = tnp.array([0.1, 0.2], 'float32')
+    assert (tnp.lazy(f) * 3 * 3).tolist() == (f * 3 * 3).tolist()
+    # but float64 expressions are fused into a single pass
+    e = tnp.lazy(a) * b + tnp.lazy(c) * 2 - tnp.lazy(a) / 2
+    assert len(e._compile()[1]) == 3
+    assert (e.evaluate() == expected).all()
+
+    # Mixing with eager arrays evaluates the lazy part first
+    assert ((a + tnp.lazy(a) * 2) == a * 3).all()
+
+
 def test_creating_functions():
     
     # Test array
@@ -237,6 +399,33 @@ def test_creating_functions():
     assert b1.shape == (2, 3)
     
 
+def test_array_from_nested_lists():
+    """test creating arrays from (regular and ragged) nested lists"""
+
+    data = [[[i * 100 + j * 10 + k for k in range(4)] for j in range(3)]
+            for i in range(2)]
+    b = tnp.array(data)
+    assert b.shape == (2, 3, 4)
+    assert b.dtype == 'int64'
+    assert b[1, 2, 3] == 123
+    assert b.tolist() == data
+
+    # Tuples, explicit dtype, floats after ints
+    assert tnp.array(((1, 2), (3, 4)), 'float32').dtype == 'float32'
+    b = tnp.array([1, 2.5])
+    assert b.dtype == 'float64'
+    assert b.tolist() == [1.0, 2.5]
+
+    # Empty
+    assert tnp.array([]).shape == (0, )
+    assert tnp.array([[], []]).shape == (2, 0)
+
+    # Ragged input is padded
+    b = tnp.array([[1, 2], [3]])
+    assert b.shape == (2, 2)
+    assert b.tolist() == [[1, 2], [3, 0]]
+
+
 def test_getitem():
      
     a = np.array([[1, 2, 3, 4], [5, 6, 7, 8]])
@@ -339,6 +528,65 @@ def test_mdim_dot():
     assert 'Vector has invalid dimensions' in str(execinfo.value)
 
 
+def test_matmul():
+    """test matrix products with matmul, @ and dot"""
+
+    a = tnp.array([[1, 2, 3], [4, 5, 6]])
+    b = tnp.array([[1, 0], [0, 1], [2, 3]])
+    expected = [[7, 11], [16, 23]]
+
+    assert tnp.matmul(a, b).tolist() == expected
+    assert (a @ b).tolist() == expected
+    assert tnp.dot(a, b).tolist() == expected
+    assert a.dot(b).tolist() == expected
+
+    # Strided and transposed operands
+    assert (a[:, ::-1] @ b[::-1]).tolist() == expected
+    assert (b.T @ a.T).tolist() == [[7, 16], [11, 23]]
+
+    # Matrix-vector and vector-matrix
+    v = tnp.array([1, 1, 1])
+    assert (a @ v).tolist() == [6, 15]
+    assert (tnp.array([1, -1]) @ a).tolist() == [-3, -3, -3]
+    assert tnp.dot(v, v) == 3
+
+    # Stacks of matrices are broadcast
+    c = tnp.array([a.tolist(), (a * 2).tolist()])
+    r = c @ b
+    assert r.shape == (2, 2, 2)
+    assert r.tolist() == [expected, [[14, 22], [32, 46]]]
+    assert tnp.matmul(c, tnp.array([b.tolist()] * 3)[:2]).shape == (2, 2, 2)
+
+    # A broadcast B (2-D or with batch dims of 1) gives the same result
+    # as a B that is repeated for every batch
+    bb = tnp.array([[b.tolist(), (b * 3).tolist()]])
+    cc = tnp.array([c.tolist()] * 3)
+    r = cc @ bb
+    assert r.shape == (3, 2, 2, 2)
+    for i in range(3):
+        for j in range(2):
+            assert r[i, j].tolist() == (c[j] @ bb[0, j]).tolist()
+    assert (cc @ b).tolist() == [(c @ b).tolist()] * 3
+
+    # N-D dot combines all stacks
+    assert tnp.dot(a, tnp.array([b.tolist()] * 3)).shape == (2, 3, 2)
+
+    # Output arrays
+    out = tnp.zeros((2, 2), 'int64')
+    assert tnp.matmul(a, b, out=out) is out
+    assert out.tolist() == expected
+    m = tnp.array([[1., 2.], [3., 4.]])
+    m @= m
+    assert m.tolist() == [[7., 10.], [15., 22.]]
+
+    with raises(ValueError):
+        a @ a
+    with raises(ValueError):
+        tnp.matmul(a, 2)
+    with raises(TypeError):
+        tnp.matmul(m, m, out=out)
+
+
 # Start vector determinant tests
 def test_det():
     """test calculation of the determinant of a three dimensional"""
@@ -353,6 +601,49 @@ def test_det():
 
     assert a == 103
 
+
+def test_linalg():
+    """test LU based solving, inverse and determinants of N x N"""
+
+    a = tnp.array([[4., -2., 1., 3.],
+                   [3., 6., -4., 2.],
+                   [2., 1., 8., -5.],
+                   [1., 3., 2., 7.]])
+    x = tnp.array([1., -2., 3., 0.5])
+    b = a @ x
+
+    def close(p, q):
+        return tnp.absolute(tnp.array(p) - tnp.array(q)).max() < 1e-9
+
+    assert close(tnp.linalg.solve(a, b), x)
+
+    # Factor once, solve for many right hand sides
+    lu_piv = tnp.linalg.lu_factor(a)
+    assert lu_piv[0].shape == (4, 4)
+    for i in range(3):
+        assert close(tnp.linalg.lu_solve(lu_piv, b * i), x * i)
+    xx = tnp.array([x.tolist(), (x * 2).tolist()]).T
+    assert close(tnp.linalg.lu_solve(lu_piv, a @ xx), xx)
+
+    # Inverse and determinant
+    assert close(a @ tnp.linalg.inv(a), tnp.eye(4))
+    det = tnp.linalg.det(a)
+    sign, logdet = tnp.linalg.slogdet(a)
+    assert abs(sign * math.exp(logdet) - det) < 1e-9 * abs(det)
+    assert tnp.linalg.det([[0, 1], [1, 0]]) == -1
+    assert tnp.linalg.slogdet([[0, 1], [1, 0]]) == (-1, 0)
+
+    # Singular and non-square matrices
+    singular = [[1, 2], [2, 4]]
+    assert tnp.linalg.det(singular) == 0
+    assert tnp.linalg.slogdet(singular)[0] == 0
+    with raises(tnp.linalg.LinAlgError):
+        tnp.linalg.solve(singular, [1, 2])
+    with raises(tnp.linalg.LinAlgError):
+        tnp.linalg.inv(singular)
+    with raises(tnp.linalg.LinAlgError):
+        tnp.linalg.det([[1, 2, 3], [4, 5, 6]])
+
 # Start simple math function tests
 def test_add():
     """test the addition function for tinynumpy"""
@@ -398,6 +689,772 @@ def test_multiply():
     assert a == tnp.array([0, -6, -1], dtype='int64')
 
 
+def test_broadcasting():
+    """test elementwise operators on broadcasted operands"""
+
+    a = tnp.array([[1, 2, 3], [4, 5, 6]], 'float64')
+
+    # Scalars and reflected operators
+    assert ((a + 1) == tnp.array([[2, 3, 4], [5, 6, 7]])).all()
+    assert ((10 - a) == tnp.array([[9, 8, 7], [6, 5, 4]])).all()
+    assert ((2 ** a[0]) == tnp.array([2, 4, 8])).all()
+
+    # Row vector op matrix
+    r = a - a[0]
+    assert r.shape == (2, 3)
+    assert (r == tnp.array([[0, 0, 0], [3, 3, 3]])).all()
+
+    # (N, 1) op (1, M)
+    col = tnp.array([[1], [2], [3]])
+    row = tnp.array([[10, 20]])
+    r = col * row
+    assert r.shape == (3, 2)
+    assert (r == tnp.array([[10, 20], [20, 40], [30, 60]])).all()
+
+    # Strided operands
+    r = a[:, ::-1] / a[:, ::2][:, :1]
+    assert (r == tnp.array([[3., 2., 1.], [1.5, 1.25, 1.]])).all()
+
+    # Comparisons give bool arrays
+    m = a > 2
+    assert m.dtype == 'bool'
+    assert m.tolist() == [[False, False, True], [True, True, True]]
+
+    # Integer true division gives floats
+    assert (tnp.array([1, 2]) / 2).dtype == 'float64'
+
+    with raises(ValueError):
+        a + tnp.array([1, 2])
+
+
+def test_ufuncs_out_where():
+    """test module-level ufuncs with out= and where="""
+
+    a = tnp.array([[1., 4., 9.], [16., 25., 36.]])
+
+    # Results are written to, and returned as, the given array
+    out = tnp.zeros((2, 3))
+    assert tnp.sqrt(a, out=out) is out
+    assert out.tolist() == [[1., 2., 3.], [4., 5., 6.]]
+    assert tnp.add(a, 1, out) is out
+    assert out.tolist() == [[2., 5., 10.], [17., 26., 37.]]
+
+    # Where the mask is False, out keeps its values
+    out = tnp.zeros((2, 3)) - 1
+    tnp.sqrt(a, out=out, where=a > 10)
+    assert out.tolist() == [[-1., -1., -1.], [4., 5., 6.]]
+    tnp.multiply(a[0], 2, out=out, where=tnp.array([True, False, True]))
+    assert out.tolist() == [[2., -1., 18.], [2., 5., 18.]]
+
+    # Broadcasting into an int output, but floats do not fit there
+    c = tnp.empty((2, 3), 'int64')
+    tnp.add(tnp.array([1, 2, 3]), tnp.array([[10], [20]]), out=c)
+    assert c.tolist() == [[11, 12, 13], [21, 22, 23]]
+    with raises(TypeError):
+        tnp.sqrt(a, out=c)
+    with raises(ValueError):
+        tnp.add(a, 1, out=tnp.zeros((3,)))
+
+    # Result types and scalars
+    assert tnp.less([1, 2], [2, 1]).dtype == 'bool'
+    assert tnp.logical_and([1, 0, 1], [1, 1, 0]).tolist() == [True, False,
+                                                            False]
+    assert tnp.maximum([1, 5], 3).tolist() == [3, 5]
+    assert tnp.add(1, 2) == 3
+    assert tnp.log(0) == -tnp.inf
+    assert tnp.invert(tnp.array([True, False])).tolist() == [False, True]
+    assert tnp.invert(tnp.array([True, False])).dtype == 'bool'
+    assert tnp.invert(tnp.array([0, 5], 'uint8')).tolist() == [255, 250]
+    assert tnp.invert(True) is False
+
+    # clip does not build intermediate lists, and takes array bounds
+    assert a.clip(2, 20).tolist() == [[2., 4., 9.], [16., 20., 20.]]
+    assert tnp.clip(a, None, 5).tolist() == [[1., 4., 5.], [5., 5., 5.]]
+    out = tnp.zeros((2, 3))
+    assert a.clip(tnp.array([5., 6., 7.]), 30, out=out) is out
+    assert out.tolist() == [[5., 6., 9.], [16., 25., 30.]]
+
+
+def test_type_promotion():
+    """test result dtypes of mixed-dtype arithmetic"""
+
+    u8 = tnp.array([200, 100], 'uint8')
+    i8 = tnp.array([-1, 2], 'int8')
+    f4 = tnp.array([1.5, 2.5], 'float32')
+
+    # Arrays promote to the smallest dtype that holds both
+    assert (u8 + u8).dtype == 'uint8'
+    assert (u8 + u8).tolist() == [144, 200]  # wraps around like numpy
+    assert (u8 + i8).dtype == 'int16'
+    assert (u8 + i8).tolist() == [199, 102]
+    assert (i8 * f4).dtype == 'float32'
+    assert (tnp.array([1], 'int32') + f4).dtype == 'float64'
+
+    # Python scalars only change the result if of a higher kind
+    assert (u8 + 1).dtype == 'uint8'
+    assert (u8 * 0.5).dtype == 'float64'
+    assert (u8 * 0.5).tolist() == [100., 50.]
+    assert (f4 * 2.5).dtype == 'float32'
+    assert (tnp.array([True]) + 1).dtype == 'int64'
+
+    # Functions with float results, and true division
+    assert tnp.sqrt(u8).dtype == 'float32'
+    assert tnp.sqrt(tnp.array([4])).dtype == 'float64'
+    assert (i8 / i8).dtype == 'float64'
+    assert (u8 > 1).dtype == 'bool'
+
+    # Reductions and casts
+    assert u8.sum() == 300
+    assert tnp.array([1.7, -1.7]).astype('int32').tolist() == [1, -1]
+    assert tnp.array([0, 3]).astype('bool').tolist() == [False, True]
+    with raises(TypeError):
+        a = tnp.array([1, 2])
+        a += 0.5
+    with raises(TypeError):
+        tnp.add(f4, 1, out=tnp.zeros((2, ), 'int32'))
+    out = tnp.zeros((2, ), 'int8')
+    tnp.add(u8, 1, out=out)  # same kind is allowed
+    assert out.tolist() == [-55, 101]
+
+    # The functions
+    assert tnp.result_type('uint64', 'int64') == 'float64'
+    assert tnp.result_type('int32', 'float32') == 'float64'
+    assert tnp.result_type(u8, 'int8') == 'int16'
+    assert tnp.result_type(1, 2.0) == 'float64'
+    assert tnp.promote_types('i1', 'u1') == 'int16'
+    assert tnp.promote_types('bool', 'uint16') == 'uint16'
+    assert tnp.can_cast('int64', 'float64')
+    assert not tnp.can_cast('float64', 'int64')
+    assert not tnp.can_cast('int8', 'uint8')
+    assert tnp.can_cast('int64', 'int8', 'same_kind')
+    assert not tnp.can_cast('int8', 'uint8', 'same_kind')
+    assert tnp.can_cast(f4, 'float64')
+    assert tnp.can_cast('float64', 'int8', 'unsafe')
+    with raises(TypeError):
+        tnp.result_type('blaa')
+
+
+def test_sort():
+    a = tnp.array([[3, 1, 2], [9, 7, 8]])
+    assert tnp.sort(a).tolist() == [[1, 2, 3], [7, 8, 9]]
+    assert tnp.sort(a, axis=0).tolist() == [[3, 1, 2], [9, 7, 8]]
+    assert tnp.sort(a, axis=None).tolist() == [1, 2, 3, 7, 8, 9]
+    assert a.argsort().tolist() == [[1, 2, 0], [1, 2, 0]]
+    assert tnp.argsort(a, axis=None).tolist() == [1, 2, 0, 4, 5, 3]
+    # In place, on a non-contiguous view
+    a.T.sort()
+    assert a.tolist() == [[3, 1, 2], [9, 7, 8]]
+    a[:, ::-1].sort()
+    assert a.tolist() == [[3, 2, 1], [9, 8, 7]]
+    # NaN sorts to the end
+    b = tnp.array([3.0, float('nan'), 1.0])
+    assert tnp.sort(b).tolist()[:2] == [1.0, 3.0]
+    assert b.argsort().tolist() == [2, 0, 1]
+    with raises(ValueError):
+        a.sort(axis=2)
+
+    # Partition
+    c = tnp.array([[5, 1, 4, 2, 3], [0, 9, 8, 7, 6]])
+    for k in range(5):
+        p = tnp.partition(c, k)
+        ip = tnp.argpartition(c, k)
+        for row, prow, iprow in zip(c.tolist(), p.tolist(), ip.tolist()):
+            assert prow[k] == sorted(row)[k]
+            assert max(prow[:k] + [prow[k]]) == prow[k] == min(prow[k:])
+            assert [row[i] for i in iprow][k] == prow[k]
+    assert tnp.partition(c, [1, 3], axis=None)[3] == 3
+    c.partition(-1, axis=0)
+    assert c.tolist() == [[0, 1, 4, 2, 3], [5, 9, 8, 7, 6]]
+    with raises(ValueError):
+        c.partition(5)
+
+    # Searchsorted
+    s = tnp.array([1, 2, 2, 3])
+    assert tnp.searchsorted(s, 2) == 1
+    assert s.searchsorted(2, 'right') == 3
+    assert tnp.searchsorted(s, [[0, 5]]).tolist() == [[0, 4]]
+    assert tnp.searchsorted([3, 1, 2], 2.5, sorter=[1, 2, 0]) == 2
+    with raises(ValueError):
+        tnp.searchsorted(s, 1, side='middle')
+
+
+def test_set_operations():
+    a = tnp.array([[3, 1, 3], [2, 1, 1]], 'int16')
+    u, index, inverse, counts = tnp.unique(a, True, True, True)
+    assert u.dtype == 'int16' and u.tolist() == [1, 2, 3]
+    assert index.tolist() == [1, 3, 0]
+    assert inverse.tolist() == [2, 0, 2, 1, 0, 0]
+    assert counts.tolist() == [3, 1, 2]
+    f = tnp.array([2.0, float('nan'), 1.0, float('nan')])
+    u, counts = tnp.unique(f, return_counts=True)
+    assert u.tolist()[:2] == [1.0, 2.0] and math.isnan(u[2])
+    assert counts.tolist() == [1, 1, 2]
+
+    # Counted in a table for small ints and bools, hashed otherwise
+    data = [-3, 7, -3, 0, 127, -128, 7, -3]
+    expected = [[-128, -3, 0, 7, 127], [5, 0, 3, 1, 4],
+                [1, 3, 1, 2, 4, 0, 3, 1], [1, 3, 1, 2, 1]]
+    for dtype in ('int8', 'int16', 'int64'):
+        r = tnp.unique(tnp.array(data, dtype), True, True, True)
+        assert r[0].dtype == dtype
+        assert [x.tolist() for x in r] == expected
+    u, counts = tnp.unique(tnp.array([True, True, False]), return_counts=True)
+    assert u.dtype == 'bool' and u.tolist() == [False, True]
+    assert counts.tolist() == [1, 2]
+    assert tnp.unique(tnp.array([], 'uint8')).tolist() == []
+
+    # Membership, with the lookup table for small ints and with a set
+    for dtype in ('int8', 'uint16', 'int64', 'float32'):
+        b = tnp.array([[1, 5], [3, 0]], dtype)
+        assert tnp.isin(b, [3, 1.0, 2.5, 1000]).tolist() == [[True, False],
+                                                            [True, False]]
+    assert tnp.isin(tnp.array([-3, 4], 'int8'), [-3, 253]).tolist() == \
+        [True, False]
+    assert tnp.in1d([1, 2, 5], [2], invert=True).tolist() == [True, False,
+                                                               True]
+
+    r = tnp.intersect1d([1, 3, 4, 3], [3, 1, 2, 1], return_indices=True)
+    assert [x.tolist() for x in r] == [[1, 3], [0, 1], [1, 0]]
+    u = tnp.union1d([-1, 0, 1], [-2.0, 0, 2])
+    assert u.dtype == 'float64' and u.tolist() == [-2, -1, 0, 1, 2]
+    assert tnp.setdiff1d([5, 4, 3, 4, 1], [2, 4]).tolist() == [1, 3, 5]
+
+
+def test_histogram():
+    assert tnp.bincount([0, 1, 1, 3]).tolist() == [1, 2, 0, 1]
+    r = tnp.bincount(tnp.array([0, 1, 1], 'uint8'), [0.5, 1, 2], minlength=4)
+    assert r.dtype == 'float64' and r.tolist() == [0.5, 3.0, 0.0, 0.0]
+    with raises(ValueError):
+        tnp.bincount([1, -1])
+    with raises(TypeError):
+        tnp.bincount([1.5])
+    assert tnp.bincount([0, 2], None, None).tolist() == [1, 0, 1]
+    with raises(ValueError):
+        tnp.bincount([0, 2], minlength=-1)
+
+    # Uniform bins, values on the edges go to the right bin
+    hist, edges = tnp.histogram(tnp.arange(10) * 0.1, bins=10)
+    assert hist.dtype == 'int64' and hist.tolist() == [1] * 10
+    assert edges.tolist()[0] == 0.0 and abs(edges[-1] - 0.9) < 1e-12
+    hist, edges = tnp.histogram([1, 2, 3, 4], bins=2, range=(0, 4),
+                                weights=[1, 2, 3, 4])
+    assert hist.tolist() == [1, 9] and edges.tolist() == [0, 2, 4]
+    hist, edges = tnp.histogram([1, 2, 3, 4, 5], bins=2, range=(0, 4),
+                                density=True)
+    assert hist.tolist() == [0.125, 0.375]
+    # Explicit edges, the last bin includes its right edge
+    hist, edges = tnp.histogram([0.5, 1.5, 2.5, 3, 9, -1], bins=[0, 1, 2, 3])
+    assert hist.tolist() == [1, 1, 2]
+    with raises(ValueError):
+        tnp.histogram([1], bins=[0, 2, 1])
+
+    hist, xedges, yedges = tnp.histogram2d([0, 1, 1, 2], [0, 0, 1, 2],
+                                           bins=(2, [0, 1, 2, 3]))
+    assert hist.tolist() == [[1, 0, 0], [1, 1, 1]]
+    assert xedges.tolist() == [0, 1, 2] and yedges.tolist() == [0, 1, 2, 3]
+
+
+def test_concatenate_and_split():
+    a = tnp.array([[1, 2], [3, 4]])
+    c = tnp.array([[5.0, 6.0]])
+    r = tnp.concatenate([a, c])
+    assert r.dtype == 'float64' and r.tolist() == [[1, 2], [3, 4], [5, 6]]
+    # Non-contiguous inputs, and a given output
+    out = tnp.zeros((2, 4), 'int32')
+    assert tnp.concatenate([a, a.T], axis=1, out=out) is out
+    assert out.tolist() == [[1, 2, 1, 3], [3, 4, 2, 4]]
+    assert tnp.concatenate([a, c], axis=None).tolist() == [1, 2, 3, 4, 5, 6]
+    with raises(ValueError):
+        tnp.concatenate([a, tnp.array([1, 2])])
+    with raises(ValueError):
+        tnp.concatenate([a, c], axis=1)
+
+    assert tnp.stack([a, a.T], axis=2).tolist() == [[[1, 1], [2, 3]],
+                                                   [[3, 2], [4, 4]]]
+    assert tnp.stack([[1, 2], [3, 4]], axis=-1).tolist() == [[1, 3], [2, 4]]
+    assert tnp.vstack([[1, 2], a]).tolist() == [[1, 2], [1, 2], [3, 4]]
+    # Scalars and 0-d arrays are treated as arrays of shape (1, 1)
+    assert tnp.vstack([1, 2]).shape == (2, 1)
+    assert tnp.vstack([1, 2]).tolist() == [[1], [2]]
+    v = tnp.vstack([tnp.array(1.5), tnp.array(2.5)])
+    assert v.shape == (2, 1) and v.tolist() == [[1.5], [2.5]]
+    assert tnp.hstack([[1], [2, 3]]).tolist() == [1, 2, 3]
+    assert tnp.hstack([a, a]).shape == (2, 4)
+
+    # Splitting gives views
+    x = tnp.arange(10, dtype='int64')
+    parts = tnp.array_split(x, 3)
+    assert [p.tolist() for p in parts] == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    parts[1][0] = 40
+    assert x[4] == 40
+    parts = tnp.split(x.reshape((2, 5)), [1, 3], axis=1)
+    assert [p.shape for p in parts] == [(2, 1), (2, 2), (2, 2)]
+    assert len(tnp.split(x, 5)) == 5
+    with raises(ValueError):
+        tnp.split(x, 3)
+
+
+def test_chunked_array(tmpdir):
+    a = tnp.arange(35, dtype='float64').reshape((7, 5))
+    directory = str(tmpdir.join('a'))
+    tnp.save_chunked(directory, a, (3, 2))
+    c = tnp.load_chunked(directory, max_resident=2)
+    assert c.shape == (7, 5) and c.chunks == (3, 2) and c.grid == (3, 3)
+    assert c.dtype == 'float64'
+
+    # Slicing only loads the chunks that are needed
+    assert c[4, 1:].tolist() == [21, 22, 23, 24]
+    assert c.cache_info()['misses'] == 3
+    assert c[-1, -1] == 34
+    assert c[...].tolist() == a.tolist()
+    assert c[1:6:2, ::-2].tolist() == a[1:6:2, ::-2].tolist()
+    assert c[::-3, 3].tolist() == a[::-3, 3].tolist()
+    assert c.cache_info()['currsize'] == 2
+    with raises(IndexError):
+        c[7]
+
+    # Reductions
+    assert c.sum() == 595
+    assert c.sum(axis=0).tolist() == a.sum(axis=0).tolist()
+    assert c.max(axis=1).tolist() == a.max(axis=1).tolist()
+    assert c.min() == 0 and c.mean() == 17
+    assert c.mean(axis=1, keepdims=True).tolist() == \
+        a.mean(axis=1, keepdims=True).tolist()
+
+    # Elementwise operations are chunked and lazy
+    d = (c * 2 + 1) - a
+    assert isinstance(d, tnp.ChunkedArray) and d.chunks == (3, 2)
+    assert d[...].tolist() == (a + 1).tolist()
+    assert (a + c)[2].tolist() == (a * 2)[2].tolist()
+    assert tnp.sqrt(c)[2, 2] == 12 ** 0.5
+    assert (c > 10).dtype == 'bool' and (c > 10).sum() == 24
+    assert (~(c > 10)).dtype == 'bool' and (~(c > 10)).sum() == 11
+    assert (~(c > 10))[...].tolist() == (~(a > 10)).tolist()
+    assert c.astype('int32').dtype == 'int32'
+
+    # Rechunking, and chunks produced by a function
+    tnp.save_chunked(str(tmpdir.join('b')), c, chunks=(4, 4))
+    b = tnp.load_chunked(str(tmpdir.join('b')))
+    assert b.chunks == (4, 4) and b[...].tolist() == a.tolist()
+    g = tnp.ChunkedArray((10, 4), (3, 4), 'int64',
+                         lambda index: tnp.ones((min(3, 10 - 3 * index[0]),
+                                                 4), 'int64') * index[0])
+    assert g.sum(axis=1).tolist() == [0, 0, 0, 4, 4, 4, 8, 8, 8, 12]
+
+
+def test_parallel():
+    # The module (and multiprocessing) is only imported when used; so are
+    # asyncio and concurrent.futures, which import it on Python < 3.7
+    import subprocess
+    code = ('import sys, tinynumpy.tinynumpy as tnp; '
+            'assert "multiprocessing" not in sys.modules; '
+            'assert "asyncio" not in sys.modules; '
+            'assert "concurrent.futures" not in sys.modules; '
+            'tnp.parallel.Executor; '
+            'assert "multiprocessing" in sys.modules')
+    subprocess.check_call([sys.executable, '-c', code], cwd=os.path.dirname(
+        os.path.dirname(os.path.abspath(tnp.__file__))))
+    
+    parallel = tnp.parallel
+    if parallel.shared_memory is None:
+        skip('shared memory needs Python 3.8 or newer')
+    a = parallel.shared_array(tnp.arange(12, dtype='float64').reshape((4, 3)))
+    assert parallel.is_shared(a) and parallel.is_shared(a[1:])
+    assert not parallel.is_shared(tnp.zeros((2, )))
+    b = tnp.array([1.0, 2.0, 3.0])
+    with parallel.Executor(2) as ex:
+        r = ex.elementwise(tnp.add, a, b)
+        assert parallel.is_shared(r)
+        assert r.tolist() == (a + b).tolist()
+        assert ex.elementwise('multiply', a[:, 1:], 2).tolist() == \
+            (a[:, 1:] * 2).tolist()
+        out = parallel.shared_zeros((4, 3), 'float32')
+        assert ex.elementwise(tnp.sqrt, a, out=out) is out
+        assert out[3, 0] == 3
+        with raises(ValueError):
+            ex.elementwise(tnp.sqrt, a, out=tnp.zeros((4, 3)))
+        # The mask is split into blocks like the operands
+        out = parallel.shared_zeros((4, 3))
+        mask = a > 4
+        ex.elementwise(tnp.add, a, 1, out=out, where=mask)
+        assert out.tolist() == tnp.add(a, 1, out=tnp.zeros((4, 3)),
+                                       where=mask).tolist()
+        expected = tnp.negative(a, out=out.copy(), where=b > 1)
+        ex.elementwise(tnp.negative, a, out=out, where=b > 1)
+        assert out.tolist() == expected.tolist()
+        with raises(TypeError):
+            ex.elementwise(tnp.add, a, 1, order='C')
+
+        assert ex.sum(a) == 66
+        assert ex.sum(a, axis=0).tolist() == [18, 22, 26]
+        assert ex.sum(a, axis=1).tolist() == [3, 12, 21, 30]
+        assert ex.min(a) == 0 and ex.max(a, axis=0).tolist() == [9, 10, 11]
+        assert ex.mean(a) == 5.5 and ex.mean(a, axis=1).tolist() == [1, 4, 7,
+                                                                     10]
+        assert ex.prod(a[1:, :2]) == 3 * 4 * 6 * 7 * 9 * 10
+
+        m = tnp.arange(6, dtype='float64').reshape((3, 2))
+        assert ex.matmul(a, m).tolist() == tnp.matmul(a, m).tolist()
+        assert ex.matmul(a, b).tolist() == tnp.matmul(a, b).tolist()
+        s = tnp.arange(24, dtype='float64').reshape((2, 3, 4))
+        t = tnp.ones((2, 4, 2))
+        assert ex.matmul(s, t).tolist() == tnp.matmul(s, t).tolist()
+    parallel.release(a)
+    assert not parallel.is_shared(a)
+
+
+def test_threads():
+    
+    assert tnp.get_num_threads() == 1
+    with raises(ValueError):
+        tnp.set_num_threads(0)
+    
+    a = tnp.array([[float(i * 7 % 13) / 3 for i in range(j, j + 300)]
+                   for j in range(40)])
+    b = a[::2, 1::3]
+    flat = tnp.array([float(i % 97) / 7 for i in range(20000)])
+    
+    def compute():
+        return [(a * 2 + a).tolist(), (b - 1).tolist(), a.astype('int32'),
+                b.copy().tolist(), a.sum(), a.sum(axis=0).tolist(),
+                a.max(axis=1).tolist(), b.min(), flat.sum(), flat.mean(),
+                tnp.concatenate([b, b]).tolist()]
+    
+    expected = compute()
+    # Force the work to be split, also on Python builds with a GIL
+    previous = tnp.set_num_threads(4)
+    threshold, tnp._thread_threshold = tnp._thread_threshold, 0
+    try:
+        assert previous == 1 and tnp.get_num_threads() == 4
+        result = compute()
+    finally:
+        tnp._thread_threshold = threshold
+        tnp.set_num_threads(previous)
+    assert result[2].tolist() == expected[2].tolist()
+    result[2] = expected[2]
+    # Reductions combine the partials in the same order
+    assert result == expected
+
+
+def test_aio():
+    if not hasattr(tnp, 'aio'):
+        skip('tnp.aio needs Python 3.5 or newer')
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    
+    a = tnp.array([[float(i * 7 % 13) / 3 for i in range(j, j + 50)]
+                   for j in range(30)])
+    b = a[::2, 1::3]
+    flat = tnp.array([float(i % 97) / 7 for i in range(20000)])
+    mask = tnp.array([i % 3 == 0 for i in range(50)])
+    
+    async def check(ticks):
+        # 1-D reductions give the same result as the serial ones
+        assert await tnp.aio.sum(flat, chunksize=8192) == flat.sum()
+        assert await tnp.aio.mean(flat, chunksize=8192) == flat.mean()
+        # The other tasks ran in between the blocks
+        assert len(ticks) > 1
+        for name in ('sum', 'prod', 'min', 'max', 'mean', 'var', 'std'):
+            for x in (a, b):
+                for axis in (None, 0, 1):
+                    for keepdims in (False, True):
+                        result = await getattr(tnp.aio, name)(
+                            x, axis=axis, keepdims=keepdims, chunksize=7)
+                        expected = getattr(x, name)(axis=axis,
+                                                    keepdims=keepdims)
+                        if isinstance(expected, tnp.ndarray):
+                            assert result.shape == expected.shape
+                            result = result.ravel().tolist()
+                            expected = expected.ravel().tolist()
+                        else:
+                            result, expected = [result], [expected]
+                        for r, e in zip(result, expected):
+                            assert math.isclose(r, e, rel_tol=1e-12)
+        result = await tnp.aio.sum(a, axis=1, where=mask, chunksize=5)
+        assert result.tolist() == a.sum(axis=1, where=mask).tolist()
+        assert await tnp.aio.sum(tnp.array(3.0)) == 3.0
+        
+        # Transforms
+        result = await tnp.aio.clip(a, 1, 2, chunksize=7)
+        assert result.tolist() == a.clip(1, 2).tolist()
+        result = await tnp.aio.elementwise(tnp.add, a, mask, chunksize=11)
+        assert result.tolist() == (a + mask).tolist()
+        out = tnp.zeros(a.shape)
+        result = await tnp.aio.elementwise(tnp.multiply, a, 2, where=mask,
+                                           out=out, chunksize=11)
+        assert result is out
+        assert out.tolist() == tnp.multiply(a, 2, where=mask,
+                                            out=tnp.zeros(a.shape)).tolist()
+        with raises(ValueError):
+            await tnp.aio.clip(a)
+        with raises(ValueError):
+            await tnp.aio.sum(a, chunksize=0)
+        
+        # Blocks in an executor
+        with ThreadPoolExecutor(2) as executor:
+            result = await tnp.aio.clip(b, None, 2, chunksize=7,
+                                        executor=executor)
+            assert result.tolist() == b.clip(None, 2).tolist()
+            assert await tnp.aio.sum(flat, executor=executor) == flat.sum()
+    
+    async def main():
+        ticks = []
+        
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0)
+        
+        task = asyncio.ensure_future(ticker())
+        try:
+            await check(ticks)
+        finally:
+            task.cancel()
+    
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+def test_inplace_operators():
+    """test in-place operators on views and with broadcasting"""
+
+    a = tnp.array([[1, 2, 3], [4, 5, 6]], 'float64')
+
+    # In-place on a view only touches the elements of that view
+    b = a[:, 1:]
+    b *= 10
+    assert (a == tnp.array([[1, 20, 30], [4, 50, 60]])).all()
+
+    a[:, 0] += 100
+    assert (a == tnp.array([[101, 20, 30], [104, 50, 60]])).all()
+
+    # Broadcasted right-hand side, overlapping with the target
+    a -= a[0]
+    assert (a == tnp.array([[0, 0, 0], [3, 30, 30]])).all()
+
+    a[::-1] **= 2
+    assert (a == tnp.array([[0, 0, 0], [9, 900, 900]])).all()
+
+    with raises(ValueError):
+        a[0] += a
+
+    # Float results cannot be stored in an integer array
+    c = tnp.array([1, 2, 3])
+    with raises(TypeError):
+        c *= 0.5
+    c //= 2
+    assert c.tolist() == [0, 1, 1]
+
+
+def test_views():
+    """test that views share the data and base of the array"""
+
+    itemsizes = dict(bool=1, uint8=1, int16=2, int32=4, float32=4, float64=8)
+    for dtype, itemsize in itemsizes.items():
+        a = tnp.zeros((4, 6), dtype)
+        assert a.dtype == dtype
+        assert a.itemsize == itemsize
+        views = [a[1], a[:, 2], a.T, a[1:][::2, 1:], a.view(), a.T.T[2]]
+        for v in views:
+            assert v.base is a
+            assert v.dtype == dtype
+            assert v.data is a.data
+        a[1:][::2, 1:][1, 2] = 1
+        assert a[3, 3] == 1
+        assert a.T[3, 3] == 1
+
+    # Wrapping other buffers
+    b = tnp.ndarray((3, ), 'int16', buffer=bytearray(6))
+    assert b.tolist() == [0, 0, 0]
+    assert b[1:].base is b.base
+
+    # Arrays that wrap memory of other arrays use the cached buffer types
+    class Foreign(object):
+        def __init__(self, a):
+            self.__array_interface__ = a.__array_interface__
+    src = tnp.array([1, 2, 3, 4, 5], 'int32')
+    tnp._buffer_types.clear()
+    b = tnp.array(Foreign(src), copy=False)
+    assert (ctypes.c_int32, 5) in tnp._buffer_types
+    assert b.tolist() == [1, 2, 3, 4, 5]
+
+
+def test_strided_iteration():
+    """test reading and writing non-contiguous arrays as runs"""
+
+    a = tnp.arange(60, dtype='int64').reshape((3, 4, 5))
+
+    def elements(v, index=()):
+        # Nested list, built one element at a time
+        if len(index) == v.ndim:
+            return v[index]
+        return [elements(v, index + (i, )) for i in range(v.shape[len(index)])]
+
+    views = [a, a[1], a[:, 2], a[::-1, 1:3, ::2], a[:, :, 3], a[1:2, 0],
+             a[tnp.newaxis, :, ::3], a.T, a.transpose((1, 0, 2)),
+             a[1:, ::2].T, a[:, 1:2, :]]
+    for v in views:
+        expected = elements(v)
+        assert v.tolist() == expected
+        assert v.copy().tolist() == expected
+        assert list(v.flat) == v.copy().ravel().tolist()
+
+    # Assigning through a view, in C order of the view
+    b = a.copy()
+    for w in [b.T, b[::-1, 1:3, ::2], b[:, 1:2, :]]:
+        values = tnp.arange(w.size, dtype='int64').reshape(w.shape) * 7
+        w[:] = values
+        assert elements(w) == values.tolist()
+
+    # Scalar assignment to a strided view
+    b = a.copy()
+    b[::2, 1:3, ::-2] = -1
+    for i in range(3):
+        for j in range(4):
+            for k in range(5):
+                hit = i % 2 == 0 and 1 <= j < 3 and k % 2 == 0
+                assert b[i, j, k] == (-1 if hit else a[i, j, k])
+
+    # Reductions over coalesced and long runs
+    assert a.sum() == sum(range(60))
+    assert a[:, 1:3].sum(axis=(0, 2)).tolist() == [
+        sum([a[i, j, k] for i in range(3) for k in range(5)])
+        for j in (1, 2)]
+    big = tnp.ones((3, 10000))
+    assert big.sum() == 30000
+    assert big.T.sum(axis=1).tolist() == [3.0] * 10000
+    assert big.argmax() == 0
+
+
+def test_index_cache():
+    """test the cache of index plans for basic indexing"""
+
+    a = tnp.arange(24, dtype='int64').reshape((4, 6))
+    tnp.index_cache_clear()
+
+    # Integer indices are parameters of the plan
+    for i in range(4):
+        assert a[i, ::2].tolist() == [i * 6, i * 6 + 2, i * 6 + 4]
+    info = tnp.index_cache_info()
+    assert info['misses'] == 1 and info['hits'] == 3
+    assert info['currsize'] == 1
+
+    # Negative indices wrap, and are checked using the plan too
+    assert a[-1, -2] == 22
+    assert a[-4].tolist() == [0, 1, 2, 3, 4, 5]
+    for key in [4, -5, (0, 6), (0, -7)]:
+        with raises(IndexError):
+            a[key]
+    with raises(IndexError):
+        a[0, 0, 0]
+
+    # Different shape or strides need a different plan
+    tnp.index_cache_clear()
+    a[:, 2:10]
+    a.T[:, 2:10]
+    a[1:][:, 2:10]
+    assert tnp.index_cache_info()['misses'] == 4
+    assert a[:, 2:10].shape == (4, 4)
+    assert tnp.index_cache_info()['hits'] == 1
+    assert a[3:1].shape == (0, 6)
+
+
+def test_advanced_indexing():
+    """test indexing with boolean masks and integer arrays"""
+
+    a = tnp.arange(24, dtype='int64').reshape((4, 6))
+
+    # Boolean masks
+    assert tnp.array([True, False]).dtype == 'bool'
+    assert a[a > 20].tolist() == [21, 22, 23]
+    assert a[a > 100].shape == (0, )
+    rows = a[tnp.array([True, False, True, False])]
+    assert rows.tolist() == [[0, 1, 2, 3, 4, 5], [12, 13, 14, 15, 16, 17]]
+    assert a[1:, [True, False, False, False, False, True]].tolist() == [
+        [6, 11], [12, 17], [18, 23]]
+    with raises(IndexError):
+        a[tnp.array([True, False])]
+
+    # Integer arrays, lists and negative indices
+    assert a[[0, -1]].tolist() == [[0, 1, 2, 3, 4, 5],
+                                   [18, 19, 20, 21, 22, 23]]
+    assert a[:, [0, 3, 5]].tolist() == [[0, 3, 5], [6, 9, 11],
+                                        [12, 15, 17], [18, 21, 23]]
+    assert a[tnp.array([1, 2]), tnp.array([0, 5])].tolist() == [6, 17]
+    assert a[1, [0, 1]].tolist() == [6, 7]
+    assert a.T[[0, 2]].tolist() == [[0, 6, 12, 18], [2, 8, 14, 20]]
+    assert a[[]].shape == (0, 6)
+    with raises(IndexError):
+        a[[4]]
+    with raises(IndexError):
+        a[:, [-7]]
+    with raises(IndexError):
+        a[tnp.array([0.5])]
+
+    # Index dims go first if the indexed axes are not adjacent
+    b = tnp.arange(24, dtype='int64').reshape((2, 3, 4))
+    assert b[:, [0, 2], [1, 3]].tolist() == [[1, 11], [13, 23]]
+    assert b[[0, 1], :, [1, 3]].tolist() == [[1, 5, 9], [15, 19, 23]]
+    assert b[:, [[0], [2]], [1, 3]].shape == (2, 2, 2)
+
+    # Assignment
+    c = a.copy()
+    c[c > 20] = 0
+    assert c[3].tolist() == [18, 19, 20, 0, 0, 0]
+    c[[0, 1]] = tnp.array([9, 8, 7, 6, 5, 4])
+    assert c[:2].tolist() == [[9, 8, 7, 6, 5, 4]] * 2
+    c[:, [0, 5]] = [[1, 2]]
+    assert c[:, 0].tolist() == [1] * 4 and c[:, 5].tolist() == [2] * 4
+    c[tnp.array([True, False, False, True])] = -1
+    assert c[0].tolist() == [-1] * 6 and c[3].tolist() == [-1] * 6
+    c[[0, 1, 2, 3], [4, 3, 2, 1]] = tnp.array([10, 20, 30, 40])
+    assert [c[0, 4], c[1, 3], c[2, 2], c[3, 1]] == [10, 20, 30, 40]
+    b[[0, 1], :, [1, 3]] = tnp.array([[-1, -2, -3], [-4, -5, -6]])
+    assert b[0, :, 1].tolist() == [-1, -2, -3]
+    assert b[1, :, 3].tolist() == [-4, -5, -6]
+
+
+def test_transpose():
+    """test that transposes are views with permuted strides"""
+
+    a = tnp.ndarray((2, 3, 4, 5), 'int32')
+    a[:] = list(range(a.size))
+
+    b = a.transpose()
+    assert b.shape == (5, 4, 3, 2)
+    assert b.strides == a.strides[::-1]
+    assert b.base is a
+    assert b[4, 3, 2, 1] == a[1, 2, 3, 4]
+
+    b = a.transpose((1, 0, 3, 2))
+    assert b.shape == (3, 2, 5, 4)
+    assert b[2, 1, 4, 3] == a[1, 2, 3, 4]
+    assert a.transpose(1, 0, 3, 2).strides == b.strides
+
+    assert tnp.swapaxes(a, 0, -1).shape == (5, 3, 4, 2)
+    assert tnp.moveaxis(a, 0, -1).shape == (3, 4, 5, 2)
+    assert tnp.moveaxis(a, [0, 1], [-1, -2]).shape == (4, 5, 3, 2)
+
+    # Writing through a transposed view
+    b = a.T
+    b[0, 0, 0, 1] = -1
+    assert a[1, 0, 0, 0] == -1
+
+    # Explicit copy to get contiguous data
+    c = tnp.ascontiguousarray(b)
+    assert c.flags['C_CONTIGUOUS'] and not b.flags['C_CONTIGUOUS']
+    assert (c == b).all()
+    assert tnp.ascontiguousarray(a) is a
+
+    with raises(ValueError):
+        a.transpose((0, 1))
+    with raises(ValueError):
+        a.transpose((0, 1, 1, 2))
+
+
 if __name__ == '__main__':
     
     # Run tests with or without pytest. Running with pytest creates
@@ -0,0 +1,283 @@
+""" Cooperative versions of tinynumpy reductions and transforms for asyncio.
+
+A reduction or ufunc over a large array runs without returning to the
+event loop until it is done. The coroutines in this module do the same
+work in blocks of at most chunksize elements, and return to the event
+loop between blocks, so that other tasks keep running meanwhile. If an
+executor (e.g. a concurrent.futures.ThreadPoolExecutor) is given, the
+blocks are run in it instead.
+
+    total = await tnp.aio.sum(a)
+"""
+
+from __future__ import division
+
+import math
+import asyncio
+import builtins
+
+# Default number of elements per block. This is a multiple of the runs
+# of the reduction engine, so that the partial results of a 1-D array
+# are the same as those of a (serial) reduction of the whole array.
+CHUNKSIZE = 65536
+
+
+# The coroutines below shadow these builtins
+_builtin_sum, _builtin_min, _builtin_max = builtins.sum, builtins.min, \
+    builtins.max
+
+
+def _tnp():
+    # Imported on use, because tinynumpy imports this module
+    import tinynumpy.tinynumpy as tnp
+    return tnp
+
+
+def _block_keys(shape, chunksize, prefix=()):
+    """ Generate the keys (tuples of indices and slices) of blocks that
+    cover an array of the given (non-empty) shape in C order, each with
+    at most chunksize elements.
+    """
+    n, inner = shape[0], _tnp()._size_for_shape(shape[1:])
+    if inner <= chunksize:
+        step = chunksize // inner if inner else n
+        for i in range(0, n, step):
+            yield prefix + (slice(i, _builtin_min(i + step, n)), )
+    else:
+        for i in range(n):
+            for key in _block_keys(shape[1:], chunksize, prefix + (i, )):
+                yield key
+
+
+async def _step(func, executor):
+    """ Run func, in the executor if one is given, and give other tasks
+    the chance to run.
+    """
+    if executor is not None:
+        # Within a coroutine, this is the running loop (on Python 3.5+)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, func)
+    result = func()
+    await asyncio.sleep(0)
+    return result
+
+
+def _check_chunksize(chunksize):
+    chunksize = CHUNKSIZE if chunksize is None else int(chunksize)
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1')
+    return chunksize
+
+
+## Reductions
+
+
+async def _reduce(a, run_func, combine, axis, keepdims, dtype, where,
+                  chunksize, executor):
+    """ Cooperative version of the reduction engine (see tinynumpy's
+    _reduce). Over all axes, the partial results of the blocks are
+    combined at the end. Otherwise, the array is split along the first
+    axis that is kept, and the reduced blocks are joined.
+    """
+    tnp = _tnp()
+    a = tnp.array(a, copy=False)
+    chunksize = _check_chunksize(chunksize)
+    axes = tnp._normalize_axis(axis, a.ndim)
+    kept = [i for i in range(a.ndim) if i not in axes]
+    mask = where
+    if where is not True:
+        mask = tnp._broadcast_view(tnp.array(where, copy=False), a.shape)
+    if not kept and a.size:
+        view = a if a.ndim else a.reshape((1, ))
+        mask = mask if mask is True or a.ndim else mask.reshape((1, ))
+        partials = []
+        for key in _block_keys(view.shape, chunksize):
+            def block(key=key):
+                return tnp._reduce(view[key], run_func, list, None, False,
+                                   None, None,
+                                   mask if mask is True else mask[key])
+            partials.extend(await _step(block, executor))
+        result = combine(partials)
+        if keepdims:
+            result = tnp.array(result, dtype or a.dtype).reshape(
+                (1, ) * a.ndim)
+        return result
+    if not a.size:
+        return tnp._reduce(a, run_func, combine, axes, keepdims, dtype,
+                           None, mask)
+    k = kept[0]
+    n = a.shape[k]
+    step = _builtin_max(chunksize // (a.size // n), 1)
+    parts = []
+    for i in range(0, n, step):
+        key = (slice(None), ) * k + (slice(i, _builtin_min(i + step, n)), )
+        def block(key=key):
+            return tnp._reduce(a[key], run_func, combine, axes, True, dtype,
+                               None, mask if mask is True else mask[key])
+        parts.append(await _step(block, executor))
+    result = tnp.concatenate(parts, axis=k)
+    if not keepdims:
+        result = result.reshape(tuple([a.shape[i] for i in kept]))
+    return result
+
+
+def _sum_dtype(a, dtype):
+    tnp = _tnp()
+    return tnp._convert_dtype(dtype) or tnp._sum_dtype(
+        tnp.array(a, copy=False).dtype)
+
+
+def _mean_dtype(a, dtype):
+    tnp = _tnp()
+    return tnp._convert_dtype(dtype) or tnp._mean_dtype(
+        tnp.array(a, copy=False).dtype)
+
+
+async def sum(a, axis=None, dtype=None, keepdims=False, where=True,
+              chunksize=None, executor=None):
+    """ Sum of the array elements over the given axis, see ndarray.sum.
+    The work is done in blocks of at most chunksize elements, between
+    which other tasks can run; if an executor is given, the blocks run
+    in it.
+    """
+    return await _reduce(a, _builtin_sum, _builtin_sum, axis, keepdims,
+                         _sum_dtype(a, dtype), where, chunksize, executor)
+
+
+async def prod(a, axis=None, dtype=None, keepdims=False, where=True,
+               chunksize=None, executor=None):
+    prod = _tnp()._prod
+    return await _reduce(a, prod, prod, axis, keepdims, _sum_dtype(a, dtype),
+                         where, chunksize, executor)
+
+
+async def min(a, axis=None, keepdims=False, where=True, chunksize=None,
+              executor=None):
+    return await _reduce(a, _builtin_min, _builtin_min, axis, keepdims,
+                         None, where, chunksize, executor)
+
+
+async def max(a, axis=None, keepdims=False, where=True, chunksize=None,
+              executor=None):
+    return await _reduce(a, _builtin_max, _builtin_max, axis, keepdims,
+                         None, where, chunksize, executor)
+
+
+async def mean(a, axis=None, dtype=None, keepdims=False, where=True,
+               chunksize=None, executor=None):
+    """ Mean of the array elements over the given axis, see ndarray.mean
+    and sum().
+    """
+    def count_and_sum(run):
+        return len(run), _builtin_sum(run)
+    def combine(parts):
+        n = _builtin_sum([p[0] for p in parts])
+        return _builtin_sum([p[1] for p in parts]) / n if n else _tnp().nan
+    return await _reduce(a, count_and_sum, combine, axis, keepdims,
+                         _mean_dtype(a, dtype), where, chunksize, executor)
+
+
+async def var(a, axis=None, dtype=None, ddof=0, keepdims=False, where=True,
+              chunksize=None, executor=None):
+    """ Variance of the array elements over the given axis, see
+    ndarray.var and sum().
+    """
+    tnp = _tnp()
+    def combine(parts):
+        n, m, m2 = tnp._combine_moments(parts)
+        return m2 / (n - ddof) if n > ddof else tnp.nan
+    return await _reduce(a, tnp._moments, combine, axis, keepdims,
+                         _mean_dtype(a, dtype), where, chunksize, executor)
+
+
+async def std(a, axis=None, dtype=None, ddof=0, keepdims=False, where=True,
+              chunksize=None, executor=None):
+    """ Standard deviation of the array elements over the given axis,
+    see ndarray.std and sum().
+    """
+    tnp = _tnp()
+    def combine(parts):
+        n, m, m2 = tnp._combine_moments(parts)
+        return math.sqrt(m2 / (n - ddof)) if n > ddof else tnp.nan
+    return await _reduce(a, tnp._moments, combine, axis, keepdims,
+                         _mean_dtype(a, dtype), where, chunksize, executor)
+
+
+## Transforms
+
+
+async def _transform(func, operands, out, kwargs, chunksize, executor):
+    """ Apply func(*operands, out=..., **kwargs) elementwise to the
+    broadcast operands, in blocks of the result. The where argument in
+    kwargs (if any) is split into blocks like the operands.
+    """
+    tnp = _tnp()
+    chunksize = _check_chunksize(chunksize)
+    operands = [tnp.array(x, copy=False) if isinstance(x, (list, tuple))
+                else x for x in operands]
+    arrays = [x for x in operands if isinstance(x, tnp.ndarray)]
+    where = kwargs.pop('where', True)
+    if where is not True:
+        where = tnp.array(where, copy=False)
+        arrays.append(where)
+    shape = tnp._broadcast_shapes(*[x.shape for x in arrays])
+    if out is None:
+        # The dtype of the result, from a sample of at most one element
+        sample = [x[(slice(0, 1), ) * x.ndim] if isinstance(x, tnp.ndarray)
+                  and x.ndim else x for x in operands]
+        dtype = tnp.array(func(*sample, **kwargs), copy=False).dtype
+        out = tnp.empty(shape, dtype)
+    elif tnp._broadcast_shapes(out.shape, shape) != out.shape:
+        raise ValueError('output array has shape %s, expected %s' %
+                         (out.shape, shape))
+    shape = out.shape
+    if not out.ndim or not out.size:
+        if where is not True:
+            kwargs['where'] = where
+        return await _step(lambda: func(*operands, out=out, **kwargs),
+                           executor)
+    operands = [tnp._broadcast_view(x, shape) if isinstance(x, tnp.ndarray)
+                else x for x in operands]
+    if where is not True:
+        where = tnp._broadcast_view(where, shape)
+    for key in _block_keys(shape, chunksize):
+        def block(key=key):
+            args = [x[key] if isinstance(x, tnp.ndarray) else x
+                    for x in operands]
+            if where is not True:
+                kwargs['where'] = where[key]
+            func(*args, out=out[key], **kwargs)
+        await _step(block, executor)
+    return out
+
+
+async def elementwise(ufunc, *operands, **kwargs):
+    """ elementwise(ufunc, *operands, out=None, where=True, dtype=None,
+    chunksize=None, executor=None)
+
+    Apply a ufunc (e.g. tnp.add) to the broadcast operands, in blocks
+    of at most chunksize elements of the result, between which other
+    tasks can run; if an executor is given, the blocks run in it.
+    """
+    out = kwargs.pop('out', None)
+    chunksize = kwargs.pop('chunksize', None)
+    executor = kwargs.pop('executor', None)
+    return await _transform(ufunc, operands, out, kwargs, chunksize,
+                            executor)
+
+
+async def clip(a, a_min=None, a_max=None, out=None, chunksize=None,
+               executor=None):
+    """ Limit the values in the array to the interval [a_min, a_max],
+    see tnp.clip and elementwise().
+    """
+    tnp = _tnp()
+    if a_min is None and a_max is None:
+        raise ValueError('One of max or min must be given')
+    a = tnp.array(a, copy=False)
+    if out is None:
+        out = tnp.empty(tnp._broadcast_shapes(
+            *[tnp._shape_of(x) for x in (a, a_min, a_max)
+              if x is not None]), a.dtype)
+    return await _transform(tnp.clip, [a, a_min, a_max], out, {}, chunksize,
+                            executor)
@@ -5,19 +5,154 @@
 # Written by Eric Youngson eric@scneco.com / eayoungs@gmail.com
 # Succession Ecological Services: Portland, Oregon
 
+from __future__ import division
+
+import math
+import operator
+
+
 class LinAlgError(Exception):
     pass
 
-def det(A):
-    if len(A) == 3 and [len(vec)==3 for vec in A]:
-        try:
-            # http://mathworld.wolfram.com/Determinant.html
-            det_A = (A[0][0] * A[1][1] * A[2][2] + A[0][1] * A[1][2] *
-                     A[2][0] + A[0][2] * A[1][0] * A[2][1] - (A[0][2] *
-                     A[1][1] * A[2][0] + A[0][1] * A[1][0] * A[2][2] +
-                     A[0][0] * A[1][2] * A[2][1]))
-        except LinAlgError as e:
-            det_A = e
-    else:
-        raise IndexError('Vector has invalid dimensions')
-    return det_A
+
+def _tnp():
+    # Imported on use, because tinynumpy imports this module
+    import tinynumpy.tinynumpy as tnp
+    return tnp
+
+
+def _matrix_rows(a):
+    """ Get the rows (lists of floats) of square matrix a.
+    """
+    a = _tnp().array(a, 'float64', copy=False)
+    if a.ndim != 2 or a.shape[0] != a.shape[1]:
+        raise LinAlgError('Last 2 dimensions of the array must be square')
+    n = a.shape[0]
+    flat = a._toflatlist()
+    return [flat[i * n:(i + 1) * n] for i in range(n)]
+
+
+def _lu_rows(rows):
+    """ LU factorise the matrix given as a list of rows, in place, with
+    partial pivoting. Returns the pivot indices: row i was interchanged
+    with row piv[i]. L (with unit diagonal) and U end up in rows.
+    """
+    n = len(rows)
+    piv = []
+    for k in range(n):
+        p = max(range(k, n), key=lambda i: abs(rows[i][k]))
+        piv.append(p)
+        if p != k:
+            rows[k], rows[p] = rows[p], rows[k]
+        pivot = rows[k][k]
+        if pivot == 0:
+            continue  # Singular, leave the column as it is
+        tail = rows[k][k + 1:]
+        for row in rows[k + 1:]:
+            f = row[k] / pivot
+            row[k] = f
+            if f:
+                row[k + 1:] = [x - f * y for x, y in zip(row[k + 1:], tail)]
+    return piv
+
+
+def _lu_solve_rows(rows, piv, columns):
+    """ Solve for each column (a list) in columns, given the rows and
+    pivots of an LU factorisation. The columns are modified in place.
+    """
+    n = len(rows)
+    mul = operator.mul
+    lower = [row[:i] for i, row in enumerate(rows)]
+    upper = [row[i + 1:] for i, row in enumerate(rows)]
+    diag = [row[i] for i, row in enumerate(rows)]
+    if 0 in diag:
+        raise LinAlgError('Singular matrix')
+    for x in columns:
+        for i, p in enumerate(piv):
+            x[i], x[p] = x[p], x[i]
+        for i in range(1, n):
+            x[i] -= sum(map(mul, lower[i], x[:i]))
+        for i in range(n - 1, -1, -1):
+            x[i] = (x[i] - sum(map(mul, upper[i], x[i + 1:]))) / diag[i]
+    return columns
+
+
+def lu_factor(a):
+    """ Compute the LU factorisation of square matrix a with partial
+    pivoting. Returns (lu, piv), where lu holds U in its upper triangle
+    and L (without its unit diagonal) below it, and row i was
+    interchanged with row piv[i]. Can be passed to lu_solve to solve
+    for many right hand sides.
+    """
+    tnp = _tnp()
+    rows = _matrix_rows(a)
+    piv = _lu_rows(rows)
+    return tnp.array(rows, 'float64'), tnp.array(piv, 'int64')
+
+
+def lu_solve(lu_and_piv, b):
+    """ Solve a x = b, given the LU factorisation (lu, piv) of a from
+    lu_factor. b can be a vector, or a matrix of which each column is a
+    right hand side.
+    """
+    tnp = _tnp()
+    lu, piv = lu_and_piv
+    rows = _matrix_rows(lu)
+    b = tnp.array(b, 'float64', copy=False)
+    if b.ndim not in (1, 2) or b.shape[0] != len(rows):
+        raise ValueError('incompatible dimensions %s and %s' %
+                         (lu.shape, b.shape))
+    columns = [b.tolist()] if b.ndim == 1 else b.T.tolist()
+    _lu_solve_rows(rows, [int(p) for p in piv], columns)
+    if b.ndim == 1:
+        return tnp.array(columns[0], 'float64')
+    return tnp.array(columns, 'float64').T.copy()
+
+
+def solve(a, b):
+    """ Solve the linear system a x = b for x, with a square.
+    """
+    return lu_solve(lu_factor(a), b)
+
+
+def inv(a):
+    """ Compute the inverse of square matrix a.
+    """
+    tnp = _tnp()
+    rows = _matrix_rows(a)
+    n = len(rows)
+    piv = _lu_rows(rows)
+    columns = [[float(i == j) for i in range(n)] for j in range(n)]
+    _lu_solve_rows(rows, piv, columns)
+    return tnp.array(columns, 'float64').T.copy()
+
+
+def slogdet(a):
+    """ Compute the sign and natural logarithm of the determinant of
+    square matrix a. For a singular matrix the sign is 0 and the
+    logarithm is -inf.
+    """
+    rows = _matrix_rows(a)
+    piv = _lu_rows(rows)
+    sign, logdet = 1.0, 0.0
+    for i, p in enumerate(piv):
+        d = rows[i][i]
+        if d == 0:
+            return 0.0, -float('inf')
+        if (d < 0) != (p != i):
+            sign = -sign
+        logdet += math.log(abs(d))
+    return sign, logdet
+
+
+def det(a):
+    """ Compute the determinant of square matrix a.
+    """
+    rows = _matrix_rows(a)
+    piv = _lu_rows(rows)
+    result = 1.0
+    for i, p in enumerate(piv):
+        if rows[i][i] == 0:
+            return 0.0
+        result *= rows[i][i] if p == i else -rows[i][i]
+    return result
@@ -41,13 +41,25 @@ certain features may not be supported.
 from __future__ import division
 from __future__ import absolute_import
 
+import os
 import sys
+import ast
+import mmap
+import struct
 import ctypes
+import math
+import heapq
+import bisect
 
-from math import sqrt
 from copy import copy, deepcopy
-from collections import Iterable
+from itertools import chain, compress, product
+from collections import OrderedDict, Counter
+try:
+    from collections.abc import Iterable
+except ImportError:  # Python 2
+    from collections import Iterable
 import operator
+from array import array as _pyarray
 
 import tinynumpy.tinylinalg as linalg
 from tinynumpy.tinylinalg import LinAlgError as LinAlgError
@@ -56,11 +68,34 @@ from tinynumpy.tinylinalg import LinAlgError as LinAlgError
 if sys.version_info >= (3, ):
     xrange = range
 
+
+class _LazyModule(object):
+    """ Stand-in for a submodule that is imported on first use, for
+    modules that are costly to import (e.g. multiprocessing).
+    """
+    
+    def __init__(self, name):
+        self._name = name
+    
+    def __getattr__(self, attr):
+        __import__(self._name)
+        module = sys.modules[self._name]
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+    
+    def __repr__(self):
+        return '<lazy module %r>' % self._name
+
+
+parallel = _LazyModule('tinynumpy.tinyparallel')
+if sys.version_info >= (3, 5):
+    aio = _LazyModule('tinynumpy.tinyaio')  # Uses async def
+
 # Define version numer
 __version__ = '0.0.1dev'
 
 # Define dtypes: struct name, short name, numpy name, ctypes type
-_dtypes = [('B', 'b1', 'bool', ctypes.c_bool),
+_dtypes = [('?', 'b1', 'bool', ctypes.c_bool),
            ('b', 'i1', 'int8', ctypes.c_int8),
            ('B', 'u1', 'uint8', ctypes.c_uint8),
            ('h', 'i2', 'int16', ctypes.c_int16),
@@ -81,6 +116,28 @@ for d in _known_dtypes:
 newaxis = None
 
 nan = float('nan')
+inf = float('inf')
+
+
+class _DType(object):
+    """ Descriptor of a dtype, with its names in the different notations
+    and its itemsize, so that these do not need to be looked up.
+    """
+    __slots__ = ['array', 'short', 'numpy', 'ctypes', 'itemsize', 'kind']
+    
+    def __init__(self, array, short, numpy, ctype):
+        self.array, self.short, self.numpy = array, short, numpy
+        self.ctypes = ctype
+        self.itemsize = ctypes.sizeof(ctype)
+        self.kind = short[0]  # b, u, i or f
+
+
+# Map each name of each dtype to its descriptor
+_dtype_descrs = {}
+for d in _dtypes:
+    for name in d[:3]:
+        _dtype_descrs[name] = _DType(*d)
+
 
 def _convert_dtype(dtype, to='numpy'):
     """ Convert dtype, if could not find, pass as it was.
@@ -88,11 +145,10 @@ def _convert_dtype(dtype, to='numpy'):
     if dtype is None:
         return dtype
     dtype = str(dtype)
-    index = {'array':0, 'short':1, 'numpy':2, 'ctypes':3}[to]
-    for dd in _dtypes:
-        if dtype in dd:
-            return dd[index]
-    return dtype  # Otherwise return original
+    descr = _dtype_descrs.get(dtype)
+    if descr is None:
+        return dtype  # Otherwise return original
+    return getattr(descr, to)
 
 
 def _ceildiv(a, b):
@@ -104,6 +160,8 @@ def _get_step(view):
     C-contiguous. If 0, the striding is such that one cannot
     step through the array.
     """
+    if not view.shape:
+        return 1  # A single element
     cont_strides = _strides_for_shape(view.shape, view.itemsize)
     
     step = view.strides[-1] // cont_strides[-1]
@@ -158,6 +216,28 @@ def _shape_from_object(obj):
     return tuple(shape)
 
 
+def _flatten_object(obj):
+    """ Get (shape, elements) for a regular nested list/tuple, with the
+    elements as a flat list in C order. The shape is derived from the
+    len() of the first element at each level, and each level is then
+    validated at once. Returns None if obj is ragged.
+    """
+    shape = []
+    el = obj
+    while isinstance(el, (list, tuple)):
+        shape.append(len(el))
+        if not el:
+            break
+        el = el[0]
+    rows = [obj]
+    for n in shape:
+        for row in rows:
+            if not isinstance(row, (list, tuple)) or len(row) != n:
+                return None
+        rows = list(chain.from_iterable(rows))
+    return tuple(shape), rows
+
+
 def _assign_from_object(array, obj):
     key = []
     # todo: make more efficient, especially the try-except
@@ -183,6 +263,18 @@ def _increment_mutable_key(key, shape):
         key[axis] = 0
 
 
+def _unravel_indices(idx, shape):
+    """ Turn a list of flat (C order) indices into a list of index
+    lists, one for each dimension.
+    """
+    result = []
+    for n in reversed(shape[1:]):
+        result.append([i % n for i in idx])
+        idx = [i // n for i in idx]
+    result.append(idx)
+    return result[::-1]
+
+
 def _key_for_index(index, shape):
     key = []
     cumshape = [1]
@@ -201,6 +293,1218 @@ def _zerositer(n):
         yield 0
 
 
+## Type promotion
+
+# Order of the kinds of dtypes (bool, unsigned, signed, float)
+_kind_order = 'buif'
+
+
+def _is_safe_cast(src, dst):
+    """ Get whether all values of dtype src can be represented in dst.
+    """
+    s, d = _dtype_descrs[src], _dtype_descrs[dst]
+    if s.kind == 'b' or src == dst:
+        return True
+    elif d.kind == 'b':
+        return False
+    elif s.kind == d.kind:
+        return d.itemsize >= s.itemsize
+    elif d.kind == 'f':
+        # Like numpy, (u)int64 to float64 is considered safe
+        return d.itemsize > s.itemsize or d.itemsize == 8
+    elif s.kind == 'u' and d.kind == 'i':
+        return d.itemsize > s.itemsize
+    return False
+
+
+# Precompute the safe casts, and the promotion of each pair of dtypes:
+# the smallest dtype that both can be safely cast to
+_safe_casts = set([(src, dst) for src in _known_dtypes
+                   for dst in _known_dtypes if _is_safe_cast(src, dst)])
+_promotion_order = sorted(_known_dtypes, key=lambda d: (
+    _dtype_descrs[d].itemsize, _kind_order.index(_dtype_descrs[d].kind)))
+_promotion_table = {}
+for _a in _known_dtypes:
+    for _b in _known_dtypes:
+        _promotion_table[_a, _b] = [d for d in _promotion_order
+                                    if (_a, d) in _safe_casts and
+                                    (_b, d) in _safe_casts][0]
+# The float dtype for the result of e.g. sqrt on each dtype
+_float_results = dict([(d, _promotion_table[d, 'float32'])
+                       for d in _known_dtypes])
+del _a, _b
+
+
+def _check_dtype(dtype):
+    name = _convert_dtype(dtype)
+    if name not in _dtype_descrs:
+        raise TypeError('data type %r not understood' % dtype)
+    return name
+
+
+def promote_types(type1, type2):
+    """ promote_types(type1, type2)
+    
+    Get the smallest dtype to which both given dtypes can be safely cast.
+    """
+    return _promotion_table[_check_dtype(type1), _check_dtype(type2)]
+
+
+def _scalar_dtype(x):
+    if x is True or x is False:
+        return 'bool'
+    return 'int64' if isinstance(x, int) else 'float64'
+
+
+def can_cast(from_, to, casting='safe'):
+    """ can_cast(from_, to, casting='safe')
+    
+    Get whether a cast from the dtype (or array or scalar) from_ to
+    dtype to can happen according to the casting rule, which is 'no',
+    'equiv', 'safe', 'same_kind' or 'unsafe'.
+    """
+    if isinstance(from_, (ndarray, LazyArray)):
+        from_ = from_.dtype
+    elif isinstance(from_, (int, float)):
+        from_ = _scalar_dtype(from_)
+    src, dst = _check_dtype(from_), _check_dtype(to)
+    if casting in ('no', 'equiv'):
+        return src == dst
+    elif casting == 'safe':
+        return (src, dst) in _safe_casts
+    elif casting == 'same_kind':
+        return ((src, dst) in _safe_casts or
+                _kind_order.index(_dtype_descrs[src].kind) <=
+                _kind_order.index(_dtype_descrs[dst].kind))
+    elif casting == 'unsafe':
+        return True
+    raise ValueError("casting must be one of 'no', 'equiv', 'safe', "
+                     "'same_kind', or 'unsafe'")
+
+
+def result_type(*arrays_and_dtypes):
+    """ result_type(*arrays_and_dtypes)
+    
+    Get the dtype that results from applying the type promotion rules
+    to the arguments (arrays, dtypes and Python scalars). Python scalars
+    are "weak": they only change the result if they are of a higher
+    kind, e.g. ``uint8_array + 1`` stays uint8, but ``int_array * 0.5``
+    becomes float64.
+    """
+    result = None
+    weak = 0  # 0: no scalars, 1: bool, 2: int, 3: float
+    for x in arrays_and_dtypes:
+        if isinstance(x, (ndarray, LazyArray)):
+            dtype = x.dtype
+        elif isinstance(x, (int, float)):
+            weak = max(weak, 1 if x is True or x is False else
+                       2 if isinstance(x, int) else 3)
+            continue
+        else:
+            dtype = _check_dtype(x)
+        result = dtype if result is None else _promotion_table[result, dtype]
+    if result is None:
+        if not weak:
+            raise ValueError('at least one array or dtype is required')
+        return ['bool', 'int64', 'float64'][weak - 1]
+    level = {'b': 1, 'u': 2, 'i': 2, 'f': 3}[_dtype_descrs[result].kind]
+    if weak > level:
+        result = ['bool', 'int64', 'float64'][weak - 1]
+    return result
+
+
+## Storage backends
+
+# The elements of an array are stored in a ctypes array (the default),
+# a Python array.array, or a memoryview cast to the struct format of the
+# dtype. All support indexing and (strided) slicing; views share the
+# storage object of their base.
+_storage_backends = ('ctypes', 'array', 'memoryview')
+_storage_backend = 'ctypes'
+
+
+def set_storage_backend(name):
+    """ Set the storage used for newly allocated arrays: 'ctypes'
+    (default), 'array' (Python's array.array) or 'memoryview' (over a
+    bytearray). Returns the name of the previous backend.
+    """
+    global _storage_backend
+    if name not in _storage_backends:
+        raise ValueError('storage backend must be one of %s' %
+                         ', '.join(_storage_backends))
+    previous, _storage_backend = _storage_backend, name
+    return previous
+
+
+def get_storage_backend():
+    """ Get the name of the storage used for newly allocated arrays.
+    """
+    return _storage_backend
+
+
+def _buffer_size(shape, strides, itemsize, offset=0):
+    """ Get the number of elements that a buffer must hold for the
+    given shape and strides (in any order, possibly negative).
+    """
+    size = offset
+    if 0 not in shape:
+        size += 1
+        for n, stride in zip(shape, strides):
+            if stride > 0:
+                size += (n - 1) * stride // itemsize
+    return size
+
+
+# Cache of ctypes array types, so that these are not recreated for
+# every array
+_buffer_types = {}
+_buffer_types_maxsize = 1024
+
+
+def _buffer_type(ctype, size):
+    """ Get the ctypes array type for size elements of ctype.
+    """
+    try:
+        return _buffer_types[ctype, size]
+    except KeyError:
+        if len(_buffer_types) >= _buffer_types_maxsize:
+            _buffer_types.clear()
+        t = _buffer_types[ctype, size] = ctype * size
+        return t
+
+
+def _allocate_storage(dtype, size):
+    """ Get zero-initialized storage for size elements of dtype.
+    """
+    descr = _dtype_descrs[dtype]
+    fmt = descr.array
+    if _storage_backend == 'ctypes':
+        return _buffer_type(descr.ctypes, size)()
+    nbytes = size * descr.itemsize
+    if _storage_backend == 'array' and fmt != '?':
+        return _pyarray(fmt, bytes(nbytes))
+    return memoryview(bytearray(nbytes)).cast(fmt)
+
+
+def _wrap_storage(buffer, dtype, size):
+    """ Get storage for size elements of dtype in the memory of the given
+    buffer, which can be the storage of another array, or any object
+    that exposes the buffer interface. Does not copy.
+    """
+    descr = _dtype_descrs[dtype]
+    fmt, ctype, itemsize = descr.array, descr.ctypes, descr.itemsize
+    if isinstance(buffer, ctypes.Array):
+        if ctypes.sizeof(buffer) < size * itemsize:
+            raise TypeError('buffer is too small for requested array')
+        if buffer._type_ is ctype:
+            return buffer
+        return _buffer_type(ctype, size).from_address(
+            ctypes.addressof(buffer))
+    if isinstance(buffer, _pyarray) and buffer.typecode == fmt:
+        storage = buffer
+    elif isinstance(buffer, memoryview) and buffer.format == fmt:
+        storage = buffer
+    elif _storage_backend == 'ctypes' and not memoryview(buffer).readonly:
+        return _buffer_type(ctype, size).from_buffer(buffer)
+    else:
+        storage = memoryview(buffer).cast('B')
+        storage = storage[:len(storage) - len(storage) % itemsize].cast(fmt)
+    if len(storage) < size:
+        raise TypeError('buffer is too small for requested array')
+    return storage
+
+
+def _wrap_integers(values, fmt):
+    """ Wrap integer values around to the range of the struct format,
+    as ctypes (and numpy) do on overflow.
+    """
+    nbits = 8 * struct.calcsize(fmt)
+    mask = (1 << nbits) - 1
+    values = [int(v) & mask for v in values]
+    if fmt.islower():
+        half = 1 << (nbits - 1)
+        values = [v - (mask + 1) if v >= half else v for v in values]
+    return values
+
+
+def _to_pyarray(fmt, values):
+    try:
+        return _pyarray(fmt, values)
+    except OverflowError:
+        return _pyarray(fmt, _wrap_integers(values, fmt))
+
+
+def _store(data, index, values):
+    """ Assign a sequence of values to a slice of storage.
+    """
+    if isinstance(data, ctypes.Array):
+        data[index] = values
+    elif isinstance(data, _pyarray):
+        data[index] = _to_pyarray(data.typecode, values)
+    elif data.format == '?':
+        data[index] = memoryview(bytearray(map(operator.truth, values))).cast('?')
+    else:
+        data[index] = _to_pyarray(data.format, values)
+
+
+def _storage_address(data):
+    """ Get (address, readonly) of the first element of storage.
+    """
+    if isinstance(data, ctypes.Array):
+        return ctypes.addressof(data), False
+    elif isinstance(data, _pyarray):
+        return data.buffer_info()[0], False
+    elif isinstance(data, memoryview) and not data.readonly:
+        return ctypes.addressof(ctypes.c_char.from_buffer(data)), False
+    elif isinstance(data, memoryview) and isinstance(data.obj, bytes):
+        return ctypes.cast(data.obj, ctypes.c_void_p).value, True
+    elif hasattr(data, '__array_interface__'):
+        return data.__array_interface__['data']
+    raise TypeError('Cannot get address to underlying array data')
+
+
+## Threads
+
+# Kernels (the elementwise engine, reductions and copies) can split their
+# work over threads, in blocks along the outer dimension. This only pays
+# off on free-threaded builds of Python, and for large enough arrays.
+_num_threads = 1
+# The pool and the thread-local state are created on first use, so that
+# importing tinynumpy does not import concurrent.futures
+_thread_pool = None
+_thread_state = None
+# Minimum number of elements for which the work is split (measured)
+_thread_threshold = None
+
+
+def set_num_threads(n):
+    """ Set the number of threads that ufuncs, reductions and copies may
+    use (default 1). Returns the previous number. On Python builds with
+    a GIL, threads cannot run kernels in parallel, so these then run
+    serially anyway, as they do for small arrays.
+    """
+    global _num_threads, _thread_pool
+    n = operator.index(n)
+    if n < 1:
+        raise ValueError('the number of threads must be at least 1')
+    previous, _num_threads = _num_threads, n
+    if _thread_pool is not None and n != previous:
+        _thread_pool.shutdown(wait=False)
+        _thread_pool = None
+    return previous
+
+
+def get_num_threads():
+    """ Get the number of threads that kernels may use.
+    """
+    return _num_threads
+
+
+def _get_thread_pool():
+    global _thread_pool, _thread_state
+    if _thread_pool is None:
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        if _thread_state is None:
+            _thread_state = threading.local()
+        # The calling thread runs a block too
+        _thread_pool = ThreadPoolExecutor(max(_num_threads - 1, 1))
+    return _thread_pool
+
+
+def _get_thread_threshold():
+    """ Get the minimum number of elements for which the work of a kernel
+    is split over threads: never with a GIL, otherwise the number for
+    which the work clearly outweighs the measured cost of dispatching
+    a block to the pool.
+    """
+    global _thread_threshold
+    if _thread_threshold is None:
+        is_gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)
+        if sys.version_info < (3, 2) or is_gil_enabled():
+            _thread_threshold = inf  # No concurrent.futures on Python 2
+        else:
+            from timeit import default_timer as _timer
+            pool = _get_thread_pool()
+            t0 = _timer()
+            for i in xrange(16):
+                pool.submit(int).result()
+            dispatch = (_timer() - t0) / 16
+            values = [1.0] * 4096
+            t0 = _timer()
+            list(map(operator.add, values, values))
+            per_element = max((_timer() - t0) / 4096, 1e-9)
+            _thread_threshold = int(8 * dispatch / per_element)
+    return _thread_threshold
+
+
+def _run_blocks(func, n, size, align=1):
+    """ Call func(start, stop) for blocks of range(n), in threads if the
+    work (of size elements) is large enough, and return the results in
+    the order of the blocks. The blocks start at multiples of align.
+    """
+    nthreads = min(_num_threads, _ceildiv(n, align))
+    if nthreads < 2 or size < _get_thread_threshold():
+        return [func(0, n)]
+    pool = _get_thread_pool()
+    if getattr(_thread_state, 'busy', False):
+        return [func(0, n)]
+    per_block = _ceildiv(_ceildiv(n, nthreads), align) * align
+    blocks = [(i, min(i + per_block, n)) for i in xrange(0, n, per_block)]
+    
+    def run(block):
+        # Kernels that are called from a block run serially
+        _thread_state.busy = True
+        try:
+            return func(*block)
+        finally:
+            _thread_state.busy = False
+    
+    futures = [pool.submit(run, block) for block in blocks[1:]]
+    return [run(blocks[0])] + [f.result() for f in futures]
+
+
+def _block_offsets(offsets, strides, start):
+    """ Get the offsets of the operands at index start of the first axis.
+    """
+    return [o + start * s[0] for o, s in zip(offsets, strides)]
+
+
+## Elementwise engine
+
+def _maximum(a, b):
+    # Propagate nan, like numpy
+    return a if a >= b or a != a else b
+
+
+def _minimum(a, b):
+    return a if a <= b or a != a else b
+
+
+def _clip(x, a_min, a_max):
+    return _minimum(_maximum(x, a_min), a_max)
+
+
+def _sign(x):
+    return (x > 0) - (x < 0) if x == x else x
+
+
+def _square(x):
+    return x * x
+
+
+def _logical_and(a, b):
+    return operator.truth(a) and operator.truth(b)
+
+
+def _logical_or(a, b):
+    return operator.truth(a) or operator.truth(b)
+
+
+def _logical_xor(a, b):
+    return operator.truth(a) != operator.truth(b)
+
+
+def _float_func(func):
+    """ Wrap a function from the math module to give nan instead of
+    raising on a domain error, like numpy.
+    """
+    def wrapped(x):
+        try:
+            return func(x)
+        except ValueError:
+            return nan
+    return wrapped
+
+
+def _log(x):
+    return math.log(x) if x > 0 else (-inf if x == 0 else nan)
+
+
+def _log10(x):
+    return math.log10(x) if x > 0 else (-inf if x == 0 else nan)
+
+
+def _floor(x):
+    return float(math.floor(x)) if isinstance(x, float) else x
+
+
+def _ceil(x):
+    return float(math.ceil(x)) if isinstance(x, float) else x
+
+
+_sqrt, _exp = _float_func(math.sqrt), _float_func(math.exp)
+_sin, _cos, _tan = (_float_func(math.sin), _float_func(math.cos),
+                    _float_func(math.tan))
+_asin, _acos, _atan = (_float_func(math.asin), _float_func(math.acos),
+                       math.atan)
+_sinh, _cosh, _tanh = math.sinh, math.cosh, math.tanh
+_atan2, _hypot = math.atan2, math.hypot
+
+_comparison_ops = (operator.eq, operator.ne, operator.lt, operator.le,
+                   operator.gt, operator.ge)
+_bool_ops = _comparison_ops + (_logical_and, _logical_or, _logical_xor,
+                               operator.not_)
+
+
+def _invert_op(dtype):
+    """ Get the op for ~ on values of the given dtype. Like in numpy, this
+    is the logical not for booleans (operator.invert gives -1 or -2).
+    """
+    return operator.not_ if dtype == 'bool' else operator.invert
+
+
+_floating_ops = (operator.truediv, _sqrt, _exp, _log, _log10, _sin, _cos,
+                 _tan, _asin, _acos, _atan, _sinh, _cosh, _tanh, _atan2,
+                 _hypot)
+
+
+def _broadcast_shapes(*shapes):
+    """ Get the shape that the given shapes broadcast to, following the
+    numpy broadcasting rules.
+    """
+    ndim = max([len(s) for s in shapes])
+    result = [1] * ndim
+    for shape in shapes:
+        for axis, n in enumerate(shape, ndim - len(shape)):
+            if n == result[axis] or n == 1:
+                continue
+            elif result[axis] == 1:
+                result[axis] = n
+            else:
+                raise ValueError('operands could not be broadcast together '
+                                 'with shapes %s' %
+                                 ' '.join([str(tuple(s)) for s in shapes]))
+    return tuple(result)
+
+
+def _shape_of(x):
+    return x._shape if isinstance(x, (ndarray, LazyArray)) else ()
+
+
+def _as_operand(x):
+    """ Turn x into something the elementwise engine can handle: an
+    ndarray or a Python scalar.
+    """
+    if isinstance(x, (ndarray, int, float)):
+        return x
+    elif isinstance(x, LazyArray):
+        return x.evaluate()
+    return array(x, copy=False)
+
+
+def _broadcast_operand(x, shape):
+    """ Get (data, offset, strides) to walk operand x as if it had the
+    given (broadcasted) shape. Strides are in elements, and are zero
+    for broadcasted dimensions. Scalars are a one-element list.
+    """
+    if not isinstance(x, ndarray):
+        return [x], 0, (0, ) * len(shape)
+    strides = [0] * (len(shape) - x.ndim)
+    for n, stride in zip(x._shape, x._strides):
+        strides.append(0 if n == 1 else stride // x._itemsize)
+    return x._data, x._offset, tuple(strides)
+
+
+def _row_offsets(shape, offsets, strides):
+    """ Generate the start offset of each operand for every row of the
+    given shape, i.e. for every index into all but the last axis.
+    """
+    if 0 in shape:
+        return
+    nops = len(offsets)
+    current = list(offsets)
+    yield current
+    counter = [0] * (len(shape) - 1)
+    axis = len(counter) - 1
+    while axis >= 0:
+        counter[axis] += 1
+        if counter[axis] < shape[axis]:
+            for j in xrange(nops):
+                current[j] += strides[j][axis]
+            yield current
+            axis = len(counter) - 1
+        else:
+            counter[axis] = 0
+            for j in xrange(nops):
+                current[j] -= strides[j][axis] * (shape[axis] - 1)
+            axis -= 1
+
+
+def _coalesce(shape, strides, order_by=None):
+    """ Simplify the shape and (element) strides of one or more operands
+    that are walked together, for fewer and longer runs. Dimensions of
+    size 1 are dropped, and adjacent dimensions are merged where the
+    strides of all operands allow. If order_by is given, the axes are
+    first sorted by the strides of that operand, for when the order in
+    which the elements are visited does not matter.
+    Returns (shape, strides).
+    """
+    axes = [i for i, n in enumerate(shape) if n != 1]
+    if order_by is not None:
+        axes.sort(key=lambda i: -abs(strides[order_by][i]))
+    newshape = []
+    newstrides = [[] for s in strides]
+    for i in axes:
+        n = shape[i]
+        if newshape and all([ns[-1] == s[i] * n
+                             for ns, s in zip(newstrides, strides)]):
+            newshape[-1] *= n
+            for ns, s in zip(newstrides, strides):
+                ns[-1] = s[i]
+        else:
+            newshape.append(n)
+            for ns, s in zip(newstrides, strides):
+                ns.append(s[i])
+    if not newshape:
+        return (1, ), [(1, ) for s in strides]
+    return tuple(newshape), [tuple(ns) for ns in newstrides]
+
+
+def _runs(shape, strides, offset, order_by=None):
+    """ Generate (offset, count, step) for the runs of the buffer that
+    make up the elements of an array with the given shape, (element)
+    strides and offset. The runs are in C order, unless order_by is 0.
+    """
+    shape, (strides, ) = _coalesce(shape, [strides], order_by)
+    n, step = shape[-1], strides[-1]
+    for row in _row_offsets(shape, [offset], [strides]):
+        yield row[0], n, step
+
+
+def _run_slice(start, n, step):
+    stop = start + n * step
+    return slice(start, stop if stop >= 0 else None, step)
+
+
+def _read_run(data, start, n, step):
+    """ Get n elements from data, starting at start with the given step.
+    """
+    if step == 0:
+        return [data[start]] * n
+    return data[_run_slice(start, n, step)]
+
+
+def _result_dtype(op, *operands):
+    """ Get the dtype of the result of an elementwise operation.
+    """
+    if op in _bool_ops:
+        return 'bool'
+    dtype = result_type(*operands)
+    if op in _floating_ops and _dtype_descrs[dtype].kind != 'f':
+        # Like numpy, true division of integers always gives float64
+        dtype = 'float64' if op is operator.truediv else _float_results[dtype]
+    return dtype
+
+
+def _check_out_cast(dtype, out):
+    """ Check that the result dtype can be written to the output array,
+    using numpy's default casting rule for outputs.
+    """
+    if not can_cast(dtype, out._dtype, 'same_kind'):
+        raise TypeError("Cannot cast result from %r to %r with casting "
+                        "rule 'same_kind'" % (dtype, out.dtype))
+
+
+def _same_memory(a, b):
+    """ Get whether the two arrays share their underlying buffer.
+    """
+    base_a = a if a._base is None else a._base
+    base_b = b if b._base is None else b._base
+    return base_a is base_b
+
+
+def _elementwise(op, operands, dtype=None, out=None, where=True):
+    """ Apply op elementwise to the broadcasted operands (ndarrays or
+    scalars) and return the result. If out is given, the result is
+    written to it, otherwise a new array is created. If where is given,
+    it is broadcasted as well, and op is only applied where it is True;
+    elsewhere the output keeps its value.
+
+    The operands are walked row by row, where each row is taken from
+    the underlying buffer with a single (strided) slice, so that no
+    intermediate views or flattened copies are created.
+    """
+    if [x for x in operands if isinstance(x, ChunkedArray)]:
+        # The result is chunked as well, and computed per chunk
+        return _chunked_elementwise(op, operands, dtype, out, where)
+    operands = [_as_operand(x) for x in operands]
+    if op is operator.invert:
+        # The invert ufunc only knows its op here, see _invert_op
+        op = _invert_op(result_type(*operands))
+    if dtype is None:
+        dtype = _result_dtype(op, *operands)
+    nin = len(operands)
+    if where is not True:
+        operands.append(_as_operand(where))
+    shape = _broadcast_shapes(*[_shape_of(x) for x in operands])
+    if out is None:
+        out = empty(shape, dtype)
+    else:
+        if _broadcast_shapes(shape, out._shape) != out._shape:
+            raise ValueError('non-broadcastable output operand with shape '
+                             '%s does not match the broadcast shape %s' %
+                             (out._shape, shape))
+        _check_out_cast(dtype, out)
+        shape = out._shape
+        # Inputs that overlap with the output (other than the output
+        # itself) would be overwritten while we still need them
+        for i, x in enumerate(operands):
+            if (isinstance(x, ndarray) and _same_memory(x, out) and not
+                    (x._offset == out._offset and x._shape == out._shape
+                     and x._strides == out._strides)):
+                operands[i] = x.copy()
+    walk = [_broadcast_operand(x, shape) for x in operands]
+    datas = [w[0] for w in walk]
+    offsets = [w[1] for w in walk] + [out._offset]
+    strides = [w[2] for w in walk]
+    strides.append(tuple([s // out._itemsize for s in out._strides]))
+    # Walk in the memory order of the output, with as long runs as we can
+    shape, strides = _coalesce(shape, strides, len(strides) - 1)
+    steps = [s[-1] for s in strides]
+    odata, ostep = out._data, steps[-1]
+    
+    def run_block(start, stop):
+        bshape = (stop - start, ) + shape[1:]
+        n = bshape[-1]
+        for row in _row_offsets(bshape, _block_offsets(offsets, strides,
+                                                       start), strides):
+            runs = [_read_run(datas[j], row[j], n, steps[j])
+                    for j in xrange(nin)]
+            if where is True:
+                values = list(map(op, *runs))
+            else:
+                mask = _read_run(datas[nin], row[nin], n, steps[nin])
+                old = _read_run(odata, row[-1], n, ostep)
+                values = [op(*args) if m else o
+                          for m, o, args in zip(mask, old, zip(*runs))]
+            _store(odata, _run_slice(row[-1], n, ostep), values)
+    
+    _run_blocks(run_block, shape[0], _size_for_shape(shape))
+    return out
+
+
+## Reduction engine
+
+
+def _normalize_axis(axis, ndim):
+    """ Turn an axis argument (None, int or tuple) into a sorted tuple
+    of non-negative ints.
+    """
+    if axis is None:
+        return tuple(range(ndim))
+    axes = axis if isinstance(axis, (tuple, list)) else (axis, )
+    result = []
+    for ax in axes:
+        ax = operator.index(ax)
+        if not -ndim <= ax < ndim:
+            raise ValueError('axis %i is out of bounds for array of '
+                             'dimension %i' % (ax, ndim))
+        ax = ax % ndim
+        if ax in result:
+            raise ValueError('duplicate value in "axis"')
+        result.append(ax)
+    return tuple(sorted(result))
+
+
+def _index_offsets(shape, offsets, strides):
+    """ Generate the offsets of each operand for every element of the
+    given shape (in C order), strides in elements.
+    """
+    return _row_offsets(tuple(shape) + (1, ), offsets,
+                        [tuple(s) + (0, ) for s in strides])
+
+
+# Maximum number of values in a run that is read at once by reductions
+_reduce_chunksize = 8192
+
+
+def _lane_runs(datas, offsets, shape, strides):
+    """ Generate the runs (lists of values) that make up the elements
+    of the given shape, for each operand with its own data, offset
+    and (element) strides.
+    """
+    n = shape[-1] if shape else 1
+    steps = [s[-1] if s else 1 for s in strides]
+    nops = len(datas)
+    chunk = _reduce_chunksize
+    for row in _row_offsets(shape, offsets, strides):
+        # Long runs are split, so that we never hold too many values
+        for i in xrange(0, n, chunk):
+            m = min(chunk, n - i)
+            yield [_read_run(datas[j], row[j] + i * steps[j], m, steps[j])
+                   for j in xrange(nops)]
+
+
+def _reduce(a, run_func, combine, axis=None, keepdims=False, dtype=None,
+            out=None, where=True):
+    """ Reduce array a over the given axes. Each output element (lane)
+    is computed as combine(partials), where partials are the results of
+    run_func on the strided runs of the buffer that make up the lane.
+    If where is given, only the elements where it is True are included.
+    Returns a scalar if the result is 0-dimensional and out is None.
+    """
+    axes = _normalize_axis(axis, a.ndim)
+    walk = [(a._data, a._offset, [s // a._itemsize for s in a._strides])]
+    if where is not True:
+        mask = _as_operand(where)
+        if _broadcast_shapes(_shape_of(mask), a._shape) != a._shape:
+            raise ValueError('where of shape %s cannot be broadcast to %s' %
+                             (_shape_of(mask), a._shape))
+        walk.append(_broadcast_operand(mask, a._shape))
+    kept = [i for i in range(a.ndim) if i not in axes]
+    kshape = [a._shape[i] for i in kept]
+    rshape = tuple([a._shape[i] for i in axes])
+    datas = [w[0] for w in walk]
+    kstrides = [[w[2][i] for i in kept] for w in walk]
+    rstrides = [tuple([w[2][i] for i in axes]) for w in walk]
+    # Coalesce dims; kept and reduced dims are each walked in C order
+    kshape_c, kstrides = _coalesce(kshape, kstrides)
+    rshape, rstrides = _coalesce(rshape, rstrides)
+    
+    def lane_partials(offsets, rstart, rstop):
+        # The results of run_func for the runs of a block of a lane
+        bshape = (rstop - rstart, ) + rshape[1:]
+        runs = _lane_runs(datas, _block_offsets(offsets, rstrides, rstart),
+                          bshape, rstrides)
+        if where is True:
+            return [run_func(r[0]) for r in runs]
+        runs = [[x for x, m in zip(r, mr) if m] for r, mr in runs]
+        return [run_func(run) for run in runs if run]
+    
+    offsets = [w[1] for w in walk]
+    size = _size_for_shape(a._shape)
+    if _size_for_shape(kshape_c) == 1:
+        # A single lane: split its runs over blocks, and combine the
+        # partials in order. Blocks of a 1-D lane are aligned to the
+        # chunks, so that the partials do not depend on the blocks.
+        align = _reduce_chunksize if len(rshape) == 1 else 1
+        blocks = _run_blocks(lambda start, stop: lane_partials(offsets,
+                                                               start, stop),
+                             rshape[0], size, align)
+        results = [combine(list(chain(*blocks)))]
+    else:
+        def lanes(start, stop):
+            bshape = (stop - start, ) + kshape_c[1:]
+            return [combine(lane_partials(lane, 0, rshape[0])) for lane in
+                    _index_offsets(bshape, _block_offsets(offsets, kstrides,
+                                                          start), kstrides)]
+        results = list(chain(*_run_blocks(lanes, kshape_c[0], size)))
+    if keepdims:
+        kshape = [1 if i in axes else a._shape[i] for i in range(a.ndim)]
+    if out is None:
+        if not kshape:
+            return results[0]
+        out = empty(kshape, dtype or a.dtype)
+        _store(out._data, slice(None), results)
+        return out
+    # Write to given output array
+    dtype = dtype or a.dtype
+    if out.shape != tuple(kshape):
+        raise ValueError('output array has shape %s, expected %s' %
+                         (out.shape, tuple(kshape)))
+    _check_out_cast(dtype, out)
+    if kshape:
+        out[:] = results
+    else:
+        out._data[out._offset] = results[0]
+    return out
+
+
+def _accumulated(op, values):
+    it = iter(values)
+    try:
+        acc = next(it)
+    except StopIteration:
+        return []
+    result = [acc]
+    for x in it:
+        acc = op(acc, x)
+        result.append(acc)
+    return result
+
+
+def _prod(values):
+    p = 1
+    for x in values:
+        p *= x
+    return p
+
+
+def _moments(values):
+    """ Get (count, mean, sum of squared deviations) for a list of values.
+    """
+    n = len(values)
+    if not n:
+        return 0, 0.0, 0.0
+    m = sum(values) / n
+    return n, m, sum([(x - m) * (x - m) for x in values])
+
+
+def _combine_moments(parts):
+    """ Combine moments of partial sequences (Chan et al.).
+    """
+    n, m, m2 = 0, 0.0, 0.0
+    for nb, mb, m2b in parts:
+        if not nb:
+            continue
+        delta = mb - m
+        nn = n + nb
+        m += delta * nb / nn
+        m2 += m2b + delta * delta * n * nb / nn
+        n = nn
+    return n, m, m2
+
+
+def _arg_best(better):
+    """ Get a combine function that finds the index of the best value
+    in a sequence of runs.
+    """
+    def combine(runs):
+        best, best_index, index = None, -1, 0
+        for run in runs:
+            for i, x in enumerate(run):
+                if best_index < 0 or better(x, best):
+                    best, best_index = x, index + i
+            index += len(run)
+        if best_index < 0:
+            raise ValueError('attempt to get argmax/argmin of an empty '
+                             'sequence')
+        return best_index
+    return combine
+
+
+def _sum_dtype(dtype):
+    kind = _dtype_descrs[dtype].kind
+    return dtype if kind == 'f' else 'uint64' if kind == 'u' else 'int64'
+
+
+def _mean_dtype(dtype):
+    return dtype if dtype.startswith('float') else 'float64'
+
+
+def _lane_map(src, out, axis, func):
+    """ Write func(lane) to each lane of out along the given axis, where
+    lane is the corresponding run of values of src. The runs are read
+    and written as (strided) slices of the buffers.
+    """
+    n = src._shape[axis]
+    kshape = src._shape[:axis] + src._shape[axis + 1:]
+    estrides, ostrides = list(src._estrides), list(out._estrides)
+    step, ostep = estrides.pop(axis), ostrides.pop(axis)
+    for offset, ooffset in _index_offsets(kshape,
+                                          [src._offset, out._offset],
+                                          [estrides, ostrides]):
+        _store(out._data, _run_slice(ooffset, n, ostep),
+               func(_read_run(src._data, offset, n, step)))
+
+
+## Sorting engine
+
+
+def _has_nan(values):
+    return True in map(math.isnan, values)
+
+
+def _nan_last(x):
+    return x != x, x
+
+
+def _sort_lane(values, isfloat):
+    """ Sorted list of the values, with NaNs at the end.
+    """
+    if isfloat and _has_nan(values):
+        return sorted(values, key=_nan_last)
+    return sorted(values)
+
+
+def _argsort_lane(values, isfloat):
+    """ Indices that would sort the values (stable), NaNs at the end.
+    """
+    values = list(values)
+    key = values.__getitem__
+    if isfloat and _has_nan(values):
+        key = lambda i: _nan_last(values[i])
+    return sorted(xrange(len(values)), key=key)
+
+
+def _partition_lane(values, kth, isfloat, indices=False):
+    """ Partition the values (or their indices), such that the elements
+    at the positions in kth are where they would be in the sorted lane,
+    with no larger elements before and no smaller elements after them.
+    A single kth is selected with heapq in O(n log k) followed by a
+    linear three-way split; otherwise the lane is sorted.
+    """
+    values = list(values)
+    n = len(values)
+    if len(kth) != 1 or (isfloat and _has_nan(values)):
+        if indices:
+            return _argsort_lane(values, isfloat)
+        return _sort_lane(values, isfloat)
+    k = kth[0]
+    if k < n // 2:
+        pivot = heapq.nsmallest(k + 1, values)[-1]
+    else:
+        pivot = heapq.nlargest(n - k, values)[-1]
+    if indices:
+        items = list(enumerate(values))
+        return ([i for i, x in items if x < pivot] +
+                [i for i, x in items if x == pivot] +
+                [i for i, x in items if x > pivot])
+    return ([x for x in values if x < pivot] +
+            [x for x in values if x == pivot] +
+            [x for x in values if x > pivot])
+
+
+def _normalize_kth(kth, n):
+    kth = kth if isinstance(kth, (tuple, list)) else [kth]
+    result = []
+    for k in kth:
+        k = operator.index(k)
+        if not -n <= k < n:
+            raise ValueError('kth(=%i) out of bounds (%i)' % (k, n))
+        result.append(k % n)
+    return sorted(set(result))
+
+
+## Matrix multiplication engine
+
+# Number of columns of the result that are computed per pass over the
+# rows of A, so that this block of B's columns stays hot in the cache
+_matmul_block = 64
+
+
+def _core_operand(x, vector_axis, nbatch):
+    """ Get (data, offset, batch strides, core strides) of x as an
+    operand to matmul, with strides in elements. Batch strides are
+    right-aligned to nbatch dims and zero where broadcasted. A 1-D x
+    gets a zero core stride at vector_axis.
+    """
+    strides = [s // x._itemsize for s in x._strides]
+    if x.ndim == 1:
+        strides.insert(vector_axis, 0)
+    shape = x._shape[:-2]
+    bstrides = [0] * (nbatch - len(shape))
+    for n, stride in zip(shape, strides[:-2]):
+        bstrides.append(0 if n == 1 else stride)
+    return x._data, x._offset, bstrides, strides[-2:]
+
+
+def _matmul_columns(b, k, m):
+    """ Read the m columns of a (k, m) matrix B (i.e. the rows of B
+    transposed) as lists. b is (data, offset, row stride, column
+    stride) in elements.
+    """
+    bdata, boffset, bs0, bs1 = b
+    return [_read_run(bdata, boffset + j * bs1, k, bs0) for j in xrange(m)]
+
+
+def _matmul_kernel(a, bcols, out, n, k, m):
+    """ Compute out = A @ B for one (n, k) x (k, m) pair, with the
+    columns of B as given by _matmul_columns. Each of a and out is
+    (data, offset, row stride, column stride) in elements.
+
+    The rows of A are read once as runs, after which every element of
+    the result is a single sum over two contiguous lists. The result
+    is computed in blocks of columns, each written as a strided run.
+    """
+    adata, aoffset, as0, as1 = a
+    odata, ooffset, os0, os1 = out
+    mul = operator.mul
+    arows = [_read_run(adata, aoffset + i * as0, k, as1) for i in xrange(n)]
+    if m == 1:
+        # Matrix-vector: the whole result column in one go
+        col = bcols[0]
+        _store(odata, _run_slice(ooffset, n, os0),
+               [sum(map(mul, row, col)) for row in arows])
+        return
+    for j0 in xrange(0, m, _matmul_block):
+        cols = bcols[j0:j0 + _matmul_block]
+        start = ooffset + j0 * os1
+        for row in arows:
+            _store(odata, _run_slice(start, len(cols), os1),
+                   [sum(map(mul, row, col)) for col in cols])
+            start += os0
+
+
+def _matmul(operands, batch, n, k, m):
+    """ Compute the (batches of) matrix products out = A @ B, where
+    operands is [a, b, out], each as returned by _core_operand. The
+    batch shape is walked in C order. If B is broadcast across the
+    batch, the columns of each distinct B matrix are read only once.
+    """
+    datas = [x[0] for x in operands]
+    cores = [tuple(x[3]) for x in operands]
+    cache = None
+    if any(s == 0 and d > 1 for s, d in zip(operands[1][2], batch)):
+        cache = {}  # B offset -> columns
+    for offsets in _index_offsets(batch, [x[1] for x in operands],
+                                  [x[2] for x in operands]):
+        a, b, out = [(datas[j], offsets[j]) + cores[j] for j in range(3)]
+        if cache is None:
+            bcols = _matmul_columns(b, k, m)
+        else:
+            bcols = cache.get(offsets[1])
+            if bcols is None:
+                bcols = cache[offsets[1]] = _matmul_columns(b, k, m)
+        _matmul_kernel(a, bcols, out, n, k, m)
+
+
+## Basic indexing
+
+# LRU cache of index plans. A plan is what indexing with a certain key
+# does to an array with a certain shape and strides. Integer indices
+# are parameters of the plan rather than part of its key, so that e.g.
+# ``a[i, ::2]`` needs just one plan for all i.
+_index_cache = OrderedDict()
+_index_cache_maxsize = 512
+_index_cache_stats = [0, 0]  # hits, misses
+
+
+def index_cache_info():
+    """ Get a dict with the hits, misses, maxsize and currsize of the
+    cache of index plans, that is used for basic indexing.
+    """
+    return dict(hits=_index_cache_stats[0], misses=_index_cache_stats[1],
+                maxsize=_index_cache_maxsize, currsize=len(_index_cache))
+
+
+def index_cache_clear():
+    """ Clear the cache of index plans and reset its statistics.
+    """
+    _index_cache.clear()
+    _index_cache_stats[:] = [0, 0]
+
+
+def _make_index_plan(signature, shape, strides, itemsize):
+    """ Create the plan for a key signature, in which slices are given
+    as (start, stop, step) and integer indices as 0. Returns (offset,
+    shape, strides, params), where params has (size, element stride,
+    axis) for each integer index, which add index * element stride to
+    the offset.
+    """
+    axis = 0
+    offset = 0
+    newshape, newstrides, params = [], [], []
+    for k in signature:
+        if k is not None and axis >= len(shape):
+            raise IndexError('too many indices for array')
+        if k == 0:
+            params.append((shape[axis], strides[axis] // itemsize, axis))
+            axis += 1
+        elif k is None:
+            newshape.append(1)
+            stride = 1
+            for s in strides[axis:]:
+                stride *= s
+            newstrides.append(stride)
+        else:
+            start, stop, step = slice(*k).indices(shape[axis])
+            newshape.append(max(0, _ceildiv(stop - start, step)))
+            newstrides.append(step * strides[axis])
+            offset += start * strides[axis] // itemsize
+            axis += 1
+    newshape.extend(shape[axis:])
+    newstrides.extend(strides[axis:])
+    return offset, tuple(newshape), tuple(newstrides), tuple(params)
+
+
+def _index_plan(signature, shape, strides, itemsize):
+    """ Get the (cached) plan for a key signature, see _make_index_plan.
+    """
+    cache_key = signature, shape, strides, itemsize
+    plan = _index_cache.get(cache_key)
+    if plan is None:
+        _index_cache_stats[1] += 1
+        plan = _make_index_plan(signature, shape, strides, itemsize)
+        if len(_index_cache) >= _index_cache_maxsize:
+            _index_cache.popitem(last=False)
+        _index_cache[cache_key] = plan
+    else:
+        _index_cache_stats[0] += 1
+        try:
+            _index_cache.move_to_end(cache_key)
+        except AttributeError:  # Python 2
+            _index_cache[cache_key] = _index_cache.pop(cache_key)
+        except KeyError:
+            pass  # Evicted by another thread
+    return plan
+
+
+## Advanced indexing engine
+
+
+def _is_advanced_key(key):
+    """ Get whether key contains index arrays or masks (as ndarray or
+    list), so that it needs advanced indexing.
+    """
+    if isinstance(key, tuple):
+        for k in key:
+            if isinstance(k, (ndarray, list)):
+                return True
+        return False
+    return isinstance(key, (ndarray, list))
+
+
+def _same(x):
+    return x
+
+
+def _index_offset_func(offset, sizes, strides):
+    """ Get a function that maps the indices into the given axes to an
+    element offset, checking bounds and wrapping negative indices.
+    """
+    def index_offset(*indices):
+        o = offset
+        for axis, i in enumerate(indices):
+            n = sizes[axis]
+            if i < 0:
+                i += n
+            if not 0 <= i < n:
+                raise IndexError('index %i is out of bounds for axis with '
+                                 'size %i' % (indices[axis], n))
+            o += i * strides[axis]
+        return o
+    return index_offset
+
+
+def _gather(data, offsets, shape, strides):
+    """ Get the values of the blocks with the given shape and (element)
+    strides, that start at each of the offsets. Each block is read as
+    strided runs of the buffer.
+    """
+    if not shape:
+        return [data[o] for o in offsets]
+    shape, (strides, ) = _coalesce(shape, [strides])
+    values = []
+    n, step = shape[-1], strides[-1]
+    if len(shape) == 1 and step > 0:
+        span = n * step
+        for o in offsets:
+            values.extend(data[o:o + span:step])
+        return values
+    for o in offsets:
+        for row in _row_offsets(shape, [o], [strides]):
+            values.extend(_read_run(data, row[0], n, step))
+    return values
+
+
+def _scatter(data, offsets, shape, strides, values):
+    """ Write values to the blocks with the given shape and (element)
+    strides, that start at each of the offsets. The inverse of _gather.
+    """
+    if not shape:
+        for o, value in zip(offsets, values):
+            data[o] = value
+        return
+    shape, (strides, ) = _coalesce(shape, [strides])
+    n, step = shape[-1], strides[-1]
+    i = 0
+    for o in offsets:
+        for row in _row_offsets(shape, [o], [strides]):
+            _store(data, _run_slice(row[0], n, step), values[i:i + n])
+            i += n
+
 
 ## Public functions
 
@@ -214,6 +1518,10 @@ def array(obj, dtype=None, copy=True, order=None):
     """
     dtype = _convert_dtype(dtype)
     
+    if isinstance(obj, LazyArray):
+        # Evaluating creates a new array, unless obj is just a wrapper
+        copy = copy and obj._op is None
+        obj = obj.evaluate()
     if isinstance(obj, ndarray):
         # From existing array
         a = obj.view()
@@ -229,13 +1537,11 @@ def array(obj, dtype=None, copy=True, order=None):
         # Get dtype
         dtype_orig = _convert_dtype(D['typestr'][1:])
         # Create array
-        if D['strides']:
-            itemsize = int(D['typestr'][-1])
-            bufsize = D['strides'][0] * D['shape'][0] // itemsize
-        else:
-            bufsize = _size_for_shape(D['shape'])
+        itemsize = int(D['typestr'][-1])
+        strides = D['strides'] or _strides_for_shape(D['shape'], itemsize)
+        bufsize = _buffer_size(D['shape'], strides, itemsize)
         
-        BufType = (_convert_dtype(dtype_orig, 'ctypes') * bufsize)
+        BufType = _buffer_type(_convert_dtype(dtype_orig, 'ctypes'), bufsize)
         buffer = BufType.from_address(D['data'][0])
         a = ndarray(D['shape'], dtype_orig,
                     buffer=buffer, strides=D['strides'], order=order)
@@ -245,160 +1551,832 @@ def array(obj, dtype=None, copy=True, order=None):
         elif copy:
             a = a.copy()
         return a
-    else:
-        # From some kind of iterable
-        shape = _shape_from_object(obj)
-        # Try to derive dtype
+    flat = _flatten_object(obj)
+    if flat is not None:
+        # From a regular nested list, fill the buffer in one go
+        shape, elements = flat
+        dtypes = [dtype]
         if dtype is None:
-            el = obj
-            while isinstance(el, (tuple, list)) and el:
-                el = el[0]
-            if isinstance(el, int):
-                dtype = 'int64'
-        # Create array
-        a = ndarray(shape, dtype, order=None)
-        _assign_from_object(a, obj)
+            if elements and (elements[0] is True or elements[0] is False):
+                if all([x is True or x is False for x in elements]):
+                    dtypes = ['bool']
+                else:
+                    dtypes = ['int64', 'float64']
+            elif elements and isinstance(elements[0], int):
+                dtypes = ['int64', 'float64']  # ints, unless floats follow
+                if max(elements) >= 2**63 or min(elements) < -2**63:
+                    dtypes = ['float64']  # ints too large for int64
+            else:
+                dtypes = ['float64']
+        for dt in dtypes:
+            a = ndarray(shape, dt)
+            try:
+                _store(a._data, slice(None), elements)
+            except (TypeError, OverflowError):
+                continue  # Try next dtype, or the generic path below
+            return a
+    # From some kind of (ragged) iterable
+    shape = _shape_from_object(obj)
+    # Try to derive dtype
+    if dtype is None:
+        el = obj
+        while isinstance(el, (tuple, list)) and el:
+            el = el[0]
+        if isinstance(el, int):
+            dtype = 'int64'
+    # Create array
+    a = ndarray(shape, dtype, order=None)
+    _assign_from_object(a, obj)
+    return a
+
+
+def zeros_like(a, dtype=None, order=None):
+    """ Return an array of zeros with the same shape and type as a given array.
+    """
+    dtype = a.dtype if dtype is None else dtype
+    return zeros(a.shape, dtype, order)
+
+
+def ones_like(a, dtype=None, order=None):
+    """ Return an array of ones with the same shape and type as a given array.
+    """
+    dtype = a.dtype if dtype is None else dtype
+    return ones(a.shape, dtype, order)
+
+
+def empty_like(a, dtype=None, order=None):
+    """ Return a new array with the same shape and type as a given array.
+    """
+    dtype = a.dtype if dtype is None else dtype
+    return empty(a.shape, dtype, order)
+
+
+def zeros(shape, dtype=None, order=None):
+    """Return a new array of given shape and type, filled with zeros
+    """
+    return empty(shape, dtype, order)
+
+
+def ones(shape, dtype=None, order=None):
+    """Return a new array of given shape and type, filled with ones
+    """
+    a = empty(shape, dtype, order)
+    a.fill(1)
+    return a
+
+
+def eye(size):
+    """Return a new 2d array with given dimensions, filled with ones on the
+    diagonal and zeros elsewhere.
+    """
+    a = zeros((size,size))
+    for i in xrange(size):
+        a[i,i] = 1
+    return a
+
+
+def empty(shape, dtype=None, order=None):
+    """Return a new array of given shape and type, without initializing entries
+    """
+    return ndarray(shape, dtype, order=order)
+
+
+def arange(*args, **kwargs):
+    """ arange([start,] stop[, step,], dtype=None)
+
+    Return evenly spaced values within a given interval.
+    
+    Values are generated within the half-open interval ``[start, stop)``
+    (in other words, the interval including `start` but excluding `stop`).
+    For integer arguments the function is equivalent to the Python built-in
+    `range <http://docs.python.org/lib/built-in-funcs.html>`_ function,
+    but returns an ndarray rather than a list.
+
+    When using a non-integer step, such as 0.1, the results will often not
+    be consistent.  It is better to use ``linspace`` for these cases.
+    """
+    # Get dtype
+    dtype = kwargs.pop('dtype', None)
+    if kwargs:
+        x = list(kwargs.keys())[0]
+        raise TypeError('arange() got an unexpected keyword argument %r' % x)
+    # Parse start, stop, step
+    if len(args) == 0:
+        raise TypeError('Required argument "start" not found')
+    elif len(args) == 1:
+        start, stop, step = 0, int(args[0]), 1
+    elif len(args) == 2:
+        start, stop, step = int(args[0]), int(args[1]), 1
+    elif len(args) == 3:
+        start, stop, step = int(args[0]), int(args[1]), int(args[2])
+    else:
+        raise TypeError('Too many input arguments')
+    # Init
+    iter = xrange(start, stop, step)
+    a = empty((len(iter),), dtype=dtype)
+    a[:] = list(iter)
+    return a
+
+
+def linspace(start, stop, num=50, endpoint=True, retstep=False, dtype=None):
+    """ linspace(start, stop, num=50, endpoint=True, retstep=False, dtype=None)
+    
+    Return evenly spaced numbers over a specified interval. Returns num
+    evenly spaced samples, calculated over the interval [start, stop].
+    The endpoint of the interval can optionally be excluded.
+    """
+    # Prepare
+    start, stop = float(start), float(stop)
+    ra = stop - start
+    if endpoint:
+        step = ra / (num-1)
+    else:
+        step = ra / num
+    # Create
+    a = empty((num,), dtype)
+    a[:] = [start + i * step for i in xrange(num)]
+    # Return
+    if retstep:
+        return a, step
+    else:
         return a
 
+## Universal functions
+
+
+def _make_ufunc(name, op, nin):
+    """ Create a function that applies op elementwise to nin operands,
+    with numpy's out, where and dtype keyword arguments. The output
+    may also be given as an extra positional argument.
+    """
+    def ufunc(*args, **kwargs):
+        if not nin <= len(args) <= nin + 1:
+            raise TypeError('%s() takes %i positional arguments (%i given)' %
+                            (name, nin, len(args)))
+        out = args[nin] if len(args) > nin else kwargs.pop('out', None)
+        where = kwargs.pop('where', True)
+        dtype = _convert_dtype(kwargs.pop('dtype', None))
+        if kwargs:
+            raise TypeError('%s() got an unexpected keyword argument %r' %
+                            (name, list(kwargs)[0]))
+        if isinstance(out, tuple):
+            out, = out
+        result = _elementwise(op, args[:nin], dtype, out, where)
+        if out is None and not result._shape:
+            return result._data[result._offset]
+        return result
+    ufunc.__name__ = name
+    ufunc.__doc__ = """ %s(%s, out=None, where=True, dtype=None)
+    
+    Apply %s elementwise. If out is given, the result is written to it
+    (and returned). If where is given, only elements where it is True
+    are computed; elsewhere out keeps its value.
+    """ % (name, ', '.join(['x%i' % (i + 1) for i in range(nin)]), name)
+    return ufunc
+
+
+add = _make_ufunc('add', operator.add, 2)
+subtract = _make_ufunc('subtract', operator.sub, 2)
+multiply = _make_ufunc('multiply', operator.mul, 2)
+divide = _make_ufunc('divide', operator.truediv, 2)
+true_divide = _make_ufunc('true_divide', operator.truediv, 2)
+floor_divide = _make_ufunc('floor_divide', operator.floordiv, 2)
+mod = _make_ufunc('mod', operator.mod, 2)
+remainder = _make_ufunc('remainder', operator.mod, 2)
+power = _make_ufunc('power', operator.pow, 2)
+maximum = _make_ufunc('maximum', _maximum, 2)
+minimum = _make_ufunc('minimum', _minimum, 2)
+arctan2 = _make_ufunc('arctan2', _atan2, 2)
+hypot = _make_ufunc('hypot', _hypot, 2)
+
+equal = _make_ufunc('equal', operator.eq, 2)
+not_equal = _make_ufunc('not_equal', operator.ne, 2)
+less = _make_ufunc('less', operator.lt, 2)
+less_equal = _make_ufunc('less_equal', operator.le, 2)
+greater = _make_ufunc('greater', operator.gt, 2)
+greater_equal = _make_ufunc('greater_equal', operator.ge, 2)
+logical_and = _make_ufunc('logical_and', _logical_and, 2)
+logical_or = _make_ufunc('logical_or', _logical_or, 2)
+logical_xor = _make_ufunc('logical_xor', _logical_xor, 2)
+logical_not = _make_ufunc('logical_not', operator.not_, 1)
+bitwise_and = _make_ufunc('bitwise_and', operator.and_, 2)
+bitwise_or = _make_ufunc('bitwise_or', operator.or_, 2)
+bitwise_xor = _make_ufunc('bitwise_xor', operator.xor, 2)
+invert = _make_ufunc('invert', operator.invert, 1)
+
+negative = _make_ufunc('negative', operator.neg, 1)
+positive = _make_ufunc('positive', operator.pos, 1)
+absolute = _make_ufunc('absolute', abs, 1)
+sign = _make_ufunc('sign', _sign, 1)
+square = _make_ufunc('square', _square, 1)
+floor = _make_ufunc('floor', _floor, 1)
+ceil = _make_ufunc('ceil', _ceil, 1)
+sqrt = _make_ufunc('sqrt', _sqrt, 1)
+exp = _make_ufunc('exp', _exp, 1)
+log = _make_ufunc('log', _log, 1)
+log10 = _make_ufunc('log10', _log10, 1)
+sin = _make_ufunc('sin', _sin, 1)
+cos = _make_ufunc('cos', _cos, 1)
+tan = _make_ufunc('tan', _tan, 1)
+arcsin = _make_ufunc('arcsin', _asin, 1)
+arccos = _make_ufunc('arccos', _acos, 1)
+arctan = _make_ufunc('arctan', _atan, 1)
+sinh = _make_ufunc('sinh', _sinh, 1)
+cosh = _make_ufunc('cosh', _cosh, 1)
+tanh = _make_ufunc('tanh', _tanh, 1)
+
+
+def clip(a, a_min=None, a_max=None, out=None):
+    """ Limit the values in the array to the interval [a_min, a_max].
+    """
+    return array(a, copy=False).clip(a_min, a_max, out)
+
+
+## Reductions
+
+# Module-level versions of the ndarray reductions. There is no sum,
+# min, max, all or any here, because these would shadow the builtins
+# that this module relies on; use the methods, or amin and amax.
+
+
+def prod(a, axis=None, dtype=None, out=None, keepdims=False, where=True):
+    return array(a, copy=False).prod(axis, dtype, out, keepdims, where)
+
+
+def mean(a, axis=None, dtype=None, out=None, keepdims=False, where=True):
+    return array(a, copy=False).mean(axis, dtype, out, keepdims, where)
+
+
+def var(a, axis=None, dtype=None, out=None, ddof=0, keepdims=False,
+        where=True):
+    return array(a, copy=False).var(axis, dtype, out, ddof, keepdims, where)
+
+
+def std(a, axis=None, dtype=None, out=None, ddof=0, keepdims=False,
+        where=True):
+    return array(a, copy=False).std(axis, dtype, out, ddof, keepdims, where)
+
+
+def amin(a, axis=None, out=None, keepdims=False, where=True):
+    return array(a, copy=False).min(axis, out, keepdims, where)
+
+
+def amax(a, axis=None, out=None, keepdims=False, where=True):
+    return array(a, copy=False).max(axis, out, keepdims, where)
+
+
+def ptp(a, axis=None, out=None, keepdims=False):
+    return array(a, copy=False).ptp(axis, out, keepdims)
+
+
+def argmin(a, axis=None, out=None, keepdims=False):
+    return array(a, copy=False).argmin(axis, out, keepdims)
+
+
+def argmax(a, axis=None, out=None, keepdims=False):
+    return array(a, copy=False).argmax(axis, out, keepdims)
+
+
+def cumsum(a, axis=None, dtype=None, out=None):
+    return array(a, copy=False).cumsum(axis, dtype, out)
+
+
+def cumprod(a, axis=None, dtype=None, out=None):
+    return array(a, copy=False).cumprod(axis, dtype, out)
+
+
+## Sorting and searching
+
+
+def sort(a, axis=-1, kind=None, order=None):
+    """ Get a sorted copy of the array. With axis None, the array is
+    flattened first.
+    """
+    a = array(a, copy=False).flatten() if axis is None else array(a)
+    a.sort(-1 if axis is None else axis, kind, order)
+    return a
+
+
+def argsort(a, axis=-1, kind=None, order=None):
+    return array(a, copy=False).argsort(axis, kind, order)
+
+
+def partition(a, kth, axis=-1, kind=None, order=None):
+    """ Get a partitioned copy of the array. With axis None, the array
+    is flattened first.
+    """
+    a = array(a, copy=False).flatten() if axis is None else array(a)
+    a.partition(kth, -1 if axis is None else axis, kind, order)
+    return a
+
+
+def argpartition(a, kth, axis=-1, kind=None, order=None):
+    return array(a, copy=False).argpartition(kth, axis, kind, order)
+
+
+def searchsorted(a, v, side='left', sorter=None):
+    return array(a, copy=False).searchsorted(v, side, sorter)
+
+
+## Set operations
+
+# These hash the values of the (flattened) arrays, so that each input is
+# walked in a single pass; the values are read in bulk from the buffer.
+
+
+def _array1d(values, dtype):
+    out = empty((len(values), ), dtype)
+    _store(out._data, slice(None), values)
+    return out
+
+
+def _set_values(ar):
+    """ Get the flattened values of ar (array-like) and its dtype.
+    """
+    ar = array(ar, copy=False)
+    return ar._toflatlist(), ar.dtype
+
+
+def _value_range(dtype):
+    """ For bool and integer dtypes of at most 16 bits, get (lo, size)
+    of the range of values, which is small enough for lookup tables
+    (lists indexed by value; negative values index from the end). For
+    other dtypes, None is returned.
+    """
+    descr = _dtype_descrs[dtype]
+    if descr.kind not in 'biu' or descr.itemsize > 2:
+        return None
+    size = 1 << (8 * descr.itemsize)
+    return (-(size // 2) if descr.kind == 'i' else 0), size
+
+
+def _value_table(dtype, items):
+    """ For the dtypes of _value_range, get a list that is True at the
+    index of each item. For other dtypes, None is returned.
+    """
+    span = _value_range(dtype)
+    if span is None:
+        return None
+    lo, size = span
+    table = [False] * size
+    for x in items:
+        if x == x and lo <= x < lo + size and x == int(x):
+            table[int(x)] = True
+    return table
+
+
+def _sorted_unique(values, dtype):
+    """ Sorted list of the distinct values, with a single NaN at the end.
+    """
+    if _dtype_descrs[dtype].kind == 'f' and _has_nan(values):
+        return sorted(set([x for x in values if x == x])) + [nan]
+    return sorted(set(values))
+
+
+def _unique_small(values, dtype, return_index, return_inverse,
+                  return_counts):
+    """ unique() for the dtypes of _value_range, which counts the values
+    in a table instead of hashing them.
+    """
+    lo, size = _value_range(dtype)
+    counts = [0] * size
+    for x in values:
+        counts[x] += 1
+    uniq = [x for x in xrange(lo, lo + size) if counts[x]]
+    result = [_array1d(uniq, dtype)]
+    if return_index:
+        first = [0] * size
+        for i in xrange(len(values) - 1, -1, -1):
+            first[values[i]] = i
+        result.append(_array1d([first[x] for x in uniq], 'int64'))
+    if return_inverse:
+        position = [0] * size
+        for i, x in enumerate(uniq):
+            position[x] = i
+        result.append(_array1d(list(map(position.__getitem__, values)),
+                               'int64'))
+    if return_counts:
+        result.append(_array1d([counts[x] for x in uniq], 'int64'))
+    return result[0] if len(result) == 1 else tuple(result)
+
+
+def unique(ar, return_index=False, return_inverse=False,
+           return_counts=False):
+    """ Find the sorted unique elements of the flattened array.
+    Optionally also return the indices of their first occurrences,
+    the indices that reconstruct the input from the unique values,
+    and the number of times that each unique value occurs.
+    """
+    values, dtype = _set_values(ar)
+    if _value_range(dtype) is not None:
+        return _unique_small(values, dtype, return_index, return_inverse,
+                             return_counts)
+    # When counting anyway, the keys of the counter are the distinct values
+    counter = Counter(values) if return_counts else None
+    uniq = _sorted_unique(list(counter) if counter else values, dtype)
+    result = [_array1d(uniq, dtype)]
+    hasnan = len(uniq) > 0 and uniq[-1] != uniq[-1]
+    if return_index:
+        # Later items win, so walking backwards keeps the first index
+        first = dict(zip(reversed(values), xrange(len(values) - 1, -1, -1)))
+        index = [first.get(x) for x in uniq]
+        if hasnan:
+            index[-1] = [x != x for x in values].index(True)
+        result.append(_array1d(index, 'int64'))
+    if return_inverse:
+        position = dict(zip(uniq, xrange(len(uniq))))
+        inverse = list(map(position.get, values))
+        if hasnan:
+            inverse = [len(uniq) - 1 if i is None else i for i in inverse]
+        result.append(_array1d(inverse, 'int64'))
+    if return_counts:
+        counts = list(map(counter.__getitem__, uniq))
+        if hasnan:
+            counts[-1] = [x != x for x in values].count(True)
+        result.append(_array1d(counts, 'int64'))
+    return result[0] if len(result) == 1 else tuple(result)
+
+
+def _membership(values, dtype, test_values):
+    """ Get a list of bools that says, for each value, whether it
+    occurs in test_values.
+    """
+    table = _value_table(dtype, test_values)
+    if table is not None:
+        return list(map(table.__getitem__, values))
+    return list(map(set(test_values).__contains__, values))
+
+
+def in1d(ar1, ar2, assume_unique=False, invert=False):
+    """ Test whether each element of the flattened ar1 is also in ar2.
+    """
+    values, dtype = _set_values(ar1)
+    found = _membership(values, dtype, _set_values(ar2)[0])
+    if invert:
+        found = [not x for x in found]
+    return _array1d(found, 'bool')
+
 
-def zeros_like(a, dtype=None, order=None):
-    """ Return an array of zeros with the same shape and type as a given array.
+def isin(element, test_elements, assume_unique=False, invert=False):
+    """ Test whether each element is in test_elements. The result has
+    the shape of element.
     """
-    dtype = a.dtype if dtype is None else dtype
-    return zeros(a.shape, dtype, order)
+    element = array(element, copy=False)
+    return in1d(element, test_elements, assume_unique,
+                invert).reshape(element.shape)
 
 
-def ones_like(a, dtype=None, order=None):
-    """ Return an array of ones with the same shape and type as a given array.
+def intersect1d(ar1, ar2, assume_unique=False, return_indices=False):
+    """ Find the sorted unique values that are in both arrays.
+    Optionally also return the indices of their first occurrences in
+    each of the (flattened) arrays.
     """
-    dtype = a.dtype if dtype is None else dtype
-    return ones(a.shape, dtype, order)
+    values1, dtype1 = _set_values(ar1)
+    values2, dtype2 = _set_values(ar2)
+    common = sorted(set(values1).intersection(values2))
+    out = _array1d(common, result_type(dtype1, dtype2))
+    if not return_indices:
+        return out
+    result = [out]
+    for values in (values1, values2):
+        first = dict(zip(reversed(values),
+                         xrange(len(values) - 1, -1, -1)))
+        result.append(_array1d([first[x] for x in common], 'int64'))
+    return tuple(result)
 
 
-def empty_like(a, dtype=None, order=None):
-    """ Return a new array with the same shape and type as a given array.
+def union1d(ar1, ar2):
+    """ Find the sorted unique values that are in either array.
     """
-    dtype = a.dtype if dtype is None else dtype
-    return empty(a.shape, dtype, order)
+    values1, dtype1 = _set_values(ar1)
+    values2, dtype2 = _set_values(ar2)
+    dtype = result_type(dtype1, dtype2)
+    return _array1d(_sorted_unique(values1 + values2, dtype), dtype)
 
 
-def zeros(shape, dtype=None, order=None):
-    """Return a new array of given shape and type, filled with zeros
+def setdiff1d(ar1, ar2, assume_unique=False):
+    """ Find the sorted unique values in ar1 that are not in ar2.
     """
-    return empty(shape, dtype, order)
+    values, dtype = _set_values(ar1)
+    uniq = values if assume_unique else _sorted_unique(values, dtype)
+    found = _membership(uniq, dtype, _set_values(ar2)[0])
+    return _array1d([x for x, f in zip(uniq, found) if not f], dtype)
 
 
-def ones(shape, dtype=None, order=None):
-    """Return a new array of given shape and type, filled with ones
+## Histograms
+
+
+def bincount(x, weights=None, minlength=0):
+    """ Count the number of occurrences of each value in the 1-D array
+    of non-negative ints x, or sum the corresponding weights.
     """
-    a = empty(shape, dtype, order)
-    a.fill(1)
-    return a
+    x = array(x, copy=False)
+    if x.ndim != 1:
+        raise ValueError('object too deep for desired array')
+    if _dtype_descrs[x.dtype].kind not in 'biu' and x.size:
+        raise TypeError('Cannot cast array data from %s to int64' % x.dtype)
+    values = x._toflatlist()
+    if values and min(values) < 0:
+        raise ValueError("'x' must not contain negative values")
+    if minlength is None:
+        minlength = 0  # As accepted by older versions of numpy
+    elif minlength < 0:
+        raise ValueError("'minlength' must not be negative")
+    n = max(max(values) + 1 if values else 0, minlength)
+    if weights is None:
+        counts = [0] * n
+        for value, count in Counter(values).items():
+            counts[value] = count
+        return _array1d(counts, 'int64')
+    weights = array(weights, copy=False)
+    if weights.shape != x.shape:
+        raise ValueError('The weights and list don\'t have the same length.')
+    sums = [0.0] * n
+    for value, w in zip(values, weights._toflatlist()):
+        sums[value] += w
+    return _array1d(sums, 'float64')
 
 
-def eye(size):
-    """Return a new 2d array with given dimensions, filled with ones on the
-    diagonal and zeros elsewhere.
+def _bin_edges(values, bins, range):
+    """ Get the list of bin edges for the given bins and range
+    arguments, and whether the bins are uniform.
     """
-    a = zeros((size,size))
-    for i in xrange(size):
-        a[i,i] = 1
-    return a
+    if isinstance(bins, int):
+        if bins < 1:
+            raise ValueError('`bins` must be positive, when an integer')
+        if range is not None:
+            lo, hi = range
+            if lo > hi:
+                raise ValueError('max must be larger than min in range '
+                                 'parameter.')
+        elif values:
+            lo, hi = min(values), max(values)
+        else:
+            lo, hi = 0, 1
+        lo, hi = float(lo), float(hi)
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        edges = [lo + (hi - lo) * i / bins for i in xrange(bins)] + [hi]
+        return edges, True
+    edges = list(bins)
+    if any(b1 > b2 for b1, b2 in zip(edges, edges[1:])):
+        raise ValueError('bins must increase monotonically, when an array')
+    return edges, False
 
 
-def empty(shape, dtype=None, order=None):
-    """Return a new array of given shape and type, without initializing entries
+def _bin_indices(values, edges, uniform):
+    """ Get the bin index of each value, or -1 if it is outside the
+    edges. The last bin includes its right edge.
     """
-    return ndarray(shape, dtype, order=order)
+    lo, hi = edges[0], edges[-1]
+    n = len(edges) - 1
+    if not uniform:
+        find = bisect.bisect_right
+        return [(find(edges, x) - 1 if x < hi else n - 1)
+                if lo <= x <= hi else -1 for x in values]
+    # Uniform bins: compute the bin directly, then correct for rounding
+    scale = n / (hi - lo)
+    last = n - 1
+    result = []
+    for x in values:
+        if lo <= x <= hi:
+            i = int((x - lo) * scale)
+            if i >= last:
+                i = last if x >= edges[last] else last - 1
+            elif x < edges[i]:
+                i -= 1
+            elif x >= edges[i + 1]:
+                i += 1
+            result.append(i)
+        else:
+            result.append(-1)
+    return result
 
 
-def arange(*args, **kwargs):
-    """ arange([start,] stop[, step,], dtype=None)
+def _bin_counts(indices, n, weights):
+    """ Count the indices (ignoring -1) into n bins, or sum the weights.
+    """
+    if weights is None:
+        counter = Counter(indices)
+        return [counter.get(i, 0) for i in xrange(n)], 'int64'
+    weights = array(weights, copy=False)
+    dtype = _sum_dtype(weights.dtype)
+    sums = [0.0 if dtype == 'float64' else 0] * n
+    for i, w in zip(indices, weights._toflatlist()):
+        if i >= 0:
+            sums[i] += w
+    return sums, dtype
 
-    Return evenly spaced values within a given interval.
-    
-    Values are generated within the half-open interval ``[start, stop)``
-    (in other words, the interval including `start` but excluding `stop`).
-    For integer arguments the function is equivalent to the Python built-in
-    `range <http://docs.python.org/lib/built-in-funcs.html>`_ function,
-    but returns an ndarray rather than a list.
 
-    When using a non-integer step, such as 0.1, the results will often not
-    be consistent.  It is better to use ``linspace`` for these cases.
+def histogram(a, bins=10, range=None, weights=None, density=False):
+    """ Compute the histogram of the (flattened) array. Returns the
+    histogram and the bin edges. bins is the number of equal-width bins
+    in range (default the min and max of a), or a sequence of edges.
     """
-    # Get dtype
-    dtype = kwargs.pop('dtype', None)
-    if kwargs:
-        x = list(kwargs.keys())[0]
-        raise TypeError('arange() got an unexpected keyword argument %r' % x)
-    # Parse start, stop, step
-    if len(args) == 0:
-        raise TypeError('Required argument "start" not found')
-    elif len(args) == 1:
-        start, stop, step = 0, int(args[0]), 1
-    elif len(args) == 2:
-        start, stop, step = int(args[0]), int(args[1]), 1
-    elif len(args) == 3:
-        start, stop, step = int(args[0]), int(args[1]), int(args[2])
-    else:
-        raise TypeError('Too many input arguments')
-    # Init
-    iter = xrange(start, stop, step)
-    a = empty((len(iter),), dtype=dtype)
-    a[:] = list(iter)
-    return a
+    values = array(a, copy=False)._toflatlist()
+    edges, uniform = _bin_edges(values, bins, range)
+    n = len(edges) - 1
+    hist, dtype = _bin_counts(_bin_indices(values, edges, uniform), n,
+                              weights)
+    if density:
+        total = sum(hist)
+        hist = [h / (total * (edges[i + 1] - edges[i])) if total else nan
+                for i, h in enumerate(hist)]
+        dtype = 'float64'
+    edges = _array1d(edges, 'float64') if uniform else array(edges)
+    return _array1d(hist, dtype), edges
 
 
-def linspace(start, stop, num=50, endpoint=True, retstep=False, dtype=None):
-    """ linspace(start, stop, num=50, endpoint=True, retstep=False, dtype=None)
+def histogram2d(x, y, bins=10, range=None, weights=None, density=False):
+    """ Compute the 2-D histogram of the samples x and y. Returns the
+    histogram and the bin edges for x and for y. bins is an int or
+    sequence of edges, or a pair of these for x and y separately.
+    """
+    xvalues = array(x, copy=False)._toflatlist()
+    yvalues = array(y, copy=False)._toflatlist()
+    if len(xvalues) != len(yvalues):
+        raise ValueError('x and y must have the same length')
+    if isinstance(bins, int) or len(bins) != 2:
+        bins = bins, bins
+    range = (None, None) if range is None else range
+    xedges, xuniform = _bin_edges(xvalues, bins[0], range[0])
+    yedges, yuniform = _bin_edges(yvalues, bins[1], range[1])
+    nx, ny = len(xedges) - 1, len(yedges) - 1
+    indices = [-1 if i < 0 or j < 0 else i * ny + j for i, j in
+               zip(_bin_indices(xvalues, xedges, xuniform),
+                   _bin_indices(yvalues, yedges, yuniform))]
+    hist, dtype = _bin_counts(indices, nx * ny, weights)
+    if density:
+        total = sum(hist)
+        hist = [h / (total * (xedges[k // ny + 1] - xedges[k // ny]) *
+                     (yedges[k % ny + 1] - yedges[k % ny])) if total else nan
+                for k, h in enumerate(hist)]
+        dtype = 'float64'
+    return (_array1d(hist, dtype).reshape((nx, ny)),
+            _array1d(xedges, 'float64'), _array1d(yedges, 'float64'))
+
+
+## Joining and splitting
+
+
+def _block_addresses(dst, src):
+    """ Get the addresses of the storage of dst and src, if dst is
+    writable and both addresses are available, or None otherwise.
+    """
+    try:
+        daddr, readonly = _storage_address(dst)
+        saddr = _storage_address(src)[0]
+    except (TypeError, ValueError):
+        return None
+    return None if readonly else (daddr, saddr)
+
+
+def _copy_into(dst, src):
+    """ Copy the values of array src into array dst of the same shape,
+    converting to the dtype of dst. Runs that are contiguous in both
+    are copied as blocks, with a memmove if the storage allows.
+    """
+    if src.dtype != dst.dtype:
+        src = src.astype(dst.dtype)
+    shape, (dstrides, sstrides) = _coalesce(dst._shape, [dst._estrides,
+                                                         src._estrides])
+    dstep, sstep = dstrides[-1], sstrides[-1]
+    ddata, sdata = dst._data, src._data
+    addresses = None
+    if dstep == sstep == 1 and 0 not in shape:
+        addresses = _block_addresses(ddata, sdata)
+    itemsize = dst._itemsize
+    strides = [dstrides, sstrides]
     
-    Return evenly spaced numbers over a specified interval. Returns num
-    evenly spaced samples, calculated over the interval [start, stop].
-    The endpoint of the interval can optionally be excluded.
+    def copy_block(start, stop):
+        bshape = (stop - start, ) + shape[1:]
+        n = bshape[-1]
+        rows = _row_offsets(bshape, _block_offsets([dst._offset,
+                                                    src._offset],
+                                                   strides, start), strides)
+        if addresses is not None:
+            daddr, saddr = addresses
+            for doffset, soffset in rows:
+                ctypes.memmove(daddr + doffset * itemsize,
+                               saddr + soffset * itemsize, n * itemsize)
+        else:
+            for doffset, soffset in rows:
+                _store(ddata, _run_slice(doffset, n, dstep),
+                       _read_run(sdata, soffset, n, sstep))
+    
+    _run_blocks(copy_block, shape[0], _size_for_shape(shape))
+
+
+def concatenate(arrays, axis=0, out=None, dtype=None):
+    """ Join a sequence of arrays along an existing axis. With axis None
+    the arrays are flattened first. The output is allocated once, and
+    each array is copied into its part of it by contiguous blocks.
     """
-    # Prepare
-    start, stop = float(start), float(stop)
-    ra = stop - start
-    if endpoint:
-        step = ra / (num-1)
-    else:
-        step = ra / num
-    # Create
-    a = empty((num,), dtype)
-    a[:] = [start + i * step for i in xrange(num)]
-    # Return
-    if retstep:
-        return a, step
+    arrays = [array(a, copy=False) for a in arrays]
+    if not arrays:
+        raise ValueError('need at least one array to concatenate')
+    if axis is None:
+        arrays, axis = [a.ravel() for a in arrays], 0
+    ndim = arrays[0].ndim
+    if not ndim:
+        raise ValueError('zero-dimensional arrays cannot be concatenated')
+    axis, = _normalize_axis(axis, ndim)
+    shape = list(arrays[0]._shape)
+    for a in arrays[1:]:
+        if a.ndim != ndim:
+            raise ValueError('all the input arrays must have same number '
+                             'of dimensions')
+        if (a._shape[:axis] != arrays[0]._shape[:axis] or
+                a._shape[axis + 1:] != arrays[0]._shape[axis + 1:]):
+            raise ValueError('all the input array dimensions except for '
+                             'the concatenation axis must match exactly')
+        shape[axis] += a._shape[axis]
+    if out is None:
+        out = empty(shape, _convert_dtype(dtype) or result_type(*arrays))
+    elif out.shape != tuple(shape):
+        raise ValueError('Output array is the wrong shape')
+    start = 0
+    for a in arrays:
+        stop = start + a._shape[axis]
+        _copy_into(out[(slice(None), ) * axis + (slice(start, stop), )], a)
+        start = stop
+    return out
+
+
+def stack(arrays, axis=0, out=None, dtype=None):
+    """ Join a sequence of arrays of the same shape along a new axis.
+    """
+    arrays = [array(a, copy=False) for a in arrays]
+    if not arrays:
+        raise ValueError('need at least one array to stack')
+    shape = arrays[0]._shape
+    if any(a._shape != shape for a in arrays):
+        raise ValueError('all input arrays must have the same shape')
+    axis, = _normalize_axis(axis, len(shape) + 1)
+    # Insert the new axis as a dimension of size 1 in views of the arrays
+    shape = shape[:axis] + (1, ) + shape[axis:]
+    arrays = [_view(a, shape, a._strides[:axis] + (0, ) + a._strides[axis:],
+                    a._offset) for a in arrays]
+    return concatenate(arrays, axis, out, dtype)
+
+
+def vstack(tup, dtype=None):
+    """ Stack arrays vertically (along the first axis); 1-D arrays of
+    length n are treated as rows of shape (1, n), and scalars as (1, 1).
+    """
+    arrays = [array(a, copy=False) for a in tup]
+    arrays = [a.reshape((1, ) * (2 - a.ndim) + a.shape) if a.ndim < 2
+              else a for a in arrays]
+    return concatenate(arrays, 0, dtype=dtype)
+
+
+def hstack(tup, dtype=None):
+    """ Stack arrays horizontally (along the second axis), or along
+    the first axis if all arrays are 1-D.
+    """
+    arrays = [array(a, copy=False) for a in tup]
+    arrays = [a.reshape((1, )) if a.ndim == 0 else a for a in arrays]
+    axis = 0 if arrays and arrays[0].ndim == 1 else 1
+    return concatenate(arrays, axis, dtype=dtype)
+
+
+def array_split(ary, indices_or_sections, axis=0):
+    """ Split an array into a list of views along the given axis, at the
+    given indices, or into the given number of sections of which the
+    first ones may have one element more than the others.
+    """
+    ary = array(ary, copy=False)
+    axis, = _normalize_axis(axis, ary.ndim)
+    n = ary._shape[axis]
+    if isinstance(indices_or_sections, int):
+        sections = indices_or_sections
+        if sections <= 0:
+            raise ValueError('number sections must be larger than 0.')
+        size, extras = divmod(n, sections)
+        bounds = [0]
+        for i in xrange(sections):
+            bounds.append(bounds[-1] + size + (i < extras))
     else:
-        return a
+        bounds = [0] + list(indices_or_sections) + [n]
+    prefix = (slice(None), ) * axis
+    return [ary[prefix + (slice(start, stop), )]
+            for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def split(ary, indices_or_sections, axis=0):
+    """ Split an array into a list of views along the given axis, at the
+    given indices, or into the given number of equal sections.
+    """
+    if isinstance(indices_or_sections, int):
+        n = array(ary, copy=False).shape[axis]
+        if indices_or_sections <= 0 or n % indices_or_sections:
+            raise ValueError('array split does not result in an equal '
+                             'division')
+    return array_split(ary, indices_or_sections, axis)
+
+
+## Other functions
 
-def add(ndarray_vec1, ndarray_vec2):
-    c = []
-    for a, b in zip(ndarray_vec1, ndarray_vec2):
-        c.append(a+b)
-    cRay = array(c)
-    return cRay
-
-def subtract(ndarray_vec1, ndarray_vec2):
-    c = []
-    for a, b in zip(ndarray_vec1, ndarray_vec2):
-        c.append(a-b)
-    cRay = array(c)
-    return cRay
-
-def multiply(ndarray_vec1, ndarray_vec2):
-    c = []
-    for a, b in zip(ndarray_vec1, ndarray_vec2):
-        c.append(a*b)
-    cRay = array(c)
-    return cRay
-
-def divide(ndarray_vec1, integer):
-    c = []
-    for a in ndarray_vec1:
-        c.append(a / integer)
-    cRay = array(c)
-    return cRay
 
 def cross(u, v):
     """
@@ -427,23 +2405,106 @@ def cross(u, v):
         raise IndexError('Vector has invalid dimensions')
     return uxv
 
-def dot(u, v):
+
+def _matmul_out(out, shape, a, b):
+    """ Get the output array for a matrix product of a and b.
     """
-    Return the dot product of two equal-dimensional vectors.
+    dtype = _result_dtype(operator.mul, a, b)
+    if out is None:
+        return empty(shape, dtype)
+    if out._shape != shape:
+        raise ValueError('output array has shape %s, expected %s' %
+                         (out._shape, shape))
+    _check_out_cast(dtype, out)
+    return out
+
+
+def matmul(a, b, out=None):
+    """ matmul(a, b, out=None)
+    
+    Matrix product of two arrays. Arrays with more than two dimensions
+    are stacks of matrices, and are broadcast against each other. A 1-D
+    operand is a vector, its dimension is removed from the result.
     """
+    a, b = _as_operand(a), _as_operand(b)
+    if not (isinstance(a, ndarray) and isinstance(b, ndarray)
+            and a.ndim and b.ndim):
+        raise ValueError('matmul: Input operand does not have enough '
+                         'dimensions')
+    n = a._shape[-2] if a.ndim > 1 else 1
+    k = a._shape[-1]
+    m = b._shape[-1] if b.ndim > 1 else 1
+    if b._shape[-2 if b.ndim > 1 else 0] != k:
+        raise ValueError('matmul: mismatch in core dimension (size %i is '
+                         'different from %i)' %
+                         (b._shape[-2 if b.ndim > 1 else 0], k))
+    batch = _broadcast_shapes(a._shape[:-2], b._shape[:-2])
+    shape = batch + a._shape[-2:-1]
+    if b.ndim > 1:
+        shape += b._shape[-1:]
+    out = _matmul_out(out, shape, a, b)
+    if _same_memory(a, out):
+        a = a.copy()
+    if _same_memory(b, out):
+        b = b.copy()
+    ostrides = [s // out._itemsize for s in out._strides]
+    if a.ndim == 1:
+        ostrides.insert(len(batch), 0)
+    if b.ndim == 1:
+        ostrides.append(0)
+    operands = [_core_operand(a, 0, len(batch)),
+                _core_operand(b, 1, len(batch)),
+                (out._data, out._offset, ostrides[:-2], ostrides[-2:])]
+    _matmul(operands, batch, n, k, m)
+    return out
 
-    uDim = len(u)
-    vDim = len(v)
 
-    # http://reference.wolfram.com/language/ref/Dot.html
-    if uDim == vDim:
-        try:
-            u_dot_v = sum(map(operator.mul, u, v))
-        except LinAlgError as e:
-            u_dot_v = e
-    else:
-        raise IndexError('Vector has invalid dimensions')
-    return u_dot_v
+def dot(a, b, out=None):
+    """ dot(a, b, out=None)
+    
+    Dot product of two arrays. For 1-D arrays this is the inner
+    product, for 2-D arrays the matrix product. For N-D arrays it is a
+    sum product over the last axis of a and the second-to-last of b.
+    """
+    a, b = _as_operand(a), _as_operand(b)
+    if not (isinstance(a, ndarray) and a.ndim and
+            isinstance(b, ndarray) and b.ndim):
+        return multiply(a, b, out=out)
+    if a.ndim == b.ndim == 1:
+        # Inner product of two vectors
+        if a._shape != b._shape:
+            raise IndexError('Vector has invalid dimensions')
+        if out is None:
+            return sum(map(operator.mul, a._toflatlist(), b._toflatlist()))
+    if b.ndim <= 2:
+        result = matmul(a, b, out)
+        return result if result._shape else result._data[result._offset]
+    # N-D: all combinations of the stacks of a and b
+    k, m = b._shape[-2:]
+    if a._shape[-1] != k:
+        raise ValueError('shapes %s and %s not aligned' %
+                         (a._shape, b._shape))
+    abatch, bbatch = a._shape[:-2], b._shape[:-2]
+    batch = abatch + bbatch
+    shape = a._shape[:-1] + bbatch + (m, )
+    out = _matmul_out(out, shape, a, b)
+    if _same_memory(a, out):
+        a = a.copy()
+    if _same_memory(b, out):
+        b = b.copy()
+    aop = _core_operand(a, 0, len(abatch))
+    bop = _core_operand(b, 1, len(bbatch))
+    ostrides = [s // out._itemsize for s in out._strides]
+    if a.ndim == 1:
+        ostrides.insert(0, 0)
+    na = len(abatch)
+    operands = [aop[:2] + (aop[2] + [0] * len(bbatch), aop[3]),
+                bop[:2] + ([0] * na + bop[2], bop[3]),
+                (out._data, out._offset, ostrides[:na] + ostrides[na + 1:-1],
+                 [ostrides[na], ostrides[-1]])]
+    _matmul(operands, batch, a._shape[-2] if a.ndim > 1 else 1, k, m)
+    return out
+
 
 def reshape(X,shape):
     """
@@ -453,6 +2514,184 @@ def reshape(X,shape):
     assert isinstance(shape, tuple) or isinstance(shape, list)
     return X.reshape(shape)
 
+
+def transpose(a, axes=None):
+    """ Get a view of the array with the axes permuted.
+    """
+    return a.transpose(axes)
+
+
+def swapaxes(a, axis1, axis2):
+    """ Get a view of the array with axis1 and axis2 interchanged.
+    """
+    return a.swapaxes(axis1, axis2)
+
+
+def moveaxis(a, source, destination):
+    """ Get a view of the array with the axes at the source positions
+    moved to the destination positions. Other axes keep their order.
+    """
+    source = source if isinstance(source, (tuple, list)) else (source, )
+    destination = (destination if isinstance(destination, (tuple, list))
+                   else (destination, ))
+    if len(source) != len(destination):
+        raise ValueError('source and destination arguments must have the '
+                         'same number of elements')
+    source = [_normalize_axis(ax, a.ndim)[0] for ax in source]
+    destination = [_normalize_axis(ax, a.ndim)[0] for ax in destination]
+    if len(set(source)) != len(source):
+        raise ValueError('repeated axis in source argument')
+    axes = [ax for ax in range(a.ndim) if ax not in source]
+    for dest, src in sorted(zip(destination, source)):
+        axes.insert(dest, src)
+    return a.transpose(axes)
+
+
+def ascontiguousarray(a, dtype=None):
+    """ Get a C-contiguous array with the same data. This is the array
+    itself if it already is contiguous (and of the requested dtype).
+    """
+    if not isinstance(a, ndarray):
+        a = array(a, copy=False)
+    dtype = _convert_dtype(dtype) or a.dtype
+    if dtype == a.dtype and a.flags['C_CONTIGUOUS']:
+        return a
+    return a.astype(dtype)
+
+
+## File I/O (.npy format)
+
+_npy_magic = b'\x93NUMPY'
+
+
+def _storage_bytes(data):
+    """ Get a memoryview of the raw bytes of storage.
+    """
+    return memoryview(data).cast('B')
+
+
+def _npy_descr(dtype):
+    short = _convert_dtype(dtype, 'short')
+    return ('|' if short[-1] == '1' else '<') + short
+
+
+def _read_npy_header(f):
+    """ Read the header of a .npy file. Returns (shape, dtype,
+    fortran_order). The file is left at the start of the data.
+    """
+    magic = f.read(len(_npy_magic))
+    if magic != _npy_magic:
+        raise ValueError('the file is not in .npy format')
+    major, minor = bytearray(f.read(2))
+    if major == 1:
+        size, = struct.unpack('<H', f.read(2))
+    elif major in (2, 3):
+        size, = struct.unpack('<I', f.read(4))
+    else:
+        raise ValueError('unsupported .npy format version %i.%i' %
+                         (major, minor))
+    header = f.read(size).decode('utf-8' if major == 3 else 'latin1')
+    d = ast.literal_eval(header)
+    descr = d['descr']
+    if not isinstance(descr, str) or descr[0] not in '<|=' or \
+            _convert_dtype(descr[1:]) not in _known_dtypes:
+        raise ValueError('data type %r not supported by tinynumpy' % descr)
+    return tuple(d['shape']), _convert_dtype(descr[1:]), d['fortran_order']
+
+
+def _fspath(file):
+    """ Get the path of a path-like object (e.g. pathlib.Path), or file
+    itself if it is not one.
+    """
+    if hasattr(os, 'fspath') and hasattr(file, '__fspath__'):
+        return os.fspath(file)  # Python 3.6+
+    return file
+
+
+def save(file, arr):
+    """ save(file, arr)
+
+    Save an array to a binary file in .npy format. If file is a string
+    (or path-like) and does not end with '.npy', the extension is added.
+    """
+    if not isinstance(arr, ndarray):
+        arr = array(arr)
+    file = _fspath(file)
+    if isinstance(file, str):
+        if not file.endswith('.npy'):
+            file += '.npy'
+        with open(file, 'wb') as f:
+            return save(f, arr)
+    arr = ascontiguousarray(arr)
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': %r, }" % (
+        _npy_descr(arr.dtype), arr.shape)
+    header = header.encode('latin1')
+    # Pad with spaces and a newline so that the data is 64-byte aligned
+    preamble = len(_npy_magic) + 2 + 2  # magic, version, header length
+    if preamble + len(header) + 64 < 2**16:
+        version, fmt = (1, 0), '<H'
+    else:
+        version, fmt, preamble = (2, 0), '<I', preamble + 2
+    pad = 63 - (preamble + len(header)) % 64
+    header += b' ' * pad + b'\n'
+    file.write(_npy_magic + bytes(bytearray(version)))
+    file.write(struct.pack(fmt, len(header)) + header)
+    nbytes = arr.nbytes
+    start = arr._offset * arr.itemsize
+    file.write(_storage_bytes(arr._data)[start:start + nbytes])
+
+
+def load(file, mmap_mode=None):
+    """ load(file, mmap_mode=None)
+
+    Load an array from a .npy file. If mmap_mode is given, the file is
+    memory-mapped and the returned array is a view on the mapped data,
+    so that nothing is read until it is accessed:
+
+    * 'r': read-only.
+    * 'r+': read/write, changes are written to the file.
+    * 'c': copy-on-write, changes are not written to the file.
+    """
+    if mmap_mode not in (None, 'r', 'r+', 'c'):
+        raise ValueError("mmap_mode must be None, 'r', 'r+' or 'c'")
+    file = _fspath(file)
+    if isinstance(file, str):
+        with open(file, 'r+b' if mmap_mode == 'r+' else 'rb') as f:
+            return load(f, mmap_mode)
+    shape, dtype, fortran_order = _read_npy_header(file)
+    if fortran_order:
+        shape = shape[::-1]
+    a = _read_array(file, shape, dtype, mmap_mode)
+    if fortran_order:
+        a = a.T
+    return a
+
+
+def _read_array(file, shape, dtype, mmap_mode=None):
+    """ Read a C-contiguous array from the current position of an open
+    file, or memory-map it if mmap_mode is given (see load).
+    """
+    if mmap_mode is None:
+        a = empty(shape, dtype)
+        buf = _storage_bytes(a._data)
+        nread = 0
+        while nread < len(buf):
+            n = file.readinto(buf[nread:])
+            if not n:
+                raise ValueError('the file is truncated')
+            nread += n
+        return a
+    access = {'r': mmap.ACCESS_READ, 'r+': mmap.ACCESS_WRITE,
+              'c': mmap.ACCESS_COPY}[mmap_mode]
+    start = file.tell()
+    itemsize = int(_convert_dtype(dtype, 'short')[-1])
+    nbytes = _size_for_shape(shape) * itemsize
+    mm = mmap.mmap(file.fileno(), 0, access=access)
+    if len(mm) < start + nbytes:
+        raise ValueError('the file is truncated')
+    return ndarray(shape, dtype, buffer=memoryview(mm)[start:start + nbytes])
+
+
 ## The class
 
 class ndarray(object):
@@ -492,9 +2731,10 @@ class ndarray(object):
     Attributes
     ----------
     T : ndarray
-        Transpose of the array. In tinynumpy only supported for ndim <= 3.
+        Transpose of the array. This is a view, like in numpy.
     data : buffer
-        The array's elements, in memory. In tinynumpy this is a ctypes array.
+        The array's elements, in memory. In tinynumpy this is a ctypes
+        array, array.array or memoryview, see `set_storage_backend`.
     dtype : str
         Describes the format of the elements in the array. In tinynumpy
         this is a string.
@@ -550,7 +2790,7 @@ class ndarray(object):
     """
     
     __slots__ = ['_dtype', '_shape', '_strides', '_itemsize', 
-                 '_offset', '_base', '_data']
+                 '_offset', '_base', '_data', '_estrides']
     
     def __init__(self, shape, dtype='float64', buffer=None, offset=0,
                  strides=None, order=None):
@@ -571,7 +2811,7 @@ class ndarray(object):
             raise TypeError('data type %r not understood' % dtype)
         self._dtype = dtype
         # Itemsize is directly derived from dtype
-        self._itemsize = int(_convert_dtype(dtype, 'short')[-1])
+        self._itemsize = _dtype_descrs[dtype].itemsize
         
         if buffer is None:
             # New array
@@ -602,38 +2842,38 @@ class ndarray(object):
             assert len(strides) == len(shape)
             self._strides = strides
         
-        # Define our buffer class
-        buffersize = self._strides[0] * self._shape[0] // self._itemsize
-        buffersize += self._offset
-        BufferClass = _convert_dtype(dtype, 'ctypes') * buffersize
-        # Create buffer
+        # Strides in elements, for fast access to single elements
+        self._estrides = tuple([s // self._itemsize for s in self._strides])
+        
+        # Create or wrap storage, large enough to hold the last element
+        buffersize = _buffer_size(self._shape, self._strides, self._itemsize,
+                                  self._offset)
         if buffer is None:
-            self._data = BufferClass()
-        elif isinstance(buffer, ctypes.Array):
-            self._data = BufferClass.from_address(ctypes.addressof(buffer))
+            self._data = _allocate_storage(dtype, buffersize)
         else:
-            self._data = BufferClass.from_buffer(buffer)
+            self._data = _wrap_storage(buffer, dtype, buffersize)
     
     @property
     def __array_interface__(self):
         """ Allow converting to real numpy array, or pass pointer to C library
         http://docs.scipy.org/doc/numpy/reference/arrays.interface.html
         """
-        readonly = False
         # typestr
         typestr = '<' + _convert_dtype(self.dtype, 'short')
         # Pointer
-        if isinstance(self._data, ctypes.Array):
-            ptr = ctypes.addressof(self._data)
-        elif hasattr(self._data, '__array_interface__'):
-            ptr, readonly = self._data.__array_interface__['data']
-        elif hasattr(self._data, 'buffer_info'):  # Python's array.array
-            ptr = self._data.buffer_info()[0]
-        elif isinstance(self._data, bytes):
-            ptr = ctypes.cast(self._data, ctypes.c_void_p).value
-            readonly = True
-        else:
-            raise TypeError('Cannot get address to underlying array data')
+        try:
+            ptr, readonly = _storage_address(self._data)
+        except TypeError:
+            # E.g. a read-only memory map has no address that we can get,
+            # but the buffer itself can be shared (with an offset)
+            return dict(version=3,
+                        shape=self.shape,
+                        typestr=typestr,
+                        descr=[('', typestr)],
+                        data=self._data,
+                        offset=self._offset * self.itemsize,
+                        strides=self.strides,
+                        )
         ptr += self._offset * self.itemsize
         #
         return dict(version=3,
@@ -650,17 +2890,29 @@ class ndarray(object):
         return self.shape[0]
     
     def __getitem__(self, key):
+        offset = self._element_offset(key)
+        if offset is not None:
+            return self._data[offset]
+        if _is_advanced_key(key):
+            return self._getitem_advanced(key)
         offset, shape, strides = self._index_helper(key)
         if not shape:
             # Return scalar
             return self._data[offset]
         else:
             # Return view
-            return ndarray(shape, self.dtype,
-                           offset=offset, strides=strides, buffer=self)
+            return _view(self, shape, strides, offset)
     
     def __setitem__(self, key, value):
         
+        offset = self._element_offset(key)
+        if offset is not None:
+            self._data[offset] = value
+            return
+        
+        if _is_advanced_key(key):
+            return self._setitem_advanced(key, value)
+        
         # Get info for view
         offset, shape, strides = self._index_helper(key)
         
@@ -669,15 +2921,25 @@ class ndarray(object):
             self._data[offset] = value
             return
 
-        # Create view to set data to
-        view = ndarray(shape, self.dtype,
-                        offset=offset, strides=strides, buffer=self)
+        # Assigning a view to itself, e.g. after an in-place operator
+        # like ``a[:, 3] *= 2``, is a no-op
+        if (isinstance(value, ndarray) and _same_memory(value, self) and
+                value._offset == offset and value._shape == shape and
+                value._strides == strides and value.dtype == self.dtype):
+            return
+
+        data = self._data
+        estrides = tuple([s // self._itemsize for s in strides])
+        
+        # Assigning a scalar, in whatever order the memory is laid out
+        if isinstance(value, (float, int)):
+            for start, n, step in _runs(shape, estrides, offset, 0):
+                _store(data, _run_slice(start, n, step), [value] * n)
+            return
         
         # Get data to set as a list (because getting slices from ctype
         # arrays yield lists anyway). The list is our "contiguous array" 
-        if isinstance(value, (float, int)):
-            value_list = [value] * view.size
-        elif isinstance(value, (tuple, list)):
+        if isinstance(value, (tuple, list)):
             value_list = value
         else:
             if not isinstance(value, ndarray):
@@ -685,31 +2947,48 @@ class ndarray(object):
             value_list = value._toflatlist()
         
         # Check if size match
-        if view.size != len(value_list):
+        if _size_for_shape(shape) != len(value_list):
             raise ValueError('Number of elements in source does not match '
                                 'number of elements in target.')
         
-        # Assign data in most efficient way that we can. This code
-        # looks for the largest semi-contiguous block: the block that
-        # we can access as a 1D array with a stepsize.
-        subviews = [view]
-        value_index = 0
-        count = 0
-        while subviews:
-            subview = subviews.pop(0)
-            step = _get_step(subview)
-            if step:
-                block = value_list[value_index:value_index+subview.size]
-                s = slice(subview._offset, 
-                            subview._offset + subview.size * step, 
-                            step)
-                view._data[s] = block
-                value_index += subview.size
-                count += 1
-            else:
-                for i in range(subview.shape[0]):
-                    subviews.append(subview[i])
-        assert value_index == len(value_list)
+        # Assign data in runs, in C order
+        index = 0
+        for start, n, step in _runs(shape, estrides, offset):
+            _store(data, _run_slice(start, n, step),
+                   value_list[index:index + n])
+            index += n
+    
+    def _getitem_advanced(self, key):
+        if (isinstance(key, ndarray) and key.dtype == 'bool' and
+                key._shape == self._shape):
+            # Filter all elements by a mask, in one go
+            values = list(compress(self._toflatlist(), key._toflatlist()))
+            out, axes = empty((len(values), ), self.dtype), None
+        else:
+            offsets, bshape, bstrides, shape, axes = \
+                self._advanced_index_helper(key)
+            values = _gather(self._data, offsets, bshape, bstrides)
+            out = empty(shape, self.dtype)
+        _store(out._data, slice(None), values)
+        return out if axes is None else out.transpose(axes)
+    
+    def _setitem_advanced(self, key, value):
+        offsets, bshape, bstrides, shape, axes = \
+            self._advanced_index_helper(key)
+        if isinstance(value, (float, int)):
+            values = [value] * _size_for_shape(shape)
+        else:
+            # Broadcast value to the shape of the result, then get its
+            # values in the order of the indexed blocks
+            value = _as_operand(value)
+            rshape = shape if axes is None else [shape[i] for i in axes]
+            value = _elementwise(_same, (value, ), value.dtype,
+                                 empty(rshape, value.dtype))
+            if axes is not None:
+                value = value.transpose([axes.index(i)
+                                         for i in range(len(axes))])
+            values = value._toflatlist()
+        _scatter(self._data, offsets, bshape, bstrides, values)
     
     def __float__(self):
         if self.size == 1:
@@ -756,285 +3035,147 @@ class ndarray(object):
         else:
             return "array(" + s + ")"
     
+    ## Elementwise operators
+
     def __eq__(self, other):
-        if other.__module__.split('.')[0] == 'numpy':
+        if type(other).__module__.split('.')[0] == 'numpy':
             return other == self
-        else:
-            out = empty(self.shape, 'bool')
-            out[:] = [i1==i2 for (i1, i2) in zip(self.flat, other.flat)]
-            return out
-    
+        return _elementwise(operator.eq, (self, other))
+
+    def __ne__(self, other):
+        if type(other).__module__.split('.')[0] == 'numpy':
+            return other != self
+        return _elementwise(operator.ne, (self, other))
+
+    def __lt__(self, other):
+        return _elementwise(operator.lt, (self, other))
+
+    def __le__(self, other):
+        return _elementwise(operator.le, (self, other))
+
+    def __gt__(self, other):
+        return _elementwise(operator.gt, (self, other))
+
+    def __ge__(self, other):
+        return _elementwise(operator.ge, (self, other))
+
     def __add__(self, other):
-        '''classic addition
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            out = empty(self.shape, self.dtype)
-            out[:] = [dat+other for dat in self._data] 
-            return out
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                out = empty(self.shape, self.dtype)
-                out[:] = [i+j for (i,j) in zip(self.flat, other.flat)]
-                return out
+        return _elementwise(operator.add, (self, other))
 
     def __radd__(self, other):
-        return self.__add__(other)
+        return _elementwise(operator.add, (other, self))
 
     def __sub__(self, other):
-        if (isinstance(other, int) or isinstance(other, float)) :
-            out = empty(self.shape, self.dtype)
-            out[:] = [dat-other for dat in self._data] 
-            return out
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                out = empty(self.shape, self.dtype)
-                out[:] = [i-j for (i,j) in zip(self.flat, other.flat)]
-                return out
+        return _elementwise(operator.sub, (self, other))
 
     def __rsub__(self, other):
-        return self.__sub__(other)
+        return _elementwise(operator.sub, (other, self))
 
     def __mul__(self, other):
-        '''multiply element-wise with array or float/scalar'''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            out = empty(self.shape, self.dtype)
-            out[:] = [dat*other for dat in self._data] 
-            return out
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                out = empty(self.shape, self.dtype)
-                out[:] = [i*j for (i,j) in zip(self.flat, other.flat)]
-                return out       
+        return _elementwise(operator.mul, (self, other))
 
     def __rmul__(self, other):
-        return self.__mul__(other)
-
-    def __div__(self, other):
-        '''divide element-wise with array or float/scalar'''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            if other == 0 : raise ZeroDivisionError
-            out = empty(self.shape, self.dtype)
-            out[:] = [dat/other for dat in self._data] 
-            return out
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                out = empty(self.shape, self.dtype)
-                out[:] = [i/j for (i,j) in zip(self.flat, other.flat)]
-                return out
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.mul, (other, self))
 
     def __truediv__(self, other):
-        '''divide element-wise with array or float/scalar'''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            if other == 0 : raise ZeroDivisionError
-            out = empty(self.shape, self.dtype)
-            out[:] = [dat/other for dat in self._data] 
-            return out
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                out = empty(self.shape, self.dtype)
-                out[:] = [i/j for (i,j) in zip(self.flat, other.flat)]
-                return out
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.truediv, (self, other))
+
+    def __rtruediv__(self, other):
+        return _elementwise(operator.truediv, (other, self))
+
+    __div__ = __truediv__  # We use true division, also on Python 2
+    __rdiv__ = __rtruediv__
 
     def __floordiv__(self, other):
-        '''divide element-wise with array or float/scalar'''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            if other == 0 : raise ZeroDivisionError
-            out = empty(self.shape, self.dtype)
-            out[:] = [dat//other for dat in self._data] 
-            return out
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                out = empty(self.shape, self.dtype)
-                out[:] = [i//j for (i,j) in zip(self.flat, other.flat)]
-                return out
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.floordiv, (self, other))
+
+    def __rfloordiv__(self, other):
+        return _elementwise(operator.floordiv, (other, self))
 
     def __mod__(self, other):
-        '''divide element-wise with array or float/scalar'''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            out = empty(self.shape, self.dtype)
-            out[:] = [dat%other for dat in self._data] 
-            return out
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                out = empty(self.shape, self.dtype)
-                out[:] = [i%j for (i,j) in zip(self.flat, other.flat)]
-                return out
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.mod, (self, other))
+
+    def __rmod__(self, other):
+        return _elementwise(operator.mod, (other, self))
 
     def __pow__(self, other):
-        '''power of two arrays element-wise (of just float power)'''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            out = empty(self.shape, self.dtype)
-            out[:] = [dat**other for dat in self._data] 
-            return out
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                out = empty(self.shape, self.dtype)
-                out[:] = [i**j for (i,j) in zip(self.flat, other.flat)]
-                return out
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.pow, (self, other))
+
+    def __rpow__(self, other):
+        return _elementwise(operator.pow, (other, self))
+
+    def __and__(self, other):
+        return _elementwise(operator.and_, (self, other))
+
+    def __rand__(self, other):
+        return _elementwise(operator.and_, (other, self))
+
+    def __or__(self, other):
+        return _elementwise(operator.or_, (self, other))
+
+    def __ror__(self, other):
+        return _elementwise(operator.or_, (other, self))
+
+    def __xor__(self, other):
+        return _elementwise(operator.xor, (self, other))
+
+    def __rxor__(self, other):
+        return _elementwise(operator.xor, (other, self))
+
+    def __matmul__(self, other):
+        return matmul(self, other)
+
+    def __rmatmul__(self, other):
+        return matmul(other, self)
+
+    def __neg__(self):
+        return _elementwise(operator.neg, (self, ))
+
+    def __pos__(self):
+        return _elementwise(operator.pos, (self, ))
+
+    def __abs__(self):
+        return _elementwise(abs, (self, ))
+
+    def __invert__(self):
+        return _elementwise(_invert_op(self._dtype), (self, ))
+
+    ## In-place operators
 
     def __iadd__(self, other):
-        '''Addition of other array or float in place with += operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            for i in range(len(self._data)):
-                self._data[i]+=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]+=other._data[i]
-                return self            
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.add, (self, other), out=self)
 
     def __isub__(self, other):
-        '''Addition of other array or float in place with += operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            for i in range(len(self._data)):
-                self._data[i]-=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]-=other._data[i]
-                return self
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.sub, (self, other), out=self)
 
     def __imul__(self, other):
-        '''multiplication woth other array or float in place with *= operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            for i in range(len(self._data)):
-                self._data[i]*=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]*=other._data[i]
-                return self
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
-
-    def __idiv__(self, other):
-        '''Division of other array or float in place with /= operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            if other == 0 : raise ZeroDivisionError
-            for i in range(len(self._data)):
-                self._data[i]/=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]/=other._data[i]
-                return self
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.mul, (self, other), out=self)
 
     def __itruediv__(self, other):
-        '''Division of other array or float in place with /= operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            if other == 0 : raise ZeroDivisionError
-            for i in range(len(self._data)):
-                self._data[i]/=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]/=other._data[i]
-                return self
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.truediv, (self, other), out=self)
 
-    def __ifloordiv__(self, other):
-        '''Division of other array or float in place with /= operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            if other == 0 : raise ZeroDivisionError
-            for i in range(len(self._data)):
-                self._data[i]//=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]//=other._data[i]
-                return self
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+    __idiv__ = __itruediv__
 
-    def __imod__(self, other):
-        '''mod of other array or float in place with /= operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            if other == 0 : raise ZeroDivisionError
-            for i in range(len(self._data)):
-                self._data[i]%=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]%=other._data[i]
-                return self
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+    def __ifloordiv__(self, other):
+        return _elementwise(operator.floordiv, (self, other), out=self)
 
     def __imod__(self, other):
-        '''mod of other array or float in place with /= operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            if other == 0 : raise ZeroDivisionError
-            for i in range(len(self._data)):
-                self._data[i]%=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]%=other._data[i]
-                return self
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.mod, (self, other), out=self)
 
     def __ipow__(self, other):
-        '''mod of other array or float in place with /= operator
-        '''
-        if (isinstance(other, int) or isinstance(other, float)) :
-            for i in range(len(self._data)):
-                self._data[i]**=other
-            return self
-        if (isinstance(other, ndarray)):
-            if self.shape == other.shape :
-                for i in range(len(self._data)):
-                    self._data[i]**=other._data[i]
-                return self
-            else :
-                raise ValueError('Array sizes do not match. '+str(self.shape)\
-                                                  +' versus '+str(other.shape))
+        return _elementwise(operator.pow, (self, other), out=self)
+
+    def __iand__(self, other):
+        return _elementwise(operator.and_, (self, other), out=self)
+
+    def __ior__(self, other):
+        return _elementwise(operator.or_, (self, other), out=self)
+
+    def __ixor__(self, other):
+        return _elementwise(operator.xor, (self, other), out=self)
+
+    def __imatmul__(self, other):
+        return matmul(self, other, out=self)
 
 
     ## Private helper functions
@@ -1047,58 +3188,136 @@ class ndarray(object):
         # Promote to tuple.
         if not isinstance(key, tuple):
             key = (key,)
-
-        axis = 0
-        shape = []
-        strides = []
-        offset = self._offset
-
+        
+        # Get the signature of the key, integer indices are parameters
+        signature = []
+        indices = []
         for k in key:
-            axissize = self._shape[axis]
-            if isinstance(k, int):
-                if k >= axissize:
-                    raise IndexError('index %i is out of bounds for axis %i '
-                                     'with size %s' % (k, axis, axissize))
-                offset += k * self._strides[axis] // self.itemsize
-                axis += 1
-            elif isinstance(k, slice):
-                start, stop, step = k.indices(self.shape[axis])
-                shape.append(_ceildiv(stop - start, step))
-                strides.append(step * self._strides[axis])
-                offset += start * self._strides[axis] // self.itemsize
-                axis += 1
+            if k.__class__ is slice:
+                signature.append((k.start, k.stop, k.step))
+            elif isinstance(k, int):
+                signature.append(0)
+                indices.append(k)
+            elif k is None:
+                signature.append(None)
             elif k is Ellipsis:
                 raise TypeError("ellipsis are not supported.")
-            elif k is None:
-                shape.append(1)
-                stride = 1
-                for s in self._strides[axis:]:
-                    stride *= s
-                strides.append(stride)
             else:
                 raise TypeError("key elements must be instaces of int or slice.")
-
-        shape.extend(self.shape[axis:])
-        strides.extend(self._strides[axis:])
         
-        return offset, tuple(shape), tuple(strides)
+        offset, shape, strides, params = _index_plan(
+            tuple(signature), self._shape, self._strides, self._itemsize)
+        
+        offset += self._offset
+        for k, (axissize, stride, axis) in zip(indices, params):
+            if not -axissize <= k < axissize:
+                raise IndexError('index %i is out of bounds for axis %i '
+                                 'with size %s' % (k, axis, axissize))
+            offset += (k + axissize if k < 0 else k) * stride
+        return offset, shape, strides
+    
+    def _element_offset(self, key):
+        """ Get the offset of the element that key (an int for each
+        dimension) refers to, or None if key is not like that.
+        """
+        if key.__class__ is int:
+            key = (key, )
+        elif key.__class__ is not tuple:
+            return None
+        if len(key) != len(self._shape):
+            return None
+        offset = self._offset
+        for axis, k in enumerate(key):
+            if k.__class__ is not int:
+                return None
+            n = self._shape[axis]
+            if k < 0:
+                k += n
+            if not 0 <= k < n:
+                raise IndexError('index %i is out of bounds for axis %i '
+                                 'with size %s' % (key[axis], axis, n))
+            offset += k * self._estrides[axis]
+        return offset
+    
+    def _advanced_index_helper(self, key):
+        """ Plan advanced indexing with key, which contains index arrays
+        or boolean masks. Returns (offsets, shape, strides, rshape, axes):
+        the element offsets of each indexed block (in C order of the
+        broadcast index shape), the shape and element strides of these
+        blocks, the shape of the result with the index dims first, and
+        the axes to transpose that result by (or None).
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        
+        # Expand masks into index arrays, and replace all indices (ints
+        # included) by full slices to get the basic part of the key
+        basic, indices, positions = [], [], []
+        axis = 0
+        for k in key:
+            if isinstance(k, list):
+                k = array(k) if k else array(k, 'int64')
+            if isinstance(k, ndarray) and k.dtype == 'bool':
+                if k._shape != self._shape[axis:axis + k.ndim]:
+                    raise IndexError('boolean index of shape %s does not '
+                                     'match indexed array of shape %s at '
+                                     'axis %i' % (k._shape, self._shape,
+                                                  axis))
+                k = k.nonzero()
+            elif isinstance(k, ndarray):
+                if not k.dtype.startswith(('int', 'uint')):
+                    raise IndexError('arrays used as indices must be of '
+                                     'integer (or boolean) type')
+                k = (k, )
+            elif isinstance(k, int):
+                k = (k, )
+            else:
+                basic.append(k)
+                axis += k is not None
+                continue
+            for index in k:
+                positions.append(len(basic))
+                indices.append(index)
+                basic.append(slice(None))
+                axis += 1
+        offset, shape, strides = self._index_helper(tuple(basic))
+        strides = [s // self.itemsize for s in strides]
+        
+        # Offsets of the indexed blocks, and the shape of these blocks
+        ishape = _broadcast_shapes(*[_shape_of(i) for i in indices])
+        if len(indices) == 1:
+            # A single index array (or mask), check bounds in one go
+            n, stride = shape[positions[0]], strides[positions[0]]
+            idx = indices[0]._toflatlist()
+            if idx and not (-n <= min(idx) and max(idx) < n):
+                bad = [i for i in idx if not -n <= i < n][0]
+                raise IndexError('index %i is out of bounds for axis with '
+                                 'size %i' % (bad, n))
+            offsets = [offset + (i + n if i < 0 else i) * stride
+                       for i in idx]
+        else:
+            func = _index_offset_func(offset, [shape[i] for i in positions],
+                                      [strides[i] for i in positions])
+            offsets = _elementwise(func, indices, 'int64')._toflatlist()
+        rest = [i for i in range(len(shape)) if i not in positions]
+        bshape = tuple([shape[i] for i in rest])
+        bstrides = tuple([strides[i] for i in rest])
+        
+        # Index dims replace the indexed axes if these are adjacent,
+        # otherwise they go first
+        axes = None
+        if positions[0] and positions[-1] - positions[0] == len(positions) - 1:
+            n, p = len(ishape), positions[0]
+            axes = (list(range(n, n + p)) + list(range(n)) +
+                    list(range(n + p, n + len(bshape))))
+        return offsets, bshape, bstrides, ishape + bshape, axes
     
     def _toflatlist(self):
         value_list = []
-        subviews = [self]
-        count = 0
-        while subviews:
-            subview = subviews.pop(0)
-            step = _get_step(subview)
-            if step:
-                s = slice(subview._offset, 
-                          subview._offset + subview.size * step, 
-                          step)
-                value_list += self._data[s]
-                count += 1
-            else:
-                for i in range(subview.shape[0]):
-                    subviews.append(subview[i])
+        data = self._data
+        for start, n, step in _runs(self._shape, self._estrides,
+                                    self._offset):
+            value_list += _read_run(data, start, n, step)
         return value_list
     
     ## Properties
@@ -1127,6 +3346,8 @@ class ndarray(object):
             # Contiguous, hooray!
             self._shape = tuple(newshape)
             self._strides = _strides_for_shape(self._shape, self.itemsize)
+            self._estrides = tuple([s // self._itemsize
+                                    for s in self._strides])
             return
         
         # Else, try harder ... This code supports adding /removing
@@ -1163,6 +3384,7 @@ class ndarray(object):
             newstrides.reverse()
             self._shape = tuple(newshape)
             self._strides = tuple(newstrides)
+            self._estrides = tuple([s // self._itemsize for s in newstrides])
     
     shape = property(_get_shape, _set_shape)  # Python 2.5 compat (e.g. Jython)
     
@@ -1188,20 +3410,11 @@ class ndarray(object):
     
     @property
     def flat(self):
-        subviews = [self]
-        count = 0
-        while subviews:
-            subview = subviews.pop(0)
-            step = _get_step(subview)
-            if step:
-                s = slice(subview._offset, 
-                          subview._offset + subview.size * step, 
-                          step)
-                for i in self._data[s]:
-                    yield i
-            else:
-                for i in range(subview.shape[0]):
-                    subviews.append(subview[i])
+        data = self._data
+        for start, n, step in _runs(self._shape, self._estrides,
+                                    self._offset):
+            for i in _read_run(data, start, n, step):
+                yield i
     
     @property
     def T(self):
@@ -1217,7 +3430,7 @@ class ndarray(object):
         return dict(C_CONTIGUOUS=c_cont,
                     F_CONTIGUOUS=(c_cont and self.ndim < 2),
                     OWNDATA=(self._base is None),
-                    WRITEABLE=True, # todo: fix this
+                    WRITEABLE=not getattr(self._data, 'readonly', False),
                     ALIGNED=c_cont,  # todo: different from contiguous?
                     UPDATEIFCOPY=False,  # We don't support this feature
                )
@@ -1228,17 +3441,18 @@ class ndarray(object):
         assert isinstance(value, (int, float))
         self[:] = value
     
-    def clip(self, a_min, a_max, out=None):
-        if out is None:
-            out = empty(self.shape, self.dtype)
-        L = self._toflatlist()
-        L = [min(a_max, max(a_min, x)) for x in L]
-        out[:] = L
-        return out
+    def clip(self, a_min=None, a_max=None, out=None):
+        if a_min is None and a_max is None:
+            raise ValueError('One of max or min must be given')
+        elif a_max is None:
+            return _elementwise(_maximum, (self, a_min), self.dtype, out)
+        elif a_min is None:
+            return _elementwise(_minimum, (self, a_max), self.dtype, out)
+        return _elementwise(_clip, (self, a_min, a_max), self.dtype, out)
     
     def copy(self):
         out = empty(self.shape, self.dtype)
-        out[:] = self
+        _copy_into(out, self)
         return out
     
     def flatten(self):
@@ -1266,36 +3480,49 @@ class ndarray(object):
             out.shape = newshape
         return out
     
-    def transpose(self):
-        # Numpy returns a view, but we cannot do that since we do not
-        # support Fortran ordering
-        ndim = self.ndim
-        if ndim < 2:
-            return self.view()
-        shape = self.shape[::-1]
-        out = empty(shape, self.dtype)
-        #
-        if ndim == 2:
-            for i in xrange(self.shape[0]):
-                out[:, i] = self[i, :]
-        elif ndim == 3:
-            for i in xrange(self.shape[0]):
-                for j in xrange(self.shape[1]):
-                    out[:, j, i] = self[i, j, :]
-        else:
-            raise ValueError('Tinynumpy supports transpose up to ndim=3')
-        return out
+    def transpose(self, *axes):
+        """ Get a view with the axes permuted (reversed by default).
+        Only the shape and strides are permuted, no data is copied.
+        """
+        if len(axes) == 1 and (axes[0] is None or
+                               isinstance(axes[0], (tuple, list))):
+            axes = axes[0]
+        if not axes:
+            axes = tuple(range(self.ndim))[::-1]
+        if sorted(_normalize_axis(axes, self.ndim)) != list(range(self.ndim)):
+            raise ValueError("axes don't match array")
+        axes = [ax % self.ndim for ax in axes]
+        return _view(self, tuple([self._shape[ax] for ax in axes]),
+                     tuple([self._strides[ax] for ax in axes]), self._offset)
+    
+    def swapaxes(self, axis1, axis2):
+        """ Get a view with axis1 and axis2 interchanged.
+        """
+        axes = list(range(self.ndim))
+        axis1, = _normalize_axis(axis1, self.ndim)
+        axis2, = _normalize_axis(axis2, self.ndim)
+        axes[axis1], axes[axis2] = axes[axis2], axes[axis1]
+        return self.transpose(axes)
+    
+    def dot(self, b, out=None):
+        return dot(self, b, out)
     
     def astype(self, dtype):
-        out = empty(self.shape, dtype)
-        out[:] = self
+        dtype = _check_dtype(dtype)
+        kind = _dtype_descrs[dtype].kind
+        if kind == 'b':
+            convert = operator.truth
+        elif kind in 'ui' and _dtype_descrs[self._dtype].kind == 'f':
+            convert = int  # Truncate, like numpy
+        else:
+            convert = _same
+        return _elementwise(convert, (self, ), dtype)
     
     def view(self, dtype=None, type=None):
         if dtype is None:
             dtype = self.dtype
-        if dtype == self.dtype:
-            return ndarray(self.shape, dtype, buffer=self, 
-                           offset=self._offset, strides=self.strides)
+        if _convert_dtype(dtype) == self.dtype:
+            return _view(self, self._shape, self._strides, self._offset)
         elif self.ndim == 1:
             itemsize = int(_convert_dtype(dtype, 'short')[-1])
             size = self.nbytes // itemsize
@@ -1307,143 +3534,247 @@ class ndarray(object):
     
     ## Methods - statistics
     
-    # We use the self.flat generator here. self._toflatlist() would be
-    # faster, but it might take up significantly more memory.
+    # The reductions below walk the array as strided runs of the
+    # underlying buffer. Each output element is combined from partial
+    # results per run, so the values are never all in memory at once.
     
-    def all(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return all(self.flat)
+    def all(self, axis=None, out=None, keepdims=False, where=True):
+        return _reduce(self, all, all, axis, keepdims, 'bool', out, where)
     
-    def any(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return any(self.flat)
+    def any(self, axis=None, out=None, keepdims=False, where=True):
+        return _reduce(self, any, any, axis, keepdims, 'bool', out, where)
     
-    def min(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return min(self.flat)
+    def min(self, axis=None, out=None, keepdims=False, where=True):
+        return _reduce(self, min, min, axis, keepdims, None, out, where)
     
-    def max(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return max(self.flat)
-        #return max(self._toflatlist())  # almost twice as fast
+    def max(self, axis=None, out=None, keepdims=False, where=True):
+        return _reduce(self, max, max, axis, keepdims, None, out, where)
     
-    def sum(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return sum(self.flat)
+    def sum(self, axis=None, dtype=None, out=None, keepdims=False,
+            where=True):
+        dtype = _convert_dtype(dtype) or _sum_dtype(self.dtype)
+        return _reduce(self, sum, sum, axis, keepdims, dtype, out, where)
     
-    def prod(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        p = 1.0
-        for i in self.flat:
-            p *= float(i)
-        return p
+    def prod(self, axis=None, dtype=None, out=None, keepdims=False,
+             where=True):
+        dtype = _convert_dtype(dtype) or _sum_dtype(self.dtype)
+        return _reduce(self, _prod, _prod, axis, keepdims, dtype, out, where)
         
-    def ptp(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        mn = self.data[self._offset]
-        mx = mn
-        for i in self.flat:
-            if i > mx:
-                mx = i
-            if i < mn:
-                mn = i
-        return mx - mn
-
-    def mean(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        return self.sum() / self.size
+    def ptp(self, axis=None, out=None, keepdims=False):
+        def minmax(run):
+            return min(run), max(run)
+        def combine(parts):
+            return (max([p[1] for p in parts]) - min([p[0] for p in parts]))
+        return _reduce(self, minmax, combine, axis, keepdims, None, out)
+
+    def mean(self, axis=None, dtype=None, out=None, keepdims=False,
+             where=True):
+        def count_and_sum(run):
+            return len(run), sum(run)
+        def combine(parts):
+            n = sum([p[0] for p in parts])
+            return sum([p[1] for p in parts]) / n if n else nan
+        dtype = _convert_dtype(dtype) or _mean_dtype(self.dtype)
+        return _reduce(self, count_and_sum, combine, axis, keepdims, dtype,
+                       out, where)
     
-    def argmax(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        r = self.data[self._offset]
-        r_index = 0
-        for i_index, i in enumerate(self.flat):
-            if i > r:
-                r = i
-                r_index = i_index
-        return r_index
-
-    def argmin(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        r = self.data[self._offset]
-        r_index = 0
-        for i_index, i in enumerate(self.flat):
-            if i < r:
-                r = i
-                r_index = i_index
-        return r_index
-    
-    def cumprod(self, axis=None, out=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
+    def argmax(self, axis=None, out=None, keepdims=False):
+        return _reduce(self, list, _arg_best(operator.gt), axis, keepdims,
+                       'int64', out)
+
+    def argmin(self, axis=None, out=None, keepdims=False):
+        return _reduce(self, list, _arg_best(operator.lt), axis, keepdims,
+                       'int64', out)
+    
+    def _accumulate(self, op, axis, dtype, out):
+        if axis is None:
+            src, axis = self.ravel(), 0
+        else:
+            src = self
+            axis, = _normalize_axis(axis, self.ndim)
+        dtype = _convert_dtype(dtype) or _sum_dtype(self.dtype)
         if out is None:
-            out = empty((self.size,), self.dtype)
-        p = 1
-        L = []
-        for x in self.flat:
-            p *= x
-            L.append(p)
-        out[:] = L
+            out = empty(src.shape, dtype)
+        elif out.shape != src.shape:
+            raise ValueError('out has the wrong shape')
+        _lane_map(src, out, axis, lambda run: _accumulated(op, run))
         return out
+    
+    def cumprod(self, axis=None, dtype=None, out=None):
+        return self._accumulate(operator.mul, axis, dtype, out)
 
-    def cumsum(self, axis=None, out=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        if out is None:
-            out = empty((self.size,), self.dtype)
-        p = 0
-        L = []
-        for x in self.flat:
-            p += x
-            L.append(p)
-        out[:] = L
+    def cumsum(self, axis=None, dtype=None, out=None):
+        return self._accumulate(operator.add, axis, dtype, out)
+
+    def var(self, axis=None, dtype=None, out=None, ddof=0, keepdims=False,
+            where=True):
+        def combine(parts):
+            n, m, m2 = _combine_moments(parts)
+            return m2 / (n - ddof) if n > ddof else nan
+        dtype = _convert_dtype(dtype) or _mean_dtype(self.dtype)
+        return _reduce(self, _moments, combine, axis, keepdims, dtype,
+                       out, where)
+
+    def std(self, axis=None, dtype=None, out=None, ddof=0, keepdims=False,
+            where=True):
+        def combine(parts):
+            n, m, m2 = _combine_moments(parts)
+            return math.sqrt(m2 / (n - ddof)) if n > ddof else nan
+        dtype = _convert_dtype(dtype) or _mean_dtype(self.dtype)
+        return _reduce(self, _moments, combine, axis, keepdims, dtype,
+                       out, where)
+
+    def sort(self, axis=-1, kind=None, order=None):
+        """ Sort the array in place along the given axis. The kind
+        argument is ignored; order is not supported.
+        """
+        if order is not None:
+            raise ValueError('order is not supported')
+        axis, = _normalize_axis(axis, self.ndim)
+        isfloat = _dtype_descrs[self.dtype].kind == 'f'
+        _lane_map(self, self, axis, lambda run: _sort_lane(run, isfloat))
+
+    def argsort(self, axis=-1, kind=None, order=None):
+        """ Get the indices that would sort the array along the given
+        axis. With axis None, the flattened array is used.
+        """
+        if order is not None:
+            raise ValueError('order is not supported')
+        src = self.ravel() if axis is None else self
+        axis, = _normalize_axis(-1 if axis is None else axis, src.ndim)
+        isfloat = _dtype_descrs[self.dtype].kind == 'f'
+        out = empty(src.shape, 'int64')
+        _lane_map(src, out, axis, lambda run: _argsort_lane(run, isfloat))
         return out
 
-    def var(self, axis=None):
-        if axis:
-            raise (TypeError, "axis argument is not supported")
-        m = self.mean()
-        acc = 0
-        for x in self.flat:
-            acc += abs(x - m) ** 2
-        return acc / self.size
+    def partition(self, kth, axis=-1, kind=None, order=None):
+        """ Partition the array in place along the given axis, such that
+        the element(s) at kth are in their sorted position.
+        """
+        if order is not None:
+            raise ValueError('order is not supported')
+        axis, = _normalize_axis(axis, self.ndim)
+        kth = _normalize_kth(kth, self._shape[axis])
+        isfloat = _dtype_descrs[self.dtype].kind == 'f'
+        _lane_map(self, self, axis,
+                  lambda run: _partition_lane(run, kth, isfloat))
+
+    def argpartition(self, kth, axis=-1, kind=None, order=None):
+        """ Get the indices that would partition the array along the
+        given axis. With axis None, the flattened array is used.
+        """
+        if order is not None:
+            raise ValueError('order is not supported')
+        src = self.ravel() if axis is None else self
+        axis, = _normalize_axis(-1 if axis is None else axis, src.ndim)
+        kth = _normalize_kth(kth, src._shape[axis])
+        isfloat = _dtype_descrs[self.dtype].kind == 'f'
+        out = empty(src.shape, 'int64')
+        _lane_map(src, out, axis,
+                  lambda run: _partition_lane(run, kth, isfloat, True))
+        return out
 
-    def std(self, axis=None):
-        return sqrt(self.var(axis))
+    def searchsorted(self, v, side='left', sorter=None):
+        """ Find the indices where the values v should be inserted to
+        maintain order, using binary search. The array must be 1-D and
+        sorted, or sorter must give the indices that sort it.
+        """
+        if self.ndim != 1:
+            raise ValueError('searchsorted requires a 1-D array')
+        if side not in ('left', 'right'):
+            raise ValueError("side must be 'left' or 'right'")
+        find = bisect.bisect_left if side == 'left' else bisect.bisect_right
+        values = list(_read_run(self._data, self._offset, self._shape[0],
+                                self._estrides[0]))
+        if sorter is not None:
+            values = [values[i] for i in array(sorter, copy=False).flat]
+        v = array(v, copy=False)
+        result = [find(values, x) for x in v.flat]
+        if not v.ndim:
+            return result[0]
+        return array(result, 'int64').reshape(v.shape)
+
+    def nonzero(self):
+        """ Get a tuple of index arrays, one for each dimension, of the
+        elements that are non-zero.
+        """
+        flat = self._toflatlist()
+        idx = list(compress(xrange(len(flat)), flat))
+        return tuple([array(i, 'int64')
+                      for i in _unravel_indices(idx, self._shape)])
 
     def argwhere(self, val):
         #assumes that list has only values of same dtype
 
-        idx  = [i for i, e in enumerate(self.flat) if e == val]
-        keys = [list(_key_for_index(i, self.shape)) for i in idx]
-        return keys
+        flat = self._toflatlist()
+        idx = [i for i, e in enumerate(flat) if e == val]
+        return [list(key) for key in
+                zip(*_unravel_indices(idx, self._shape))]
 
+    def _item_offset(self, args):
+        # Offset for item() and itemset(): no index (for size 1),
+        # a flat index or an index for each dimension
+        if not args:
+            if self.size != 1:
+                raise ValueError('can only convert an array of size 1 to '
+                                 'a Python scalar')
+            return self._offset
+        if len(args) == 1 and len(self._shape) != 1:
+            index, size = args[0], self.size
+            if not -size <= index < size:
+                raise IndexError('index %i is out of bounds for size %i' %
+                                 (index, size))
+            index %= size
+            args = []
+            for n in reversed(self._shape):
+                args.insert(0, index % n)
+                index //= n
+        offset = self._element_offset(tuple(args))
+        if offset is None:
+            raise ValueError('incorrect number of indices for array')
+        return offset
+    
+    def item(self, *args):
+        """ Get a single element as a Python scalar. Takes no arguments
+        for arrays of size 1, a flat index, or an index for each dimension.
+        """
+        return self._data[self._item_offset(args)]
+    
+    def itemset(self, *args):
+        """ Set a single element, given as for item(), to the value
+        given as the last argument.
+        """
+        if not args:
+            raise ValueError('itemset must have at least one argument')
+        self._data[self._item_offset(args[:-1])] = args[-1]
+    
     def tolist(self):
         '''
         Returns the ndarray as a comprehensive list 
         '''
-        shp    = list(self.shape).copy()
-        jump   = self.size//shp[-1]
-        n_comp = 0 #comprehension depth
-        comp   = list(self._data).copy()
-        while n_comp < len(self.shape)-1 :
-            comp = [comp[i*shp[-1]:i*shp[-1]+shp[-1]] for i in range(jump)]
-            shp.pop()
-            jump = len(comp)//shp[-1]
-            n_comp +=1
+        comp = self._toflatlist()
+        if not self._shape:
+            return comp[0]
+        for n in reversed(self.shape[1:]):
+            comp = [comp[i:i + n] for i in xrange(0, len(comp), n)]
         return comp
 
 
+def _view(a, shape, strides, offset):
+    """ Create a view on the data of array a, with the given shape,
+    strides (in bytes) and offset (in elements). For internal use; no
+    checks are done, and the storage of a is shared as it is.
+    """
+    view = ndarray.__new__(ndarray)
+    view._dtype = a._dtype
+    view._itemsize = itemsize = a._itemsize
+    view._shape = shape
+    view._strides = strides
+    view._estrides = tuple([s // itemsize for s in strides])
+    view._offset = offset
+    view._base = a if a._base is None else a._base
+    view._data = a._data
+    return view
 
 
 class nditer:
@@ -1470,4 +3801,619 @@ class nditer:
         return value
 
     def next(self):
-        return self.__next__()
\ No newline at end of file
+        return self.__next__()
+
+
+## Lazy evaluation
+
+_infix_ops = {operator.add: '+', operator.sub: '-', operator.mul: '*',
+              operator.truediv: '/', operator.floordiv: '//',
+              operator.mod: '%', operator.pow: '**', operator.and_: '&',
+              operator.or_: '|', operator.xor: '^', operator.eq: '==',
+              operator.ne: '!=', operator.lt: '<', operator.le: '<=',
+              operator.gt: '>', operator.ge: '>='}
+
+_prefix_ops = {operator.neg: '-', operator.pos: '+', operator.invert: '~',
+               operator.not_: 'not '}
+
+# Intermediate results are plain Python numbers, which matches the dtype
+# only for these (and for bools from comparisons and logical ops); e.g.
+# uint8 would not wrap around, and float32 would not be rounded
+_fusable_dtypes = ('int64', 'float64')
+
+
+def lazy(a):
+    """ lazy(a)
+    
+    Wrap an array for lazy evaluation. Operators on the result build
+    an expression instead of computing temporary arrays. When the
+    result is needed, the whole expression is evaluated in a single
+    pass over the operands, e.g. ``lazy(a) * b + c * d - e`` creates
+    one array instead of four. Use ``evaluate()`` to get the result
+    explicitly; other ndarray attributes and methods evaluate implicitly.
+    """
+    if isinstance(a, LazyArray):
+        return a
+    return LazyArray(None, (_as_operand(a), ))
+
+
+class LazyArray(object):
+    """ An unevaluated elementwise expression, see `lazy`.
+    """
+    
+    __slots__ = ['_op', '_args', '_shape', '_dtype']
+    
+    def __init__(self, op, args):
+        self._op = op
+        self._args = args
+        if op is None:
+            self._shape, self._dtype = _shape_of(args[0]), args[0].dtype
+        else:
+            self._shape = _broadcast_shapes(*[_shape_of(x) for x in args])
+            self._dtype = _result_dtype(op, *args)
+    
+    @property
+    def shape(self):
+        return self._shape
+    
+    @property
+    def dtype(self):
+        return self._dtype
+    
+    @property
+    def ndim(self):
+        return len(self._shape)
+    
+    @property
+    def size(self):
+        return _size_for_shape(self._shape)
+    
+    def _compile(self):
+        """ Get a function that computes the expression for one element,
+        and the operands (leaves) that it takes as arguments.
+        """
+        leaves, leaf_ids, defaults, evaluated = [], {}, [], {}
+        
+        def arg(x):
+            if isinstance(x, LazyArray) and x._op is None:
+                x = x._args[0]
+            if isinstance(x, LazyArray) and not (
+                    x._dtype in _fusable_dtypes or x._op in _bool_ops):
+                # Evaluated separately, so that its values get the dtype
+                if id(x) not in evaluated:
+                    evaluated[id(x)] = x.evaluate()
+                x = evaluated[id(x)]
+            if isinstance(x, LazyArray):
+                return '(%s)' % expr(x)
+            elif isinstance(x, ndarray):
+                if id(x) not in leaf_ids:
+                    leaf_ids[id(x)] = 'x%i' % len(leaves)
+                    leaves.append(x)
+                return leaf_ids[id(x)]
+            else:
+                defaults.append(x)
+                return '_c%i' % (len(defaults) - 1)
+        
+        def expr(node):
+            args = [arg(x) for x in node._args]
+            if node._op in _infix_ops:
+                return (' %s ' % _infix_ops[node._op]).join(args)
+            elif node._op in _prefix_ops:
+                return _prefix_ops[node._op] + args[0]
+            defaults.append(node._op)
+            return '_c%i(%s)' % (len(defaults) - 1, ', '.join(args))
+        
+        # The root is always fused, its result is stored with its dtype
+        body = arg(self) if self._op is None else expr(self)
+        names = [leaf_ids[id(x)] for x in leaves]
+        names += ['_c%i=_c%i' % (i, i) for i in range(len(defaults))]
+        namespace = dict([('_c%i' % i, x) for i, x in enumerate(defaults)])
+        func = eval('lambda %s: %s' % (', '.join(names), body), namespace)
+        return func, leaves
+    
+    def evaluate(self, out=None):
+        """ Evaluate the expression in one pass over its operands, and
+        return the result in a new array, or in out if given.
+        """
+        if self._op is None and out is None:
+            return self._args[0]
+        func, leaves = self._compile()
+        if not leaves:
+            raise ValueError('expression has no array operands')
+        return _elementwise(func, leaves, self._dtype, out)
+    
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)  # e.g. __array_interface__
+        return getattr(self.evaluate(), name)
+    
+    def __repr__(self):
+        return repr(self.evaluate())
+    
+    def __len__(self):
+        return self._shape[0]
+    
+    def __getitem__(self, key):
+        return self.evaluate()[key]
+    
+    def __neg__(self):
+        return LazyArray(operator.neg, (self, ))
+    
+    def __pos__(self):
+        return LazyArray(operator.pos, (self, ))
+    
+    def __abs__(self):
+        return LazyArray(abs, (self, ))
+    
+    def __invert__(self):
+        return LazyArray(_invert_op(self._dtype), (self, ))
+
+
+def _lazy_binary(op):
+    def method(self, other):
+        return LazyArray(op, (self, _as_lazy_operand(other)))
+    def rmethod(self, other):
+        return LazyArray(op, (_as_lazy_operand(other), self))
+    return method, rmethod
+
+
+def _as_lazy_operand(x):
+    if isinstance(x, LazyArray):
+        return x
+    return _as_operand(x)
+
+
+for _name, _op in [('add', operator.add), ('sub', operator.sub),
+                   ('mul', operator.mul), ('truediv', operator.truediv),
+                   ('div', operator.truediv),
+                   ('floordiv', operator.floordiv), ('mod', operator.mod),
+                   ('pow', operator.pow), ('and', operator.and_),
+                   ('or', operator.or_), ('xor', operator.xor)]:
+    _method, _rmethod = _lazy_binary(_op)
+    setattr(LazyArray, '__%s__' % _name, _method)
+    setattr(LazyArray, '__r%s__' % _name, _rmethod)
+for _name, _op in [('eq', operator.eq), ('ne', operator.ne),
+                   ('lt', operator.lt), ('le', operator.le),
+                   ('gt', operator.gt), ('ge', operator.ge)]:
+    setattr(LazyArray, '__%s__' % _name, _lazy_binary(_op)[0])
+del _name, _op, _method, _rmethod
+
+
+## Chunked arrays
+
+
+def _chunk_part(start, step, count, c0, c1):
+    """ For the selection of count positions start + k * step along an
+    axis, get the range of k (kstart, kstop) for which the positions
+    lie in the chunk [c0, c1).
+    """
+    if step > 0:
+        kstart, kstop = -((start - c0) // step), -((start - c1) // step)
+    else:
+        kstart, kstop = -((start - c1 + 1) // step), (c0 - start) // step + 1
+    return max(kstart, 0), min(kstop, count)
+
+
+def _chunked_key(key, shape):
+    """ Turn a basic index key (ints, slices and Ellipsis) into a list
+    of (start, step, count) for each axis, and a list of the axes that
+    are indexed with an int (and thus dropped).
+    """
+    key = key if isinstance(key, tuple) else (key, )
+    ellipsis = [i for i, k in enumerate(key) if k is Ellipsis]
+    if ellipsis:
+        i = ellipsis[0]
+        key = key[:i] + (slice(None), ) * (len(shape) - len(key) + 1) + \
+            key[i + 1:]
+    if len(key) > len(shape):
+        raise IndexError('too many indices for array')
+    key += (slice(None), ) * (len(shape) - len(key))
+    selections, dropped = [], []
+    for axis, (k, n) in enumerate(zip(key, shape)):
+        if isinstance(k, slice):
+            start, stop, step = k.indices(n)
+            selections.append((start, step, len(xrange(start, stop, step))))
+        else:
+            k = operator.index(k)
+            if not -n <= k < n:
+                raise IndexError('index %i is out of bounds for axis %i '
+                                 'with size %i' % (k, axis, n))
+            selections.append((k % n, 1, 1))
+            dropped.append(axis)
+    return selections, dropped
+
+
+def _broadcast_view(a, shape):
+    """ Get a view of array a, broadcast to the given shape.
+    """
+    if _broadcast_shapes(a._shape, shape) != tuple(shape):
+        raise ValueError('operands could not be broadcast together with '
+                         'shapes %s %s' % (a._shape, tuple(shape)))
+    pad = len(shape) - len(a._shape)
+    strides = (0, ) * pad + tuple([0 if n == 1 else s for n, s in
+                                   zip(a._shape, a._strides)])
+    return _view(a, tuple(shape), strides, a._offset)
+
+
+def _chunked_elementwise(op, operands, dtype=None, out=None, where=True):
+    """ Apply op elementwise to operands of which at least one is a
+    ChunkedArray. The result is a ChunkedArray with the same chunks,
+    of which each chunk is computed when it is needed.
+    """
+    if out is not None or where is not True:
+        raise TypeError('out and where are not supported for chunked '
+                        'arrays')
+    first = [x for x in operands if isinstance(x, ChunkedArray)][0]
+    shape, chunks = first._shape, first._chunks
+    args = []
+    for x in operands:
+        if isinstance(x, ChunkedArray):
+            if (x._shape, x._chunks) != (shape, chunks):
+                raise ValueError('chunked operands must have the same shape '
+                                 'and chunks')
+        else:
+            x = _as_operand(x)
+            if isinstance(x, ndarray):
+                x = _broadcast_view(x, shape)
+        args.append(x)
+    if dtype is None:
+        dtype = _result_dtype(op, *[x.dtype if isinstance(x, ChunkedArray)
+                                    else x for x in args])
+
+    def loader(index):
+        slices = first._chunk_slices(index)
+        return _elementwise(op, [x.chunk(index) if isinstance(x, ChunkedArray)
+                                 else x[slices] if isinstance(x, ndarray)
+                                 else x for x in args], dtype)
+    return ChunkedArray(shape, chunks, dtype, loader, first._max_resident)
+
+
+class ChunkedArray(object):
+    """ ChunkedArray(shape, chunks, dtype, loader, max_resident=16)
+    
+    An array that is stored as a grid of chunks, so that it does not
+    need to fit in memory. Each chunk is an ndarray of shape chunks
+    (smaller at the far edges of the array), that is obtained by calling
+    loader(index) with its (tuple) index into the grid; e.g. a function
+    that reads a file or generates the data. Only the chunks that an
+    operation needs are loaded, and at most max_resident chunks are kept
+    in memory, evicting the least recently used. See also load_chunked()
+    and save_chunked().
+    
+    Operators and ufuncs apply elementwise per chunk, and give a new
+    ChunkedArray whose chunks are computed when needed. Indexing with
+    ints and slices, and reductions (sum, mean, min, max, ...) over any
+    axis, give an ndarray (or a scalar).
+    """
+    
+    __slots__ = ['_shape', '_chunks', '_dtype', '_loader', '_resident',
+                 '_max_resident', '_stats']
+    
+    def __init__(self, shape, chunks, dtype, loader, max_resident=16):
+        shape = tuple([operator.index(n) for n in shape])
+        chunks = tuple([operator.index(c) for c in chunks])
+        if not shape:
+            raise ValueError('chunked arrays must have at least one '
+                             'dimension')
+        if len(chunks) != len(shape) or min(chunks) < 1:
+            raise ValueError('chunks must be a positive size for each '
+                             'dimension')
+        if max_resident < 1:
+            raise ValueError('max_resident must be at least 1')
+        self._shape = shape
+        self._chunks = chunks
+        self._dtype = _check_dtype(dtype)
+        self._loader = loader
+        self._resident = OrderedDict()
+        self._max_resident = max_resident
+        self._stats = [0, 0]  # hits, misses
+    
+    @property
+    def shape(self):
+        return self._shape
+    
+    @property
+    def chunks(self):
+        return self._chunks
+    
+    @property
+    def dtype(self):
+        return self._dtype
+    
+    @property
+    def ndim(self):
+        return len(self._shape)
+    
+    @property
+    def size(self):
+        return _size_for_shape(self._shape)
+    
+    @property
+    def grid(self):
+        """ The number of chunks along each axis.
+        """
+        return tuple([_ceildiv(n, c) for n, c in
+                      zip(self._shape, self._chunks)])
+    
+    def __len__(self):
+        return self._shape[0]
+    
+    def __repr__(self):
+        return '<ChunkedArray shape=%s, chunks=%s, dtype=%r>' % (
+            self._shape, self._chunks, self._dtype)
+    
+    def _chunk_slices(self, index):
+        return tuple([slice(i * c, min(i * c + c, n)) for i, c, n in
+                      zip(index, self._chunks, self._shape)])
+    
+    def chunk(self, index):
+        """ Get the chunk at the given grid index as an ndarray, loading
+        it if it is not resident.
+        """
+        index = tuple(index)
+        resident = self._resident
+        a = resident.get(index)
+        if a is not None:
+            self._stats[0] += 1
+            try:
+                resident.move_to_end(index)
+            except AttributeError:  # Python 2
+                resident[index] = resident.pop(index)
+            return a
+        self._stats[1] += 1
+        if len(index) != len(self._shape) or not all(
+                [0 <= i < g for i, g in zip(index, self.grid)]):
+            raise IndexError('chunk index %r is out of bounds for grid %s'
+                             % (index, self.grid))
+        shape = tuple([s.stop - s.start for s in self._chunk_slices(index)])
+        a = self._loader(index)
+        if not isinstance(a, ndarray) or a.dtype != self._dtype:
+            a = array(a, self._dtype)
+        if a.shape != shape:
+            raise ValueError('chunk %r has shape %s, expected %s' %
+                             (index, a.shape, shape))
+        if len(resident) >= self._max_resident:
+            resident.popitem(last=False)
+        resident[index] = a
+        return a
+    
+    def iterchunks(self):
+        """ Generate (index, chunk) for all chunks, in C order.
+        """
+        for index in product(*[xrange(g) for g in self.grid]):
+            yield index, self.chunk(index)
+    
+    def cache_info(self):
+        """ Get a dict with the hits, misses, maxsize and currsize of the
+        resident chunks.
+        """
+        return dict(hits=self._stats[0], misses=self._stats[1],
+                    maxsize=self._max_resident, currsize=len(self._resident))
+    
+    def cache_clear(self):
+        """ Drop all resident chunks and reset the statistics.
+        """
+        self._resident.clear()
+        self._stats[:] = [0, 0]
+    
+    def __getitem__(self, key):
+        selections, dropped = _chunked_key(key, self._shape)
+        out = empty(tuple([count for start, step, count in selections]),
+                    self._dtype)
+        # For each axis, the chunks that the selection touches, with the
+        # part of the output and of the chunk
+        parts = []
+        for (start, step, count), c, n in zip(selections, self._chunks,
+                                              self._shape):
+            axis_parts = []
+            if count:
+                end = start + (count - 1) * step
+                for i in xrange(min(start, end) // c,
+                                max(start, end) // c + 1):
+                    c0 = i * c
+                    kstart, kstop = _chunk_part(start, step, count,
+                                                c0, min(c0 + c, n))
+                    if kstart < kstop:
+                        axis_parts.append((i, slice(kstart, kstop),
+                                           _run_slice(start + kstart * step
+                                                      - c0, kstop - kstart,
+                                                      step)))
+            parts.append(axis_parts)
+        for combo in product(*parts):
+            a = self.chunk([p[0] for p in combo])
+            _copy_into(out[tuple([p[1] for p in combo])],
+                       a[tuple([p[2] for p in combo])])
+        if len(dropped) == len(self._shape):
+            return out.item()
+        if dropped:
+            out = out.reshape(tuple([n for i, n in enumerate(out._shape)
+                                     if i not in dropped]))
+        return out
+    
+    def map_chunks(self, func, dtype=None):
+        """ Get a ChunkedArray of which each chunk is func(chunk), for
+        a function that returns an array of the same shape. If dtype is
+        not given, it is that of the result for the first chunk.
+        """
+        if dtype is None:
+            dtype = array(func(self.chunk((0, ) * self.ndim))).dtype
+        return ChunkedArray(self._shape, self._chunks, dtype,
+                            lambda index: func(self.chunk(index)),
+                            self._max_resident)
+    
+    def astype(self, dtype):
+        dtype = _check_dtype(dtype)
+        return self.map_chunks(lambda a: a.astype(dtype), dtype)
+    
+    def _reduce(self, name, combine, axis, keepdims, *args):
+        """ Reduce chunk by chunk with the ndarray method of the given
+        name, combining the partial results of chunks that share an
+        output region with the combine ufunc.
+        """
+        if not self.size:
+            return getattr(self[...], name)(axis, *args, keepdims=keepdims)
+        axes = _normalize_axis(axis, self.ndim)
+        out = None
+        for index, a in self.iterchunks():
+            partial = getattr(a, name)(axes, *args, keepdims=True)
+            if out is None:
+                out = empty([1 if i in axes else n for i, n in
+                             enumerate(self._shape)], partial.dtype)
+            region = out[tuple([slice(0, 1) if i in axes else s for i, s in
+                                enumerate(self._chunk_slices(index))])]
+            if all([index[i] == 0 for i in axes]):
+                _copy_into(region, partial)
+            else:
+                combine(region, partial, out=region)
+        if keepdims:
+            return out
+        if len(axes) == self.ndim:
+            return out.item()
+        return out.reshape(tuple([n for i, n in enumerate(self._shape)
+                                  if i not in axes]))
+    
+    def sum(self, axis=None, dtype=None, keepdims=False):
+        return self._reduce('sum', add, axis, keepdims, dtype)
+    
+    def prod(self, axis=None, dtype=None, keepdims=False):
+        return self._reduce('prod', multiply, axis, keepdims, dtype)
+    
+    def min(self, axis=None, keepdims=False):
+        return self._reduce('min', minimum, axis, keepdims)
+    
+    def max(self, axis=None, keepdims=False):
+        return self._reduce('max', maximum, axis, keepdims)
+    
+    def mean(self, axis=None, dtype=None, keepdims=False):
+        axes = _normalize_axis(axis, self.ndim)
+        count = _size_for_shape([self._shape[i] for i in axes])
+        dtype = _convert_dtype(dtype) or _mean_dtype(self._dtype)
+        total = self._reduce('sum', add, axis, keepdims, dtype)
+        if isinstance(total, ndarray):
+            return divide(total, count, out=total)
+        return total / count if count else nan
+    
+    def __neg__(self):
+        return _chunked_elementwise(operator.neg, (self, ))
+    
+    def __pos__(self):
+        return _chunked_elementwise(operator.pos, (self, ))
+    
+    def __abs__(self):
+        return _chunked_elementwise(abs, (self, ))
+    
+    def __invert__(self):
+        return _chunked_elementwise(_invert_op(self._dtype), (self, ))
+
+
+def _chunked_binary(op):
+    def method(self, other):
+        return _chunked_elementwise(op, (self, other))
+    def rmethod(self, other):
+        return _chunked_elementwise(op, (other, self))
+    return method, rmethod
+
+
+for _name, _op in [('add', operator.add), ('sub', operator.sub),
+                   ('mul', operator.mul), ('truediv', operator.truediv),
+                   ('div', operator.truediv),
+                   ('floordiv', operator.floordiv), ('mod', operator.mod),
+                   ('pow', operator.pow), ('and', operator.and_),
+                   ('or', operator.or_), ('xor', operator.xor)]:
+    _method, _rmethod = _chunked_binary(_op)
+    setattr(ChunkedArray, '__%s__' % _name, _method)
+    setattr(ChunkedArray, '__r%s__' % _name, _rmethod)
+for _name, _op in [('eq', operator.eq), ('ne', operator.ne),
+                   ('lt', operator.lt), ('le', operator.le),
+                   ('gt', operator.gt), ('ge', operator.ge)]:
+    setattr(ChunkedArray, '__%s__' % _name, _chunked_binary(_op)[0])
+del _name, _op, _method, _rmethod
+
+
+def _chunk_filename(index, ext):
+    return '.'.join([str(i) for i in index]) + ext
+
+
+def load_chunked(directory, shape=None, chunks=None, dtype=None,
+                 mmap_mode=None, max_resident=16):
+    """ load_chunked(directory, shape=None, chunks=None, dtype=None,
+                     mmap_mode=None, max_resident=16)
+    
+    Get a ChunkedArray for a directory with a file for each chunk,
+    named by its grid index, e.g. '0.0.npy', '0.1.npy', ... for a 2-D
+    array (see save_chunked). For .npy files, the shape, chunks and
+    dtype are read from the headers of the files if not given. Raw
+    files ('0.0.raw', ...) hold the C-contiguous data of a chunk, and
+    need the shape, chunks and dtype. Chunks are loaded when needed,
+    memory-mapped if mmap_mode is given (see load).
+    """
+    names = [name for name in os.listdir(directory)
+             if name.endswith(('.npy', '.raw')) and
+             name[:-4].replace('.', '').isdigit()]
+    if not names:
+        raise ValueError('no chunk files found in %r' % directory)
+    ext = names[0][-4:]
+    indices = set([tuple([int(i) for i in name[:-4].split('.')])
+                   for name in names if name.endswith(ext)])
+    ndim = len(next(iter(indices)))
+    grid = [max([index[d] for index in indices]) + 1 for d in xrange(ndim)]
+    
+    def header(index):
+        filename = os.path.join(directory, _chunk_filename(index, ext))
+        with open(filename, 'rb') as f:
+            return _read_npy_header(f)
+    
+    if ext == '.npy':
+        chunks = chunks or header((0, ) * ndim)[0]
+        dtype = dtype or header((0, ) * ndim)[1]
+        if shape is None:
+            # The chunks at the far edges may be smaller
+            shape = []
+            for d in xrange(ndim):
+                index = [0] * ndim
+                index[d] = grid[d] - 1
+                shape.append((grid[d] - 1) * chunks[d] +
+                             header(index)[0][d])
+    elif shape is None or chunks is None or dtype is None:
+        raise ValueError('shape, chunks and dtype must be given for raw '
+                         'chunk files')
+    dtype = _convert_dtype(dtype)
+
+    def loader(index):
+        filename = os.path.join(directory, _chunk_filename(index, ext))
+        if ext == '.npy':
+            return load(filename, mmap_mode)
+        chunk_shape = tuple([min(c, n - i * c) for i, c, n in
+                             zip(index, chunks, shape)])
+        with open(filename, 'r+b' if mmap_mode == 'r+' else 'rb') as f:
+            return _read_array(f, chunk_shape, dtype, mmap_mode)
+    return ChunkedArray(shape, chunks, dtype, loader, max_resident)
+
+
+def save_chunked(directory, a, chunks=None):
+    """ save_chunked(directory, a, chunks=None)
+    
+    Save an ndarray or ChunkedArray to a directory with a .npy file for
+    each chunk (see load_chunked). The chunks default to those of a
+    ChunkedArray, and are written one at a time.
+    """
+    if isinstance(a, ChunkedArray):
+        source = a
+        chunks = a.chunks if chunks is None else tuple(chunks)
+    else:
+        source = array(a, copy=False)
+        if chunks is None:
+            raise ValueError('chunks must be given to save an ndarray')
+        chunks = tuple(chunks)
+    if isinstance(source, ChunkedArray) and chunks == source.chunks:
+        target = source
+    else:
+        # Read each new chunk from the part of the source that it covers
+        def loader(index):
+            return source[target._chunk_slices(index)]
+        target = ChunkedArray(source.shape, chunks, source.dtype, loader, 1)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for index in product(*[xrange(g) for g in target.grid]):
+        save(os.path.join(directory, _chunk_filename(index, '.npy')),
+             target.chunk(index))
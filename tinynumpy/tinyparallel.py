@@ -0,0 +1,414 @@
+""" Parallel execution of tinynumpy operations on a pool of processes.
+
+Arrays are allocated in shared memory (multiprocessing.shared_memory),
+and the work is split into blocks of rows. The worker processes are only
+sent a description of each block (the name of the shared memory segment,
+the offset, shape and strides), never the data itself.
+"""
+
+from __future__ import division
+
+import atexit
+import operator
+import multiprocessing
+from collections import namedtuple
+from functools import reduce as _fold
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+try:
+    from multiprocessing import resource_tracker
+except ImportError:  # Python < 3.8, or Windows
+    resource_tracker = None
+
+
+def _tnp():
+    # Imported on use, because tinynumpy imports this module
+    import tinynumpy.tinynumpy as tnp
+    return tnp
+
+
+## Shared arrays
+
+if shared_memory is not None:
+    class _Segment(shared_memory.SharedMemory):
+        def __del__(self):
+            try:
+                self.close()
+            except BufferError:
+                pass  # Still used by arrays, unmapped when these are gone
+
+
+# Description of a shared array, which is what is sent to the workers;
+# offset is in elements, strides are in bytes, as for ndarray
+_Shared = namedtuple('_Shared', 'name dtype offset shape strides')
+
+# The segments allocated by this process, by name, and the names of
+# the segments by id of the storage of the arrays that use them
+_segments = {}
+_storages = {}
+
+
+def _check_available():
+    if shared_memory is None:
+        raise RuntimeError('shared memory needs Python 3.8 or newer')
+
+
+def shared_empty(shape, dtype='float64'):
+    """ Get a new (uninitialized) array in shared memory, that can be
+    used in the processes of an Executor without copying. Call release()
+    when it is no longer needed.
+    """
+    _check_available()
+    tnp = _tnp()
+    shape = (shape, ) if isinstance(shape, int) else tuple(shape)
+    dtype = tnp._check_dtype(dtype)
+    nbytes = tnp._size_for_shape(shape) * tnp._dtype_descrs[dtype].itemsize
+    segment = _Segment(create=True, size=max(nbytes, 1))
+    a = tnp.ndarray(shape, dtype, buffer=segment.buf)
+    _segments[segment.name] = segment
+    _storages[id(a._data)] = segment.name, a._data
+    return a
+
+
+def shared_zeros(shape, dtype='float64'):
+    """ Get a new array of zeros in shared memory, see shared_empty().
+    """
+    return shared_empty(shape, dtype)  # New segments are zero-filled
+
+
+def shared_array(obj, dtype=None):
+    """ Get a copy of an array (or array-like) in shared memory, see
+    shared_empty().
+    """
+    tnp = _tnp()
+    obj = tnp.array(obj, dtype, copy=False)
+    a = shared_empty(obj.shape, obj.dtype)
+    tnp._copy_into(a, obj)
+    return a
+
+
+def is_shared(a):
+    """ Get whether the array is (a view of) an array in shared memory
+    that was allocated by this process.
+    """
+    return id(a._data) in _storages
+
+
+def release(a):
+    """ Release the shared memory of an array that was allocated with
+    shared_empty() and friends. The array and its views must not be
+    passed to an Executor anymore.
+    """
+    name, storage = _storages.pop(id(a._data))
+    segment = _segments.pop(name)
+    segment.unlink()
+    del storage, segment  # Closed now, or when the last view is gone
+
+
+@atexit.register
+def _release_all():
+    for segment in list(_segments.values()):
+        segment.unlink()
+    _segments.clear()
+    _storages.clear()
+
+
+def _describe(a, rows=None):
+    """ Get the description of a shared array, or of a block of its
+    rows given as (start, stop).
+    """
+    name = _storages[id(a._data)][0]
+    offset, shape = a._offset, a._shape
+    if rows is not None:
+        offset += rows[0] * a._estrides[0]
+        shape = (rows[1] - rows[0], ) + shape[1:]
+    return _Shared(name, a.dtype, offset, shape, a._strides)
+
+
+def _open(desc, segments):
+    """ Get the array for a description, attaching to its segment.
+    """
+    segment = segments.get(desc.name)
+    if segment is None:
+        try:
+            segment = _Segment(desc.name, track=False)
+        except TypeError:  # Python < 3.13
+            segment = _Segment(desc.name)
+        segments[desc.name] = segment
+    return _tnp().ndarray(desc.shape, desc.dtype, buffer=segment.buf,
+                          offset=desc.offset, strides=desc.strides)
+
+
+## Worker side
+
+
+def _run_task(task):
+    """ Run a task in a worker process. A task is (kind, name, operands,
+    out, kwargs), where the operands, out and the values in kwargs are
+    descriptions of shared arrays, or scalars (or None for out).
+    """
+    kind, name, operands, out, kwargs = task
+    segments = {}
+    try:
+        args = [_open(x, segments) if isinstance(x, _Shared) else x
+                for x in operands]
+        kwargs = dict([(k, _open(v, segments) if isinstance(v, _Shared)
+                        else v) for k, v in kwargs.items()])
+        if out is not None:
+            kwargs['out'] = _open(out, segments)
+        if kind == 'method':
+            result = getattr(args[0], name)(**kwargs)
+        else:
+            result = getattr(_tnp(), name)(*args, **kwargs)
+        if out is not None:
+            result = None  # Only scalars are sent back
+        del args, kwargs
+        return result
+    finally:
+        for segment in segments.values():
+            try:
+                segment.close()
+            except BufferError:
+                pass
+
+
+## The executor
+
+
+def _row_blocks(n, nblocks):
+    """ Split n rows into at most nblocks (start, stop) blocks of nearly
+    equal size.
+    """
+    nblocks = max(min(nblocks, n), 1)
+    size, extra = divmod(n, nblocks)
+    blocks, start = [], 0
+    for i in range(nblocks):
+        stop = start + size + (i < extra)
+        blocks.append((start, stop))
+        start = stop
+    return blocks
+
+
+class Executor(object):
+    """ Executor(processes=None)
+
+    A pool of processes (by default one per CPU) that runs elementwise
+    operations, reductions and matrix products on blocks of rows of
+    arrays in shared memory. Arrays that are not in shared memory are
+    copied there for the duration of a call. Results are new shared
+    arrays (see shared_empty), or scalars. Use as a context manager, or
+    call close() when done.
+    """
+
+    def __init__(self, processes=None):
+        _check_available()
+        if resource_tracker is not None:
+            # Start it here, so that the workers share it, instead of
+            # each starting one that unlinks our segments when it exits
+            resource_tracker.ensure_running()
+        self._processes = processes or multiprocessing.cpu_count()
+        self._pool = multiprocessing.Pool(self._processes)
+
+    @property
+    def processes(self):
+        return self._processes
+
+    def close(self):
+        """ Stop the worker processes.
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _operands(self, operands, temporaries):
+        """ Turn the operands into shared arrays or scalars, copying
+        arrays into shared memory where needed.
+        """
+        tnp = _tnp()
+        result = []
+        for x in operands:
+            if not isinstance(x, (int, float)):
+                x = tnp.array(x, copy=False)
+                if not is_shared(x):
+                    x = shared_array(x)
+                    temporaries.append(x)
+            result.append(x)
+        return result
+
+    def _run(self, tasks, temporaries=()):
+        try:
+            return self._pool.map(_run_task, tasks)
+        finally:
+            for x in temporaries:
+                release(x)
+
+    def elementwise(self, ufunc, *operands, **kwargs):
+        """ elementwise(ufunc, *operands, out=None, where=True, dtype=None)
+
+        Apply a ufunc (e.g. tnp.add, or its name) to the broadcast
+        operands, in blocks of rows of the result. If out is given, it
+        must be in shared memory.
+        """
+        tnp = _tnp()
+        name = ufunc if isinstance(ufunc, str) else ufunc.__name__
+        func = getattr(tnp, name, None)
+        if func is None or not isinstance(ufunc, str) and func is not ufunc:
+            raise ValueError('%r is not a tinynumpy ufunc' % (ufunc, ))
+        out = kwargs.pop('out', None)
+        where = kwargs.pop('where', True)
+        for key in kwargs:
+            if key != 'dtype':
+                raise TypeError('elementwise() got an unexpected keyword '
+                                'argument %r' % key)
+        temporaries = []
+        operands = self._operands(operands, temporaries)
+        if where is not True:
+            # The mask is split into blocks of rows like the operands
+            where, = self._operands([where], temporaries)
+        if out is None:
+            # The dtype of the result, from a sample of at most one element
+            sample = [x if not isinstance(x, tnp.ndarray) else
+                      x[(slice(0, 1), ) * x.ndim] if x.ndim else
+                      x.reshape((1, )) for x in operands]
+            shape = tnp._broadcast_shapes(*[tnp._shape_of(x) for x in
+                                            operands + [where]])
+            dtype = tnp.array(func(*sample, **kwargs), copy=False).dtype
+            out = shared_empty(shape, dtype)
+        elif not is_shared(out):
+            raise ValueError('out must be an array in shared memory')
+        n = out.shape[0] if out.ndim else 1
+
+        def part(x, rows):
+            if not isinstance(x, tnp.ndarray):
+                return x
+            elif rows and x.ndim == out.ndim and x.shape[0] == n:
+                return _describe(x, rows)
+            return _describe(x)  # Broadcast along the rows
+
+        tasks = []
+        for rows in _row_blocks(n, self._processes) if out.ndim else [None]:
+            args = [part(x, rows) for x in operands]
+            if where is not True:
+                kwargs['where'] = part(where, rows)
+            tasks.append(('function', name, args, _describe(out, rows),
+                          dict(kwargs)))
+        self._run(tasks, temporaries)
+        return out
+
+    def _reduce(self, name, a, axis, dtype):
+        tnp = _tnp()
+        temporaries = []
+        a, = self._operands([a], temporaries)
+        blocks = _row_blocks(a.shape[0] if a.ndim else 1, self._processes)
+        kwargs = {} if dtype is None else dict(dtype=dtype)
+        if axis is not None:
+            axis, = tnp._normalize_axis(axis, a.ndim)
+        if axis is None or not a.ndim:
+            # Each worker sends back the reduction of its rows
+            tasks = [('method', name, [_describe(a, rows if a.ndim
+                                                 else None)], None, kwargs)
+                     for rows in blocks]
+            return self._run(tasks, temporaries)
+        rshape = a.shape[:axis] + a.shape[axis + 1:]
+        if axis:
+            # The rows are kept, each worker writes its part
+            out = shared_empty(rshape, dtype or getattr(a[:0], name)(
+                axis=axis).dtype)
+            tasks = [('method', name, [_describe(a, rows)],
+                      _describe(out, rows), dict(kwargs, axis=axis))
+                     for rows in blocks]
+            self._run(tasks, temporaries)
+            return out
+        # Reducing the rows: each worker writes a partial result, which
+        # are then combined here
+        partials = shared_empty((len(blocks), ) + rshape,
+                                dtype or getattr(a[:1], name)(axis=0).dtype)
+        tasks = [('method', name, [_describe(a, rows)],
+                  _describe(partials, (i, i + 1)),
+                  dict(kwargs, axis=0, keepdims=True))
+                 for i, rows in enumerate(blocks)]
+        try:
+            self._run(tasks, temporaries)
+            result = getattr(partials, name)(axis=0)
+        finally:
+            release(partials)
+        return shared_array(result) if rshape else result
+
+    def sum(self, a, axis=None, dtype=None):
+        """ Sum of the array elements over the given axis, see
+        ndarray.sum.
+        """
+        result = self._reduce('sum', a, axis, dtype)
+        return sum(result) if axis is None else result
+
+    def prod(self, a, axis=None, dtype=None):
+        result = self._reduce('prod', a, axis, dtype)
+        return _fold(operator.mul, result, 1) if axis is None else result
+
+    def min(self, a, axis=None):
+        result = self._reduce('min', a, axis, None)
+        return _fold(_tnp()._minimum, result) if axis is None else result
+
+    def max(self, a, axis=None):
+        result = self._reduce('max', a, axis, None)
+        return _fold(_tnp()._maximum, result) if axis is None else result
+
+    def mean(self, a, axis=None, dtype=None):
+        """ Mean of the array elements over the given axis, see
+        ndarray.mean.
+        """
+        tnp = _tnp()
+        a = tnp.array(a, copy=False)
+        dtype = tnp._convert_dtype(dtype) or tnp._mean_dtype(a.dtype)
+        total = self.sum(a, axis, dtype)
+        if axis is None:
+            return total / a.size if a.size else tnp.nan
+        count = a.shape[tnp._normalize_axis(axis, a.ndim)[0]]
+        if not isinstance(total, tnp.ndarray):
+            return total / count
+        return tnp.divide(total, count, out=total)
+
+    def matmul(self, a, b, out=None):
+        """ Matrix product of a and b, in blocks of rows of a (or of the
+        stacks of matrices in a). If out is given, it must be in shared
+        memory.
+        """
+        tnp = _tnp()
+        temporaries = []
+        a, b = self._operands([a, b], temporaries)
+        if out is not None and not is_shared(out):
+            raise ValueError('out must be an array in shared memory')
+        if a.ndim < 2 or b.ndim > a.ndim:
+            try:
+                if out is None:
+                    return shared_array(tnp.matmul(a, b))
+                return tnp.matmul(a, b, out=out)
+            finally:
+                for x in temporaries:
+                    release(x)
+        # Stacks of b are split with those of a, unless broadcast
+        split_b = b.ndim == a.ndim > 2 and b.shape[0] == a.shape[0]
+        if out is None:
+            # The dtype and shape of the result, from a product of the
+            # first stack without rows, in which we then put the rows
+            key = (slice(0, 1), ) * (a.ndim > 2) + \
+                (slice(None), ) * max(a.ndim - 3, 0) + (slice(0, 0), )
+            sample = tnp.matmul(a[key], b[:1] if split_b else b)
+            shape = list(a.shape[:1] + sample.shape[1:])
+            shape[sample.ndim - 1 - (b.ndim > 1)] = a.shape[-2]
+            out = shared_empty(shape, sample.dtype)
+        tasks = [('function', 'matmul',
+                  [_describe(a, rows), _describe(b, rows if split_b
+                                                 else None)],
+                  _describe(out, rows), {})
+                 for rows in _row_blocks(a.shape[0], self._processes)]
+        self._run(tasks, temporaries)
+        return out